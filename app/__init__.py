@@ -4,8 +4,13 @@ from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from flask_migrate import Migrate
 from .errors import register_error_handlers
+from .cache import response_cache
+from .google_books import google_books
+from .passwords import password_hasher
+from .database import configure_sqlite
+from .routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 migrate = Migrate()
@@ -18,18 +23,34 @@ def create_app(config):
     app.register_blueprint(bp)
 
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_sqlite(engine, app.config.get('SQLITE_PRAGMAS'))
     migrate = Migrate(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'
+    response_cache.init_app(app)
+    google_books.init_app(app)
+    password_hasher.init_app(app)
 
-    from .models import User
+    from .search import book_search
+    book_search.init_app(app)
+
+    from .profiling import sql_profiler
+    sql_profiler.init_app(app)
+
+    from .identity import identity_cache
+    identity_cache.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.load(int(user_id))
 
     register_error_handlers(app)
 
+    from .commands import register_commands
+    register_commands(app)
+
     csrf.init_app(app)
 
     return app
\ No newline at end of file
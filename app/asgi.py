@@ -0,0 +1,274 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from flask import Response
+from itsdangerous import BadSignature
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_cookie, parse_etags
+from .cache import cache_name, response_cache
+from .community import decode_cursor, feed_select, split_page
+from .database import configure_sqlite
+from .google_books import RateLimited, UpstreamError
+from .identity import identity_cache
+from .library import library_select
+from .profiling import sql_profiler
+from .routes import FEED_PER_PAGE, catalogue_response
+from .statistics import (
+    group_stats, stats_select, stats_version, stats_range, range_dimension, SUMMARY_DIMENSIONS,
+    summary_view, series_view, genre_view, status_view, author_view
+)
+from .utils import (
+    USER_BOOK_COLUMNS, serialize_user_book, feed_page_view, all_stats_view, all_stats_dimensions,
+    search_catalogue, get_catalogue_volume, check_catalogue_rate
+)
+
+# --------- ASGI Serving Mode ---------
+# AsyncAPI is an ASGI application wrapped around the Flask app. GET requests
+# for the JSON read endpoints below are answered on the event loop with an
+# async SQLAlchemy engine, using the same statements, views and per-user
+# response cache as the Flask views. Everything else (templates, forms,
+# writes, offset-paged feeds, rollups that need rebuilding, requests without a
+# session cookie) falls back to the Flask app on a worker thread pool.
+#
+#   uvicorn asgi:app
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg', 'mysql': 'mysql+aiomysql'}
+ASYNC_VIEWS = {}
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def async_view(*endpoints, login=True, cached=False):
+    # A view returns a Response, or None to hand the request to Flask.
+    def register(view):
+        for endpoint in endpoints:
+            ASYNC_VIEWS[endpoint] = (view, login, cached)
+        return view
+    return register
+
+class AsyncRequest:
+    def __init__(self, endpoint, view_args, args, headers, user_id, remote_addr=None):
+        self.endpoint = endpoint
+        self.view_args = view_args
+        self.args = args
+        self.headers = headers
+        self.user_id = user_id
+        self.remote_addr = remote_addr
+
+class AsyncAPI:
+    def __init__(self, flask_app):
+        config = flask_app.config
+        self.flask_app = flask_app
+        self.fallback = WSGIMiddleware(flask_app, workers=config.get('ASYNC_FALLBACK_WORKERS', 10))
+        self.upstream = ThreadPoolExecutor(config.get('ASYNC_UPSTREAM_WORKERS', 32), thread_name_prefix='upstream')
+        self.engine = create_async_engine(
+            config.get('ASYNC_DATABASE_URL') or async_database_url(config['SQLALCHEMY_DATABASE_URI']),
+            **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        )
+        configure_sqlite(self.engine.sync_engine, config.get('SQLITE_PRAGMAS'))
+        sql_profiler.instrument(self.engine.sync_engine, flask_app, flask_app.extensions['sql_profiler'])
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        response = None
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            response = await self.dispatch(scope)
+        if response is None:
+            return await self.fallback(scope, receive, send)
+        await self.send_response(scope, response, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        await self.engine.dispose()
+        self.upstream.shutdown(wait=False)
+
+    def match(self, scope):
+        adapter = self.flask_app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+        try:
+            return adapter.match(scope['path'], 'GET')
+        except HTTPException:
+            return None, None
+
+    def session_user(self, headers):
+        cookie = parse_cookie(headers.get('Cookie', '')).get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if not cookie or self.serializer is None:
+            return None
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            session = self.serializer.loads(cookie, max_age=max_age)
+        except BadSignature:
+            return None
+        user_id = str(session.get('_user_id', ''))
+        if not user_id.isdigit():
+            return None
+        # Resolved through the identity cache like Flask-Login's user loader,
+        # so a signed cookie for a deleted account is not honoured.
+        principal = identity_cache.load(int(user_id))
+        return principal.id if principal is not None else None
+
+    async def dispatch(self, scope):
+        endpoint, view_args = self.match(scope)
+        if endpoint not in ASYNC_VIEWS:
+            return None
+        view, login, cached = ASYNC_VIEWS[endpoint]
+        headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+        with self.flask_app.app_context():
+            user_id = self.session_user(headers)
+            if login and user_id is None:
+                return None  # Flask redirects to the login page or honours a remember-me cookie
+            args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+            client = scope.get('client')
+            request = AsyncRequest(endpoint, view_args, args, headers, user_id, client[0] if client else None)
+            if not cached:
+                return await view(self, request)
+            key, response = response_cache.lookup(user_id, cache_name(endpoint, args))
+            if response is None:
+                response = await view(self, request)
+                if response is not None:
+                    response_cache.remember(key, response)
+            return response
+
+    async def send_response(self, scope, response, send):
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+        await send({'type': 'http.response.body', 'body': body})
+
+    def json(self, data, status=200):
+        response = self.flask_app.json.response(data)
+        response.status_code = status
+        return response
+
+    def rate_limited(self, request):
+        # Returns the 429 response when the client is over its catalogue rate.
+        try:
+            check_catalogue_rate(request.user_id, request.remote_addr)
+        except RateLimited as error:
+            response = self.json({'error': 'Too many requests'}, 429)
+            response.headers['Retry-After'] = str(error.retry_after)
+            return response
+        return None
+
+    async def call_upstream(self, func, *args):
+        # The catalogue proxy and its client are synchronous; running them on
+        # their own pool keeps slow upstream calls off the event loop and out
+        # of the fallback pool that serves the Flask views.
+        def call():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.upstream, call)
+
+    async def read_stats(self, user_id, dimensions):
+        async with self.sessions() as session:
+            return group_stats((await session.scalars(stats_select(user_id, dimensions))).all())
+
+# --------- Async Views ---------
+
+@async_view('main.my_books', cached=True)
+async def my_books(api, request):
+    async with api.sessions() as session:
+        rows = (await session.execute(library_select(request.user_id, *USER_BOOK_COLUMNS))).all()
+    return api.json([serialize_user_book(row) for row in rows])
+
+@async_view('main.community_feed', cached=True)
+async def community_feed(api, request):
+    if 'page' in request.args:
+        return None
+    cursor = request.args.get('cursor')
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return api.json({'error': 'Invalid cursor'}, 400)
+    async with api.sessions() as session:
+        items = (await session.scalars(feed_select(request.user_id, after, FEED_PER_PAGE))).all()
+    return api.json(feed_page_view(*split_page(items, FEED_PER_PAGE)))
+
+STATS_PANELS = {
+    'main.stats_summary': (lambda range_type: SUMMARY_DIMENSIONS, lambda stats, range_type: summary_view(stats)),
+    'main.stats_books_over_time': (
+        lambda range_type: (range_dimension(range_type),),
+        lambda stats, range_type: series_view(stats, range_type, 'books')
+    ),
+    'main.stats_pages_over_time': (
+        lambda range_type: (range_dimension(range_type),),
+        lambda stats, range_type: series_view(stats, range_type, 'pages')
+    ),
+    'main.stats_genres': (lambda range_type: ('genre',), lambda stats, range_type: genre_view(stats)),
+    'main.stats_statuses': (lambda range_type: ('status',), lambda stats, range_type: status_view(stats)),
+    'main.stats_authors': (lambda range_type: ('author',), lambda stats, range_type: author_view(stats)),
+}
+
+@async_view(*STATS_PANELS, cached=True)
+async def stats_panel(api, request):
+    dimensions, view = STATS_PANELS[request.endpoint]
+    range_type = request.args.get('range', 'months')
+    stats = await api.read_stats(request.user_id, dimensions(range_type))
+    if stats is None:
+        return None  # the Flask view rebuilds a missing rollup
+    return api.json(view(stats, range_type))
+
+@async_view('main.stats_all')
+async def stats_all(api, request):
+    range_type = stats_range(request.args.get('range'))
+    stats = await api.read_stats(request.user_id, all_stats_dimensions(range_type))
+    if stats is None:
+        return None
+    etag = f"stats-{request.user_id}-{stats_version(stats)}-{range_type}"
+    if parse_etags(request.headers.get('If-None-Match')).contains(etag):
+        response = Response('', 304)
+    else:
+        response = api.json(all_stats_view(stats, range_type))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@async_view('main.api_books_search', login=False)
+async def api_books_search(api, request):
+    query = request.args.get('q', '').strip()
+    if not query:
+        return api.json({'error': 'Missing query'}, 400)
+    limited = api.rate_limited(request)
+    if limited is not None:
+        return limited
+    try:
+        result = await api.call_upstream(
+            search_catalogue,
+            query,
+            request.args.get('maxResults', 20, type=int),
+            request.args.get('orderBy', 'relevance'),
+            request.args.get('startIndex', 0, type=int)
+        )
+    except UpstreamError:
+        return api.json({'error': 'Book search is unavailable'}, 502)
+    return catalogue_response(result)
+
+@async_view('main.api_book_volume', login=False)
+async def api_book_volume(api, request):
+    limited = api.rate_limited(request)
+    if limited is not None:
+        return limited
+    try:
+        result = await api.call_upstream(get_catalogue_volume, request.view_args['google_id'])
+    except UpstreamError:
+        return api.json({'error': 'Book details are unavailable'}, 502)
+    if result is None:
+        return api.json({'error': 'Book not found'}, 404)
+    return catalogue_response(result)
@@ -0,0 +1,176 @@
+import math
+import time
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, Response
+from flask_login import current_user
+
+# --------- Cache Backends ---------
+# Backends store bytes under string keys. The in-process LRU is the default;
+# anything with a redis-py style get/set(ex=)/delete works as a shared backend.
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+class LRUCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class RedisCache:
+    def __init__(self, client, ttl=300, prefix='booktracker:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, value, ex=math.ceil(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+# --------- Per-user Response Cache ---------
+# Entries are keyed by user, that user's current generation token and the
+# request. Writes in utils.py call bump() so a user's old entries are never
+# read again and simply age out. Generations are random tokens rather than
+# counters so an evicted generation can never collide with an older one.
+#
+# bump() also marks each user as written for READ_YOUR_WRITES_SECONDS, and
+# routing.py keeps that user's reads on the primary meanwhile. Otherwise the
+# recipient of a share could miss, read the lagging replica and cache the
+# stale answer under the fresh generation. Marks live in the shared store;
+# with caching off they are kept in process.
+
+class ResponseCache:
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+        if backend == 'redis':
+            import redis
+            store = RedisCache(redis.Redis.from_url(app.config['RESPONSE_CACHE_URL']), ttl)
+        elif backend == 'memory':
+            store = LRUCache(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 10000), ttl)
+        else:
+            store = NullCache()
+        app.extensions['response_cache'] = {
+            'store': store,
+            'marks': LRUCache(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 10000)) if isinstance(store, NullCache) else store,
+            'metrics': {'hits': 0, 'misses': 0, 'invalidations': 0},
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def state(self):
+        return current_app.extensions['response_cache']
+
+    @property
+    def store(self):
+        return self.state['store']
+
+    def use(self, store):
+        self.state['store'] = store
+
+    def count(self, metric):
+        with self.state['lock']:
+            self.state['metrics'][metric] += 1
+
+    def generation(self, user_id):
+        key = f"gen:{user_id}"
+        token = self.store.get(key)
+        if token is None:
+            token = uuid.uuid4().hex.encode()
+            self.store.set(key, token, ttl=0)
+        return token.decode() if isinstance(token, bytes) else token
+
+    def bump(self, *user_ids):
+        seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+        for user_id in set(user_ids):
+            self.store.set(f"gen:{user_id}", uuid.uuid4().hex.encode(), ttl=0)
+            if seconds:
+                self.state['marks'].set(f"wrote:{user_id}", b'1', ttl=seconds)
+            self.count('invalidations')
+
+    def recently_written(self, user_id):
+        return self.state['marks'].get(f"wrote:{user_id}") is not None
+
+    def lookup(self, user_id, name):
+        # Returns (key, cached response or None); hand the key to remember()
+        # once the response has been computed.
+        key = f"resp:{user_id}:{self.generation(user_id)}:{name}"
+        cached = self.store.get(key)
+        if cached is None:
+            self.count('misses')
+            return key, None
+        self.count('hits')
+        mimetype, _, body = cached.partition(b'\n')
+        return key, Response(body, mimetype=mimetype.decode())
+
+    def remember(self, key, response):
+        if response.status_code == 200:
+            self.store.set(key, response.mimetype.encode() + b'\n' + response.get_data())
+
+    def fetch(self, user_id, name, compute):
+        key, response = self.lookup(user_id, name)
+        if response is None:
+            response = compute()
+            self.remember(key, response)
+        return response
+
+    def metrics(self):
+        with self.state['lock']:
+            metrics = dict(self.state['metrics'])
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_ratio'] = round(metrics['hits'] / lookups, 4) if lookups else 0.0
+        return metrics
+
+response_cache = ResponseCache()
+
+def cache_name(endpoint, args):
+    return endpoint + '?' + '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+
+def cached_per_user(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        name = cache_name(request.endpoint, request.args)
+        return response_cache.fetch(current_user.id, name, lambda: current_app.make_response(view(*args, **kwargs)))
+    return wrapper
@@ -0,0 +1,142 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from .models import User
+from .statistics import rebuild_user_stats, check_user_stats
+from .community import backfill_activity_feed, prune_activity_feed
+from .google_books import google_books
+from .search import book_search
+from .importer import IMPORT_FORMATS, UNREADABLE, import_library, read_import
+from .export import EXPORT_FORMATS, export_shard, shard_ranges
+from . import db
+
+stats_cli = AppGroup('stats', help='Maintain the per-user statistics rollups.')
+feed_cli = AppGroup('feed', help='Maintain the activity feed inboxes.')
+books_cli = AppGroup('books', help='Maintain the Google Books response cache.')
+search_cli = AppGroup('search', help='Maintain the local book search index.')
+
+def selected_user_ids(user_id):
+    if user_id is not None:
+        return [user_id]
+    return [uid for uid, in db.session.query(User.id).order_by(User.id)]
+
+@stats_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_stats(user_id):
+    user_ids = selected_user_ids(user_id)
+    for uid in user_ids:
+        rebuild_user_stats(uid)
+        db.session.commit()
+    click.echo(f"Rebuilt statistics for {len(user_ids)} user(s).")
+
+@stats_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Only check this user.')
+def check_stats(user_id):
+    mismatched = 0
+    for uid in selected_user_ids(user_id):
+        for dimension, bucket, stored, live in check_user_stats(uid):
+            mismatched += 1
+            click.echo(f"user {uid} {dimension}[{bucket!r}]: stored={stored} live={live}")
+    if mismatched:
+        raise click.ClickException(f"{mismatched} rollup row(s) differ from the library.")
+    click.echo("Statistics rollups are consistent.")
+
+@feed_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--before', type=click.DateTime(), default=None, help='Only copy shares made before this; required once any feed has items.')
+def backfill_feed(batch_size, before):
+    try:
+        created = backfill_activity_feed(batch_size, before)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f"Created {created} feed item(s).")
+
+@feed_cli.command('prune')
+@click.option('--days', type=int, default=None, help='Drop items older than this (default FEED_RETENTION_DAYS).')
+@click.option('--keep', type=int, default=None, help='Keep at most this many items per user (default FEED_MAX_ITEMS_PER_USER).')
+def prune_feed(days, keep):
+    days = current_app.config.get('FEED_RETENTION_DAYS') if days is None else days
+    keep = current_app.config.get('FEED_MAX_ITEMS_PER_USER') if keep is None else keep
+    deleted = prune_activity_feed(days, keep)
+    click.echo(f"Pruned {deleted} feed item(s).")
+
+@books_cli.command('purge-cache')
+def purge_books_cache():
+    proxy = google_books.proxy
+    deleted = proxy.store.purge(proxy.clock() - proxy.stale_ttl)
+    click.echo(f"Purged {deleted} cached response(s).")
+
+@search_cli.command('rebuild')
+def rebuild_search():
+    indexed = book_search.rebuild()
+    db.session.commit()
+    click.echo(f"Indexed {indexed} book(s) with the {book_search.index.name} backend.")
+
+@click.command('import-library')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username whose library receives the books.')
+@click.option('--format', 'import_format', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Detected from the file name and header when omitted.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@with_appcontext
+def import_library_command(path, username, import_format, batch_size):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username!r}.")
+    started = time.perf_counter()
+
+    def progress(report):
+        click.echo(f"  {report['rows']} rows read, {report['added']} added, "
+                   f"{report['updated']} updated, {report['skipped']} skipped", err=True)
+
+    with open(path, 'rb') as stream:
+        try:
+            report = import_library(user.id, read_import(stream, path, import_format), batch_size, progress)
+        except UNREADABLE as error:
+            raise click.ClickException(f"Could not read {path}, it must be UTF-8 CSV or JSON Lines: {error}")
+    for error in report['errors']:
+        click.echo(error, err=True)
+    click.echo(f"Imported {report['rows']} row(s) in {time.perf_counter() - started:.1f}s: "
+               f"{report['books_created']} new book(s), {report['added']} added, "
+               f"{report['updated']} updated, {report['skipped']} skipped.")
+
+@click.command('export-libraries')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--shards', type=click.IntRange(min=1), default=4, show_default=True, help='Number of output files; users are split by id range.')
+@click.option('--workers', type=click.IntRange(min=1), default=None, help='Shards exported at once (default: one per shard).')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='jsonl', show_default=True)
+@with_appcontext
+def export_libraries_command(directory, shards, workers, export_format):
+    os.makedirs(directory, exist_ok=True)
+    app = current_app._get_current_object()
+    extension = EXPORT_FORMATS[export_format][1]
+    started = time.perf_counter()
+
+    ranges = shard_ranges(shards)
+    db.session.remove()
+
+    def run(shard):
+        path = os.path.join(directory, f"library-{shard:03d}-of-{shards:03d}.{extension}")
+        with app.app_context():
+            try:
+                return path, export_shard(ranges[shard], path, export_format)
+            finally:
+                db.session.remove()
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=workers or shards) as pool:
+        for path, exported in pool.map(run, range(shards)):
+            click.echo(f"  {path}: {exported} row(s)", err=True)
+            total += exported
+    click.echo(f"Exported {total} row(s) in {shards} shard(s) in {time.perf_counter() - started:.1f}s.")
+
+def register_commands(app):
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(feed_cli)
+    app.cli.add_command(books_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(import_library_command)
+    app.cli.add_command(export_libraries_command)
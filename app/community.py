@@ -0,0 +1,125 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, or_, select, tuple_
+from .models import ActivityFeedItem, BookShare
+from . import db
+
+# --------- Community Feed Query Layer ---------
+# Every share is fanned out on write into an ActivityFeedItem for the sender
+# and the recipient, carrying the title, cover and usernames with it. Reading
+# a feed is then one range scan on (user_id, timestamp), paged by keyset on
+# (timestamp, id) newest first.
+
+NEWEST_FIRST = (ActivityFeedItem.timestamp.desc(), ActivityFeedItem.id.desc())
+
+def encode_cursor(after):
+    # The cursor carries the last item's (timestamp, id) itself, so a page
+    # still continues after that item has been pruned.
+    timestamp, item_id = after
+    return urlsafe_b64encode(f"item:{item_id}:{timestamp.isoformat()}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        prefix, item_id, timestamp = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':', 2)
+        if prefix != 'item':
+            raise ValueError(cursor)
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid feed cursor: {cursor!r}")
+
+def fan_out_share(share, book, from_username, to_username):
+    db.session.add_all([
+        ActivityFeedItem(
+            user_id=user_id,
+            share=share,
+            google_id=book.google_id,
+            title=book.title,
+            cover_url=book.cover_url,
+            status=share.status,
+            from_username=from_username,
+            to_username=to_username,
+            timestamp=share.timestamp
+        )
+        for user_id in (share.from_user_id, share.to_user_id)
+    ])
+
+def older_than(after):
+    # Binds the datetime read back from the column, which serialises the
+    # same way the stored value did.
+    return tuple_(ActivityFeedItem.timestamp, ActivityFeedItem.id) < tuple_(*after)
+
+def feed_select(user_id, after=None, limit=10):
+    # Fetches one row past the page so split_page() can tell if more follow.
+    statement = select(ActivityFeedItem).where(ActivityFeedItem.user_id == user_id)
+    if after is not None:
+        statement = statement.where(older_than(after))
+    return statement.order_by(*NEWEST_FIRST).limit(limit + 1)
+
+def split_page(items, limit):
+    last = items[limit - 1] if len(items) > limit else None
+    next_after = (last.timestamp, last.id) if last is not None else None
+    return items[:limit], next_after
+
+def feed_page(user_id, after=None, limit=10):
+    return split_page(db.session.scalars(feed_select(user_id, after, limit)).all(), limit)
+
+def feed_offset_page(user_id, page=1, per_page=10):
+    return (
+        ActivityFeedItem.query
+        .filter(ActivityFeedItem.user_id == user_id)
+        .order_by(*NEWEST_FIRST)
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
+
+# --------- Feed Maintenance ---------
+
+def backfill_activity_feed(batch_size=1000, before=None):
+    # Copies shares made before the inbox existed, i.e. before `before`.
+    # Items pruned since leave their shares looking the same as those, so
+    # once any feed has items the cutoff must be given explicitly. Safe to
+    # re-run: shares that already have items are skipped.
+    if before is None and db.session.scalar(select(ActivityFeedItem.id).limit(1)) is not None:
+        raise ValueError("Feeds already have items; pass the time the inbox went live as the cutoff.")
+    created, last_id = 0, 0
+    while True:
+        query = BookShare.query.filter(BookShare.id > last_id)
+        if before is not None:
+            query = query.filter(or_(BookShare.timestamp.is_(None), BookShare.timestamp < before))
+        shares = (
+            query
+            .filter(~BookShare.feed_items.any())
+            .order_by(BookShare.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not shares:
+            return created
+        for share in shares:
+            if share.timestamp is None:
+                share.timestamp = datetime.now(timezone.utc)
+            fan_out_share(share, share.book, share.from_user.username, share.to_user.username)
+            created += 2
+        last_id = shares[-1].id
+        db.session.commit()
+
+def prune_activity_feed(max_age_days=None, keep_per_user=None):
+    deleted = 0
+    if max_age_days is not None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        deleted += ActivityFeedItem.query.filter(
+            ActivityFeedItem.timestamp < cutoff
+        ).delete(synchronize_session=False)
+    if keep_per_user is not None:
+        ranked = select(
+            ActivityFeedItem.id,
+            func.row_number().over(
+                partition_by=ActivityFeedItem.user_id,
+                order_by=NEWEST_FIRST
+            ).label('position')
+        ).subquery()
+        excess = select(ranked.c.id).where(ranked.c.position > keep_per_user)
+        deleted += ActivityFeedItem.query.filter(
+            ActivityFeedItem.id.in_(excess)
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
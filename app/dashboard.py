@@ -0,0 +1,43 @@
+from sqlalchemy import exists, select
+from .community import feed_page
+from .library import library_select
+from .models import ActivityFeedItem, Book, UserBook
+from . import db
+
+# --------- Dashboard Summary ---------
+# The dashboard only needs to know whether the user has any feed activity and
+# any book in progress. Both are EXISTS probes answered from the first entry
+# of (user_id, timestamp) and (user_id, status, ...) in a single statement.
+# When the dashboard renders items inline, the LIMITed first pages answer the
+# same questions, so no separate probe is run.
+
+READING_COLUMNS = (UserBook.id, Book.google_id, Book.title, Book.author, Book.cover_url)
+
+def feed_exists(user_id):
+    return exists().where(ActivityFeedItem.user_id == user_id)
+
+def reading_exists(user_id):
+    return exists().where(UserBook.user_id == user_id, UserBook.status == 'currently_reading')
+
+def dashboard_flags(user_id):
+    return db.session.execute(select(feed_exists(user_id), reading_exists(user_id))).one()
+
+def currently_reading_page(user_id, limit):
+    # One row past the page tells whether the library holds more.
+    rows = db.session.execute(
+        library_select(user_id, *READING_COLUMNS)
+        .where(UserBook.status == 'currently_reading')
+        .order_by(UserBook.date_added.desc(), UserBook.id.desc())
+        .limit(limit + 1)
+    ).all()
+    return rows[:limit], len(rows) > limit
+
+def dashboard_summary(user_id, inline_items=0):
+    # Returns (has_feed, has_currently_reading, feed page, reading page),
+    # where the pages are ([], None) and ([], False) without inline items.
+    if not inline_items:
+        has_feed, has_reading = dashboard_flags(user_id)
+        return has_feed, has_reading, ([], None), ([], False)
+    feed = feed_page(user_id, limit=inline_items)
+    reading = currently_reading_page(user_id, inline_items)
+    return bool(feed[0]), bool(reading[0]), feed, reading
@@ -0,0 +1,22 @@
+from sqlalchemy import event
+
+# --------- SQLite Connection Profile ---------
+# SQLITE_PRAGMAS are issued on every new pooled connection: apart from
+# journal_mode, which is stored in the database file, SQLite settings last
+# only as long as the connection that set them.
+
+def configure_sqlite(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+def sqlite_settings(connection, names):
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
@@ -1,4 +1,5 @@
-from flask import render_template
+from flask import jsonify, render_template, request
+from flask_wtf.csrf import CSRFError
 
 def register_error_handlers(app):
     @app.errorhandler(404)
@@ -7,4 +8,12 @@ def register_error_handlers(app):
 
     @app.errorhandler(500)
     def internal_error(error):
-        return render_template('500.html'), 500
\ No newline at end of file
+        return render_template('500.html'), 500
+
+    @app.errorhandler(CSRFError)
+    def csrf_error(error):
+        # Script requests get JSON that csrf.js recognises, refreshes its
+        # token and retries; form posts keep the plain 400 page.
+        if request.is_json or not request.form:
+            return jsonify({'error': error.description, 'csrf': True}), 400
+        return error
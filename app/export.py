@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from sqlalchemy import func, select
+from .models import Book, User, UserBook
+from . import db
+
+# --------- Library Export ---------
+# Exports are generators end to end: rows come off a yield_per cursor, are
+# rendered one at a time and leave in ~64KB chunks, so memory does not grow
+# with the library. The columns match what app/importer.py reads back.
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'json': ('application/json', 'json'),
+}
+EXPORT_COLUMNS = (
+    'google_id', 'title', 'author', 'genre', 'description', 'cover_url',
+    'page_count', 'status', 'date_added', 'date_completed'
+)
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+def export_statement(*filters, with_username=False):
+    columns = [
+        Book.google_id, Book.title, Book.author, Book.genre, Book.description, Book.cover_url,
+        Book.page_count, UserBook.status, UserBook.date_added, UserBook.date_completed
+    ]
+    statement = select(*columns).select_from(UserBook).join(Book, UserBook.book_id == Book.id)
+    if with_username:
+        statement = statement.add_columns(User.username).join(User, UserBook.user_id == User.id)
+    return (
+        statement.where(*filters)
+        .order_by(UserBook.user_id, UserBook.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+
+def export_records(statement):
+    for row in db.session.execute(statement):
+        record = row._asdict()
+        for key in ('date_added', 'date_completed'):
+            record[key] = record[key].isoformat() if record[key] else None
+        yield record
+
+def render_csv(records, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def render_jsonl(records):
+    return chunked(json.dumps(record) + '\n' for record in records)
+
+def render_json(records):
+    def pieces():
+        yield '['
+        for i, record in enumerate(records):
+            yield (',\n' if i else '\n') + json.dumps(record)
+        yield '\n]\n'
+    return chunked(pieces())
+
+def chunked(pieces):
+    parts, size = [], 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield ''.join(parts)
+
+def render(records, export_format, columns=EXPORT_COLUMNS):
+    if export_format == 'csv':
+        return render_csv(records, columns)
+    if export_format == 'jsonl':
+        return render_jsonl(records)
+    return render_json(records)
+
+def library_export(user_id, export_format):
+    return render(export_records(export_statement(UserBook.user_id == user_id)), export_format)
+
+# --------- Sharded Export ---------
+# The admin export splits users into contiguous user_id ranges so each worker
+# streams a disjoint slice with one range scan on the (user_id, book_id)
+# index and writes its own file. The boundaries are the user_ids found every
+# 1/shards of the way through the rows, so shards hold similar row counts;
+# a user's rows never span two shards.
+
+def shard_ranges(shards):
+    # Returns shards (lower, upper) pairs, None meaning unbounded. With no
+    # rows every inner boundary is 0, which puts everything in the last shard.
+    total = db.session.scalar(select(func.count()).select_from(UserBook))
+    bounds = [
+        db.session.scalar(select(UserBook.user_id).order_by(UserBook.user_id).offset(k * total // shards).limit(1)) or 0
+        for k in range(1, shards)
+    ]
+    bounds = [None] + bounds + [None]
+    return list(zip(bounds, bounds[1:]))
+
+def export_shard(user_range, path, export_format):
+    lower, upper = user_range
+    filters = []
+    if lower is not None:
+        filters.append(UserBook.user_id >= lower)
+    if upper is not None:
+        filters.append(UserBook.user_id < upper)
+    statement = export_statement(*filters, with_username=True)
+    exported = 0
+
+    def counted(records):
+        nonlocal exported
+        for record in records:
+            exported += 1
+            yield record
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in render(counted(export_records(statement)), export_format, EXPORT_COLUMNS + ('username',)):
+            f.write(chunk)
+    return exported
@@ -0,0 +1,259 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+from flask import current_app
+
+# --------- HTTP Clients ---------
+# A client turns a URL into (status, body bytes) and raises OSError when the
+# upstream cannot be reached. Tests swap in a fake with google_books.use_client().
+
+class UrllibClient:
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+
+    def get(self, url):
+        request = Request(url, headers={'Accept': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as error:
+            return error.code, error.read()
+
+# --------- Disk Cache ---------
+# Responses are kept in a small SQLite file of their own so proxy traffic never
+# contends with writes to the application database. Rows outlive their TTL so
+# they can still be served stale while a refresh runs. Past max_entries rows
+# the least recently fetched are evicted, so distinct queries cannot grow the
+# file without bound.
+
+CacheEntry = namedtuple('CacheEntry', 'status body expires_at')
+
+class SQLiteStore:
+    def __init__(self, path, max_entries=10000):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache ("
+                "key TEXT PRIMARY KEY, status INTEGER NOT NULL, body BLOB NOT NULL, "
+                "fetched_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_api_cache_fetched_at ON api_cache (fetched_at)")
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, body, expires_at FROM api_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return CacheEntry(*row) if row else None
+
+    def set(self, key, status, body, fetched_at, expires_at):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO api_cache (key, status, body, fetched_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, status, body, fetched_at, expires_at)
+            )
+            excess = self.conn.execute("SELECT count(*) FROM api_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM api_cache WHERE key IN "
+                    "(SELECT key FROM api_cache ORDER BY fetched_at LIMIT ?)", (excess,)
+                )
+
+    def purge(self, before):
+        with self.lock:
+            return self.conn.execute("DELETE FROM api_cache WHERE expires_at < ?", (before,)).rowcount
+
+# --------- Caching Proxy ---------
+# lookup() answers from the store while an entry is fresh, serves it stale for
+# up to stale_ttl seconds past expiry while one background thread refreshes
+# it, and otherwise fetches. Concurrent misses for the same key share one
+# upstream request: the first caller fetches, the rest wait on its Future.
+
+class UpstreamError(Exception):
+    pass
+
+CACHEABLE_STATUSES = (200, 404)
+
+class BookProxy:
+    def __init__(self, client, store, base_url, api_key=None,
+                 search_ttl=3600, volume_ttl=86400, not_found_ttl=300,
+                 stale_ttl=86400, wait_timeout=10, clock=time.time):
+        self.client = client
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.search_ttl = search_ttl
+        self.volume_ttl = volume_ttl
+        self.not_found_ttl = not_found_ttl
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.metrics = {'hits': 0, 'stale': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def search(self, query, max_results=20, order_by='relevance', start_index=0):
+        # The API matches case-insensitively, so queries differing only in
+        # case or spacing share one entry.
+        query = ' '.join(query.split()).casefold()
+        params = {'q': query, 'maxResults': max_results, 'orderBy': order_by, 'startIndex': start_index}
+        key = 'search:' + urlencode(sorted(params.items()))
+        return self.lookup(key, '/volumes?' + urlencode(params), self.search_ttl)
+
+    def volume(self, google_id):
+        return self.lookup(f"volume:{google_id}", '/volumes/' + quote(google_id, safe=''), self.volume_ttl)
+
+    def url(self, path):
+        if not self.api_key:
+            return self.base_url + path
+        return self.base_url + path + ('&' if '?' in path else '?') + urlencode({'key': self.api_key})
+
+    def lookup(self, key, path, ttl):
+        entry = self.store.get(key)
+        now = self.clock()
+        if entry is not None and now < entry.expires_at:
+            self.count('hits')
+            return entry.status, entry.body, 'HIT'
+        if entry is not None and now < entry.expires_at + self.stale_ttl:
+            self.count('stale')
+            self.revalidate(key, path, ttl)
+            return entry.status, entry.body, 'STALE'
+        self.count('misses')
+        try:
+            status, body = self.fetch(key, path, ttl)
+        except (UpstreamError, OSError):
+            self.count('errors')
+            if entry is None:
+                raise UpstreamError(key)
+            # Anything is better than an error page when the API is down.
+            return entry.status, entry.body, 'STALE'
+        return status, body, 'MISS'
+
+    def fetch(self, key, path, ttl):
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.metrics['coalesced'] += 1
+        if not leader:
+            return future.result(timeout=self.wait_timeout)
+        try:
+            status, body = self.client.get(self.url(path))
+            if status not in CACHEABLE_STATUSES:
+                raise UpstreamError(f"{key}: upstream returned {status}")
+            fetched_at = self.clock()
+            expires_at = fetched_at + (ttl if status == 200 else self.not_found_ttl)
+            self.store.set(key, status, body, fetched_at, expires_at)
+            future.set_result((status, body))
+            return status, body
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def revalidate(self, key, path, ttl):
+        with self.lock:
+            if key in self.inflight:
+                return
+        threading.Thread(target=self.refresh, args=(key, path, ttl), daemon=True).start()
+
+    def refresh(self, key, path, ttl):
+        try:
+            self.fetch(key, path, ttl)
+        except (UpstreamError, OSError):
+            self.count('errors')
+
+# --------- Rate Limiting ---------
+# The catalogue routes are public, so every client (a user, or an address
+# when signed out) gets a token bucket: `burst` requests at once, refilled at
+# `rate` per second. Only the max_clients most recently seen are remembered.
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class RateLimiter:
+    def __init__(self, rate=1.0, burst=20, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def check(self, client):
+        # Takes a token for client, or raises RateLimited. rate 0 disables it.
+        if not self.rate:
+            return
+        with self.lock:
+            now = self.clock()
+            tokens, seen = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - seen) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[client] = (tokens - 1 if allowed else tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        if not allowed:
+            raise RateLimited(math.ceil((1 - tokens) / self.rate))
+
+# --------- Flask Extension ---------
+
+class GoogleBooks:
+    def init_app(self, app):
+        config = app.config
+        app.extensions['google_books_limiter'] = RateLimiter(
+            config.get('GOOGLE_BOOKS_RATE_LIMIT', 1.0),
+            config.get('GOOGLE_BOOKS_RATE_BURST', 20),
+        )
+        app.extensions['google_books'] = BookProxy(
+            UrllibClient(config.get('GOOGLE_BOOKS_TIMEOUT', 5)),
+            SQLiteStore(config.get('GOOGLE_BOOKS_CACHE_PATH', ':memory:'), config.get('GOOGLE_BOOKS_CACHE_MAX_ENTRIES', 10000)),
+            config.get('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1'),
+            api_key=config.get('GOOGLE_BOOKS_API_KEY'),
+            search_ttl=config.get('GOOGLE_BOOKS_SEARCH_TTL', 3600),
+            volume_ttl=config.get('GOOGLE_BOOKS_VOLUME_TTL', 86400),
+            not_found_ttl=config.get('GOOGLE_BOOKS_NOT_FOUND_TTL', 300),
+            stale_ttl=config.get('GOOGLE_BOOKS_STALE_TTL', 86400),
+            wait_timeout=config.get('GOOGLE_BOOKS_TIMEOUT', 5) * 2,
+        )
+
+    @property
+    def proxy(self):
+        return current_app.extensions['google_books']
+
+    @property
+    def limiter(self):
+        return current_app.extensions['google_books_limiter']
+
+    def use_client(self, client):
+        self.proxy.client = client
+
+    def check_rate(self, client):
+        self.limiter.check(client)
+
+    def search(self, query, max_results=20, order_by='relevance', start_index=0):
+        return self.proxy.search(query, max_results, order_by, start_index)
+
+    def volume(self, google_id):
+        return self.proxy.volume(google_id)
+
+google_books = GoogleBooks()
@@ -0,0 +1,95 @@
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from .cache import LRUCache
+from .models import User
+from .routing import RoutingSession
+from . import db
+
+# --------- Session Identity Cache ---------
+# Flask-Login calls the user loader on every authenticated request, before
+# the view runs, and the views only ever need the user's id and username. The
+# loader returns a Principal holding just those two, cached in-process for
+# IDENTITY_CACHE_TTL seconds, so most requests never touch the user table.
+# Committed changes to a User row drop its entry in this process; other
+# processes see the change once their entry expires.
+
+class Principal:
+    __slots__ = ('id', 'username')
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return hasattr(other, 'get_id') and self.get_id() == other.get_id()
+
+    def __hash__(self):
+        return hash(self.get_id())
+
+    def __repr__(self):
+        return f"<Principal {self.id} {self.username!r}>"
+
+class IdentityCache:
+    def init_app(self, app):
+        app.extensions['identity_cache'] = {
+            'store': LRUCache(app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 10000), app.config.get('IDENTITY_CACHE_TTL', 300)),
+            'metrics': {'hits': 0, 'misses': 0, 'invalidations': 0},
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def state(self):
+        return current_app.extensions['identity_cache']
+
+    def count(self, metric):
+        with self.state['lock']:
+            self.state['metrics'][metric] += 1
+
+    def load(self, user_id):
+        principal = self.state['store'].get(user_id)
+        if principal is not None:
+            self.count('hits')
+            return principal
+        self.count('misses')
+        row = db.session.execute(select(User.id, User.username).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        principal = Principal(row.id, row.username)
+        self.state['store'].set(user_id, principal)
+        return principal
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self.state['store'].delete(user_id)
+            self.count('invalidations')
+
+    def metrics(self):
+        with self.state['lock']:
+            return dict(self.state['metrics'])
+
+identity_cache = IdentityCache()
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def record_account_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(target.id)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def invalidate_changed_users(session):
+    changed = session.info.pop('changed_users', None)
+    if changed and has_app_context() and 'identity_cache' in current_app.extensions:
+        identity_cache.invalidate(*changed)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_users', None)
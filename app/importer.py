@@ -0,0 +1,325 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timezone
+from itertools import chain, islice
+from types import SimpleNamespace
+from sqlalchemy import bindparam, case, func, or_, select, update
+from .models import Book, UserBook
+from .cache import response_cache
+from .library import BOOK_FIELDS, insert_many_or_ignore, is_blank
+from .search import SEARCH_FIELDS, book_search
+from .statistics import rebuild_user_stats, update_book_holders
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# --------- Parsers ---------
+# Each parser is a generator of (line_number, row) pairs with the keys
+# add_book_to_library accepts, so a file is never held in memory whole.
+
+IMPORT_FORMATS = ('csv', 'goodreads', 'jsonl')
+UNREADABLE = (UnicodeDecodeError, csv.Error)  # raised while reading a file that is not UTF-8 CSV/JSON Lines
+STATUSES = ('wishlist', 'currently_reading', 'completed')
+GOODREADS_SHELVES = {'to-read': 'wishlist', 'currently-reading': 'currently_reading', 'read': 'completed'}
+DATE_FORMATS = ('%Y/%m/%d', '%d/%m/%Y')  # tried after ISO 8601
+
+def parse_csv(stream):
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        yield line_number, row
+
+def parse_jsonl(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else {}
+
+def goodreads_isbn(value):
+    # Goodreads wraps ISBNs as ="0439023483" so spreadsheets keep the zeros.
+    return (value or '').strip().lstrip('=').strip('"')
+
+def parse_goodreads(stream):
+    for line_number, row in parse_csv(stream):
+        isbn = goodreads_isbn(row.get('ISBN13')) or goodreads_isbn(row.get('ISBN'))
+        yield line_number, {
+            'google_id': None,
+            'title': row.get('Title'),
+            'author': row.get('Author'),
+            'description': f"ISBN {isbn}" if isbn else None,
+            'page_count': row.get('Number of Pages'),
+            'status': GOODREADS_SHELVES.get((row.get('Exclusive Shelf') or '').strip(), 'wishlist'),
+            'date_added': row.get('Date Added'),
+            'date_completed': row.get('Date Read'),
+        }
+
+def detect_format(filename, header):
+    if filename.lower().endswith(('.jsonl', '.ndjson')) or header.lstrip().startswith('{'):
+        return 'jsonl'
+    return 'goodreads' if 'Exclusive Shelf' in header else 'csv'
+
+def read_import(stream, filename='', import_format=None):
+    # Takes a binary stream (an upload or an open file) and returns its rows.
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    header = text.readline()
+    import_format = import_format or detect_format(filename, header)
+    parser = {'csv': parse_csv, 'goodreads': parse_goodreads, 'jsonl': parse_jsonl}[import_format]
+    return parser(chain([header], text))
+
+# --------- Normalising ---------
+
+def parse_date(value):
+    if isinstance(value, datetime) or not value:
+        return value or None
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+def clean(value, length=None):
+    value = str(value).strip() if value is not None else ''
+    return value[:length] if length else value
+
+def normalise_row(row):
+    title = clean(row.get('title'), 150)
+    author = clean(row.get('author'), 150)
+    google_id = clean(row.get('google_id')) or None
+    if not title or not author:
+        raise ValueError("title and author are required")
+    if google_id and len(google_id) > 40:
+        raise ValueError("google_id is too long")
+    status = clean(row.get('status')) or 'wishlist'
+    if status not in STATUSES:
+        raise ValueError(f"unknown status {status!r}")
+    try:
+        page_count = int(row.get('page_count') or 0) or None
+    except (TypeError, ValueError):
+        page_count = None
+    date_completed = parse_date(row.get('date_completed'))
+    if status == 'completed' and date_completed is None:
+        date_completed = datetime.now(timezone.utc)
+    return {
+        'book': {
+            'google_id': google_id,
+            'title': title,
+            'author': author,
+            'genre': clean(row.get('genre'), 100) or None,
+            'description': clean(row.get('description')) or None,
+            'cover_url': clean(row.get('cover_url'), 300) or None,
+            'page_count': page_count,
+        },
+        'status': status,
+        'date_added': parse_date(row.get('date_added')),
+        'date_completed': date_completed if status == 'completed' else None,
+    }
+
+def book_key(book):
+    # Rows without a google_id (e.g. Goodreads exports) match on title and author.
+    if book['google_id']:
+        return book['google_id']
+    return (book['title'].lower(), book['author'].lower())
+
+# --------- Batch Upsert ---------
+# New books go in with the same INSERT ... ON CONFLICT DO NOTHING as
+# add_book_to_library, so concurrent imports and adds of one google_id settle
+# on a single row, and ids are selected afterwards. Existing books are locked
+# and have their blank fields filled in from the import, as upsert_book does.
+
+BACKFILL_FIELDS = tuple(field for field in BOOK_FIELDS if field not in ('title', 'author'))
+
+def existing_books(entries):
+    # Returns {key: row} for keys that already have a Book; rows carry the id
+    # and the fields an import may backfill.
+    columns = (Book.id, Book.google_id, Book.title, Book.author, *(getattr(Book, f) for f in BACKFILL_FIELDS))
+    google_ids = [key for key in entries if isinstance(key, str)]
+    titled = [key for key in entries if isinstance(key, tuple)]
+    found = {}
+    if google_ids:
+        statement = select(*columns).where(Book.google_id.in_(google_ids)).order_by(Book.id).with_for_update()
+        for row in db.session.execute(statement):
+            found[row.google_id] = row
+    if titled:
+        # SQLite's lower() folds ASCII only, so titles and authors also match
+        # as written, and book_key() makes the final comparison.
+        books = [entries[key]['book'] for key in titled]
+        statement = select(*columns).where(
+            Book.google_id.is_(None),
+            or_(func.lower(Book.title).in_({title for title, _ in titled}),
+                Book.title.in_({book['title'] for book in books})),
+            or_(func.lower(Book.author).in_({author for _, author in titled}),
+                Book.author.in_({book['author'] for book in books}))
+        ).order_by(Book.id).with_for_update()
+        for row in db.session.execute(statement):
+            key = book_key({'google_id': None, 'title': row.title, 'author': row.author})
+            if key in entries:
+                found.setdefault(key, row)
+    return found
+
+def backfill_books(entries, found):
+    # Returns {book_id: row before the fill}. The CASE keeps any value
+    # already there, should a backend not honour the select's lock.
+    table = Book.__table__
+    rows = []
+    for key, row in found.items():
+        book = entries[key]['book']
+        fills = {field: book[field] for field in BACKFILL_FIELDS if book[field] and not getattr(row, field)}
+        if fills:
+            rows.append({'book_id': row.id, **{f"new_{field}": fills.get(field) for field in BACKFILL_FIELDS}})
+    if rows:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('book_id')).values({
+                table.c[field]: case(
+                    (is_blank(table.c[field]),
+                     func.coalesce(bindparam(f"new_{field}", type_=table.c[field].type), table.c[field])),
+                    else_=table.c[field]
+                ) for field in BACKFILL_FIELDS
+            }),
+            rows
+        )
+    originals = {row.id: row for row in found.values()}
+    return {row['book_id']: originals[row['book_id']] for row in rows}
+
+def upsert_books(entries):
+    # Returns ({key: book_id}, books created, {backfilled book_id: original row}).
+    found = existing_books(entries)
+    backfilled = backfill_books(entries, found)
+    missing = {key: entries[key] for key in entries if key not in found}
+    created = 0
+    if missing:
+        created = insert_many_or_ignore(Book, [entry['book'] for entry in missing.values()], ['google_id'])
+        found.update(existing_books(missing))
+    book_ids = {key: row.id for key, row in found.items()}
+    indexed = [book_ids[key] for key in missing] + list(backfilled)
+    if indexed:
+        book_search.index_books(db.session.execute(
+            select(Book.id, *(getattr(Book, field) for field in SEARCH_FIELDS)).where(Book.id.in_(indexed))
+        ).all())
+    return book_ids, created, backfilled
+
+def update_backfilled_holders(backfilled):
+    # Returns the users whose rollups moved from a book's blanks to its new values.
+    holders = set()
+    if backfilled:
+        books = db.session.execute(
+            select(Book.id, Book.title, Book.author, Book.genre, Book.page_count).where(Book.id.in_(list(backfilled)))
+        )
+        for book in books:
+            holders.update(update_book_holders(book.id, backfilled[book.id], book))
+    return holders
+
+def library_rows(user_id, book_ids):
+    return {
+        row.book_id: row for row in db.session.execute(
+            select(UserBook.id, UserBook.book_id, UserBook.status, UserBook.date_completed)
+            .where(UserBook.user_id == user_id, UserBook.book_id.in_(book_ids))
+        )
+    }
+
+def upsert_user_books(user_id, entries, book_ids):
+    # New entries go in with INSERT ... ON CONFLICT DO NOTHING, so an entry
+    # that a concurrent add or import created first is re-selected and
+    # updated like any other existing one.
+    existing = library_rows(user_id, list(book_ids.values()))
+    added, updated = [], []
+    for key, entry in entries.items():
+        book_id = book_ids[key]
+        current = existing.get(book_id)
+        if current is None:
+            row = {'user_id': user_id, 'book_id': book_id, 'status': entry['status'], 'date_completed': entry['date_completed']}
+            if entry['date_added']:
+                row['date_added'] = entry['date_added']
+            added.append(row)
+        elif current.status != entry['status']:
+            updated.append({'id': current.id, 'status': entry['status'], 'date_completed': entry['date_completed']})
+    # Core statements rather than ORM bulk inserts: the ORM splits a batch
+    # wherever consecutive rows differ in which values are None, which turns
+    # a mixed-status batch into row-at-a-time INSERTs. Rows with and without
+    # date_added still go separately so each executemany has one shape.
+    inserted = 0
+    for rows in ([r for r in added if 'date_added' in r], [r for r in added if 'date_added' not in r]):
+        if rows:
+            inserted += insert_many_or_ignore(UserBook, rows, ['user_id', 'book_id'])
+    if inserted < len(added):
+        stored = library_rows(user_id, [row['book_id'] for row in added])
+        for row in added:
+            current = stored[row['book_id']]
+            if (current.status, current.date_completed) != (row['status'], row['date_completed']):
+                updated.append({'id': current.id, 'status': row['status'], 'date_completed': row['date_completed']})
+    if updated:
+        db.session.execute(
+            update(UserBook.__table__).where(UserBook.id == bindparam('user_book_id')),
+            [{'user_book_id': row.pop('id'), **row} for row in updated]
+        )
+    return inserted, len(updated)
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def import_library(user_id, rows, batch_size=1000, progress=None):
+    # Each batch is deduplicated on its book key (the last row wins), then
+    # upserted with a few selects and bulk writes, and committed on its own
+    # so memory stays bounded by batch_size. Statistics rollups and cached
+    # responses are refreshed once at the end, also when a later batch
+    # fails, since the batches before it are already committed. Other
+    # holders of a backfilled book have their rollups moved off the blanks
+    # within the batch.
+    report = {'rows': 0, 'books_created': 0, 'added': 0, 'updated': 0, 'skipped': 0, 'errors': []}
+    holders, committed = set(), False
+    try:
+        for batch in chunks(rows, batch_size):
+            entries = {}
+            for line_number, row in batch:
+                report['rows'] += 1
+                try:
+                    entry = normalise_row(row)
+                except ValueError as error:
+                    report['skipped'] += 1
+                    if len(report['errors']) < 20:
+                        report['errors'].append(f"line {line_number}: {error}")
+                    continue
+                entries[book_key(entry['book'])] = entry
+            if entries:
+                book_ids, created, backfilled = upsert_books(entries)
+                holders |= update_backfilled_holders(backfilled)
+                added, updated = upsert_user_books(user_id, entries, book_ids)
+                report['books_created'] += created
+                report['added'] += added
+                report['updated'] += updated
+            db.session.commit()
+            committed = True
+            if progress is not None:
+                progress(report)
+    except BaseException:
+        refresh_after_import(user_id, holders, committed, failed=True)
+        raise
+    refresh_after_import(user_id, holders, committed)
+    return report
+
+def refresh_after_import(user_id, holders, committed, failed=False):
+    # Only needed once a batch has committed. When the import itself failed,
+    # its error is the one to report, so an error here is only logged.
+    db.session.rollback()
+    if not committed:
+        return
+    try:
+        rebuild_user_stats(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if not failed:
+            raise
+        logger.exception("could not refresh statistics for user %s after a failed import", user_id)
+    finally:
+        response_cache.bump(user_id, *holders)
@@ -0,0 +1,147 @@
+from sqlalchemy import Integer, func, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import contains_eager
+from .models import UserBook, Book
+from . import db
+
+# --------- Library Query Layer ---------
+# All reads of a user's library go through here so the Book row always comes
+# back in the same statement as its UserBook instead of one lazy load per row.
+
+def library_query(user_id):
+    return (
+        UserBook.query
+        .join(UserBook.book)
+        .options(contains_eager(UserBook.book))
+        .filter(UserBook.user_id == user_id)
+    )
+
+def library_entries(user_id):
+    return library_query(user_id).all()
+
+def library_select(user_id, *columns):
+    return (
+        select(*columns)
+        .select_from(UserBook)
+        .join(Book, UserBook.book_id == Book.id)
+        .where(UserBook.user_id == user_id)
+    )
+
+def library_rows(user_id, *columns):
+    return db.session.execute(library_select(user_id, *columns)).all()
+
+# --------- Library Write Layer ---------
+# Race-safe upserts that leave the commit to the caller, so adding a book is
+# a single transaction. INSERT ... ON CONFLICT DO NOTHING (INSERT IGNORE on
+# MySQL) settles concurrent inserts of the same key in the database; the
+# loser falls through to the update path exactly as if the row had existed.
+
+BOOK_FIELDS = ('title', 'author', 'description', 'cover_url', 'genre', 'page_count')
+DIALECT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def insert_or_ignore(model, values, conflict_columns):
+    # Returns the new row's id, or None if a row with the same key exists.
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        result = db.session.execute(mysql_insert(model).values(**values).prefix_with('IGNORE'))
+        return result.inserted_primary_key[0] if result.rowcount else None
+    stmt = DIALECT_INSERTS[dialect](model).values(**values).on_conflict_do_nothing(index_elements=conflict_columns)
+    return db.session.execute(stmt.returning(model.id)).scalar()
+
+def insert_many_or_ignore(model, rows, conflict_columns):
+    # Bulk form of insert_or_ignore. Rows that hit the key are skipped, so
+    # callers select the ids afterwards; returns how many rows were inserted.
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql_insert(table).prefix_with('IGNORE')
+    else:
+        stmt = DIALECT_INSERTS[dialect](table).on_conflict_do_nothing(index_elements=conflict_columns)
+    return db.session.execute(stmt, rows).rowcount
+
+def insert_or_increment(model, rows, conflict_columns, counters):
+    # INSERT ... ON CONFLICT DO UPDATE (ON DUPLICATE KEY UPDATE on MySQL)
+    # adding each row's counters to the stored ones, so concurrent writers
+    # to one key neither overwrite each other's increments nor collide.
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in counters})
+    else:
+        stmt = DIALECT_INSERTS[dialect](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={name: table.c[name] + stmt.excluded[name] for name in counters}
+        )
+    db.session.execute(stmt, rows)
+
+def is_blank(column):
+    return or_(column.is_(None), column == (0 if isinstance(column.type, Integer) else ''))
+
+BOOK_COLUMNS = (Book.id, *(getattr(Book, name) for name in BOOK_FIELDS))
+
+def find_untracked_book(title, author):
+    # Books without a google_id have no unique key and are matched on title
+    # and author, ignoring case like the importer. SQLite's lower() folds
+    # ASCII only, so the exact spelling is tried too and Python compares last.
+    title, author = title or '', author or ''
+    rows = db.session.execute(
+        select(*BOOK_COLUMNS)
+        .where(
+            Book.google_id.is_(None),
+            or_(func.lower(Book.title) == title.lower(), Book.title == title),
+            or_(func.lower(Book.author) == author.lower(), Book.author == author)
+        )
+        .order_by(Book.id)
+        .with_for_update()
+    )
+    return next((row for row in rows if (row.title.lower(), row.author.lower()) == (title.lower(), author.lower())), None)
+
+def upsert_book(google_id, fields):
+    # Returns (book_id, created, original). An existing book keeps its values
+    # and only has blank fields filled in from the new data; original is its
+    # row from before the fill, or None when nothing was blank. The row is
+    # locked first so original is exactly what the fill replaced.
+    if google_id:
+        book_id = insert_or_ignore(Book, dict(fields, google_id=google_id), ['google_id'])
+        if book_id is not None:
+            return book_id, True, None
+        original = db.session.execute(select(*BOOK_COLUMNS).where(Book.google_id == google_id).with_for_update()).one()
+    else:
+        original = find_untracked_book(fields.get('title'), fields.get('author'))
+        if original is None:
+            result = db.session.execute(insert(Book).values(**fields, google_id=None))
+            return result.inserted_primary_key[0], True, None
+    fills = {name: value for name, value in fields.items() if value and not getattr(original, name)}
+    if not fills:
+        return original.id, False, None
+    db.session.execute(
+        update(Book).where(Book.id == original.id).values(**fills),
+        execution_options={'synchronize_session': 'fetch'}
+    )
+    return original.id, False, original
+
+def upsert_user_book(user_id, book_id, status, date_completed):
+    # Returns the entry's previous (status, date_completed), or None if new.
+    def current():
+        return db.session.execute(
+            select(UserBook.id, UserBook.status, UserBook.date_completed)
+            .where(UserBook.user_id == user_id, UserBook.book_id == book_id)
+        ).first()
+
+    existing = current()
+    if existing is None:
+        values = {'user_id': user_id, 'book_id': book_id, 'status': status, 'date_completed': date_completed}
+        if insert_or_ignore(UserBook, values, ['user_id', 'book_id']) is not None:
+            return None
+        existing = current()
+    db.session.execute(
+        update(UserBook)
+        .where(UserBook.id == existing.id)
+        .values(status=status, date_completed=date_completed),
+        execution_options={'synchronize_session': 'fetch'}
+    )
+    return existing.status, existing.date_completed
@@ -1,5 +1,6 @@
 from . import db
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 
 # When you make any changes to the models.py file eg. adding a column to one of the models please open up a terminal in administrator then:
 # cd path/to/booktracker
@@ -8,15 +9,34 @@ from flask_login import UserMixin
 # This applies the schema changes to your app.db database
 
 
+def username_key(username):
+    # Usernames are case-folded in Python rather than with SQL lower(), which
+    # only folds ASCII on SQLite, so stored keys and search prefixes agree.
+    return username.casefold()
+
+def default_username_key(context):
+    # For Core inserts; the ORM keeps the key in step through User.fold_username.
+    return username_key(context.get_current_parameters()['username'])
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
+    username_lower = db.Column(db.String(150), nullable=False, default=default_username_key)
     email = db.Column(db.String(150), unique=True, nullable=True)
     password = db.Column(db.String(128), nullable=False)
     books = db.relationship('UserBook', back_populates='user', cascade='all, delete-orphan')
     sent_shares = db.relationship('BookShare', foreign_keys='BookShare.from_user_id', back_populates='from_user')
     received_shares = db.relationship('BookShare', foreign_keys='BookShare.to_user_id', back_populates='to_user')
 
+    __table_args__ = (
+        db.Index('ix_user_username_lower', username_lower),
+    )
+
+    @validates('username')
+    def fold_username(self, key, username):
+        self.username_lower = username_key(username)
+        return username
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     google_id = db.Column(db.String(40), unique=True, nullable=True)
@@ -41,6 +61,12 @@ class UserBook(db.Model):
     user = db.relationship('User', back_populates='books')
     book = db.relationship('Book', back_populates='userbooks')
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', name='uq_user_book_user_id_book_id'),
+        db.Index('ix_user_book_user_id_status_date_completed', 'user_id', 'status', 'date_completed'),
+        db.Index('ix_user_book_book_id', 'book_id'),
+    )
+
 class BookShare(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     from_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -52,3 +78,42 @@ class BookShare(db.Model):
     from_user = db.relationship('User', foreign_keys=[from_user_id], back_populates='sent_shares')
     to_user = db.relationship('User', foreign_keys=[to_user_id], back_populates='received_shares')
     book = db.relationship('Book', back_populates='shares')
+    feed_items = db.relationship('ActivityFeedItem', back_populates='share', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_book_share_from_user_id_timestamp', 'from_user_id', 'timestamp'),
+        db.Index('ix_book_share_to_user_id_timestamp', 'to_user_id', 'timestamp'),
+    )
+
+class UserStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # 'total', 'shared', 'status', 'genre', 'author', 'week', 'month', 'year', 'longest', 'shortest', 'meta'
+    bucket = db.Column(db.String(150), nullable=False, default='')
+    books = db.Column(db.Integer, nullable=False, default=0)
+    pages = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'dimension', 'bucket', name='uq_user_stats_user_id_dimension_bucket'),
+    )
+
+class ActivityFeedItem(db.Model):
+    # One row per share per participant, written when the share is made so a
+    # user's feed is a single range scan with no joins.
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    share_id = db.Column(db.Integer, db.ForeignKey('book_share.id'), nullable=False)
+    google_id = db.Column(db.String(40), nullable=True)
+    title = db.Column(db.String(150), nullable=False)
+    cover_url = db.Column(db.String(300), nullable=True)
+    status = db.Column(db.String(30), nullable=False)
+    from_username = db.Column(db.String(150), nullable=False)
+    to_username = db.Column(db.String(150), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    share = db.relationship('BookShare', back_populates='feed_items')
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'share_id', name='uq_activity_feed_item_user_id_share_id'),
+        db.Index('ix_activity_feed_item_user_id_timestamp', 'user_id', 'timestamp'),
+    )
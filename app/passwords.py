@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# --------- Password Hashing ---------
+# Hashing and checking passwords is deliberately slow, CPU-bound work. Run on
+# the request threads, a burst of logins takes every core and every worker
+# thread, and other requests wait behind it. Instead the hashes run on a
+# pool of PASSWORD_HASH_WORKERS processes, with at most PASSWORD_HASH_QUEUE
+# more waiting. Past that, HashingBusy is raised and the view answers 503
+# instead of queueing without limit. With PASSWORD_HASH_WORKERS = 0, hashes
+# run on the calling thread.
+#
+# Hashes record the method they were made with. A successful login whose
+# stored hash used a different PASSWORD_HASH_METHOD or PASSWORD_SALT_LENGTH
+# returns a fresh hash for the caller to store.
+
+class HashingBusy(Exception):
+    pass
+
+@lru_cache(maxsize=None)
+def method_prefix(method):
+    # werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1') when it
+    # writes the method into a hash; hash once to learn the expanded form.
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+def needs_rehash(stored, method, salt_length):
+    prefix, _, rest = stored.partition('$')
+    return prefix != method_prefix(method) or len(rest.partition('$')[0]) != salt_length
+
+def hash_password(password, method, salt_length):
+    return generate_password_hash(password, method, salt_length)
+
+def check_password(stored, password, method, salt_length):
+    # Returns (matches, new hash or None).
+    if not check_password_hash(stored, password):
+        return False, None
+    if needs_rehash(stored, method, salt_length):
+        return True, generate_password_hash(password, method, salt_length)
+    return True, None
+
+class HashingPool:
+    def __init__(self, method='scrypt', salt_length=16, workers=None, queue_size=32):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = os.cpu_count() if workers is None else workers
+        self.slots = threading.BoundedSemaphore(self.workers + queue_size) if self.workers else None
+        self.executor = None
+        self.lock = threading.Lock()
+        self.metrics = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'rejected': 0}
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def pool(self):
+        # Started on first use, with spawn so the workers do not inherit the
+        # server's threads and open connections.
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self.slots.acquire(blocking=False):
+            self.count('rejected')
+            raise HashingBusy(f"{self.workers} hashing workers busy and queue full")
+        try:
+            return self.pool().submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        self.count('hashes')
+        return self.run(hash_password, password, self.method, self.salt_length)
+
+    def check(self, stored, password):
+        self.count('checks')
+        matches, new_hash = self.run(check_password, stored, password, self.method, self.salt_length)
+        if new_hash is not None:
+            self.count('rehashes')
+        return matches, new_hash
+
+    def close(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+
+# --------- Flask Extension ---------
+
+class PasswordHasher:
+    def init_app(self, app):
+        config = app.config
+        app.extensions['password_hasher'] = HashingPool(
+            method=config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+            salt_length=config.get('PASSWORD_SALT_LENGTH', 16),
+            workers=config.get('PASSWORD_HASH_WORKERS'),
+            queue_size=config.get('PASSWORD_HASH_QUEUE', 32),
+        )
+
+    @property
+    def pool(self):
+        return current_app.extensions['password_hasher']
+
+    def hash(self, password):
+        return self.pool.hash(password)
+
+    def check(self, stored, password):
+        return self.pool.check(stored, password)
+
+password_hasher = PasswordHasher()
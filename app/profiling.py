@@ -0,0 +1,193 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from .cache import response_cache
+from .google_books import google_books
+from .identity import identity_cache
+from .passwords import password_hasher
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# --------- Metrics ---------
+# Just enough of the Prometheus text format for counters and histograms; the
+# counters live in this process, so each worker reports its own.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def label_set(**labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels.items())
+    return '{' + pairs + '}'
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+
+    def lines(self, name, **labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{label_set(**labels, le=bound)} {cumulative}"
+        yield f"{name}_bucket{label_set(**labels, le='+Inf')} {self.count}"
+        yield f"{name}_sum{label_set(**labels)} {self.sum:.6f}"
+        yield f"{name}_count{label_set(**labels)} {self.count}"
+
+class EndpointMetrics:
+    def __init__(self):
+        self.duration = Histogram()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.repeated = 0
+
+# --------- Request Profiling ---------
+# Cursor hooks on every engine time each statement. Inside a request the
+# totals are kept on g and sent back as a Server-Timing header; statements
+# slower than SQL_SLOW_QUERY_MS are logged as they finish, and a request that
+# runs one statement SQL_REPEATED_QUERY_THRESHOLD times or more is logged as
+# a likely N+1 once it completes.
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = Counter()
+
+class SQLProfiler:
+    def init_app(self, app):
+        state = app.extensions['sql_profiler'] = {
+            'lock': threading.Lock(),
+            'queries': Histogram(),
+            'slow_queries': 0,
+            'endpoints': defaultdict(EndpointMetrics),
+        }
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument(engine, app, state)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    @property
+    def state(self):
+        return current_app.extensions['sql_profiler']
+
+    def instrument(self, engine, app, state):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_query(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'handle_error')
+        def abandon_query(context):
+            # A failed statement never reaches after_cursor_execute; drop its
+            # start time so pooled connections do not collect them.
+            started = context.connection.info.get('query_started') if context.connection is not None else None
+            if started:
+                started.pop()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def finish_query(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['query_started'].pop()
+            with state['lock']:
+                state['queries'].observe(elapsed)
+            if has_request_context() and 'sql_profile' in g:
+                profile = g.sql_profile
+                profile.queries += 1
+                profile.query_seconds += elapsed
+                profile.statements[statement] += 1
+            threshold = app.config.get('SQL_SLOW_QUERY_MS')
+            if threshold is not None and elapsed * 1000 >= threshold:
+                with state['lock']:
+                    state['slow_queries'] += 1
+                logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+    def start_request(self):
+        g.sql_profile = RequestProfile()
+
+    def finish_request(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        elapsed = time.perf_counter() - profile.started
+        endpoint = request.endpoint or 'unmatched'
+        threshold = current_app.config.get('SQL_REPEATED_QUERY_THRESHOLD', 10)
+        repeated = [(statement, n) for statement, n in profile.statements.items() if n >= threshold]
+        for statement, n in repeated:
+            logger.warning("possible N+1 in %s: statement ran %d times: %s", endpoint, n, statement)
+        with self.state['lock']:
+            metrics = self.state['endpoints'][endpoint]
+            metrics.duration.observe(elapsed)
+            metrics.queries += profile.queries
+            metrics.query_seconds += profile.query_seconds
+            metrics.repeated += len(repeated)
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.query_seconds * 1000:.2f};desc="{profile.queries} queries", '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+        return response
+
+    def render_metrics(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self.state['lock']:
+            endpoints = sorted(self.state['endpoints'].items())
+            metric('booktracker_request_duration_seconds', 'histogram', 'Request latency by endpoint.',
+                   [line for endpoint, m in endpoints for line in m.duration.lines(
+                       'booktracker_request_duration_seconds', endpoint=endpoint)])
+            metric('booktracker_request_sql_queries_total', 'counter', 'SQL statements run by requests, by endpoint.',
+                   [f"booktracker_request_sql_queries_total{label_set(endpoint=endpoint)} {m.queries}"
+                    for endpoint, m in endpoints])
+            metric('booktracker_request_sql_seconds_total', 'counter', 'Time requests spent in SQL, by endpoint.',
+                   [f"booktracker_request_sql_seconds_total{label_set(endpoint=endpoint)} {m.query_seconds:.6f}"
+                    for endpoint, m in endpoints])
+            metric('booktracker_request_repeated_queries_total', 'counter',
+                   'Statements a request ran SQL_REPEATED_QUERY_THRESHOLD times or more.',
+                   [f"booktracker_request_repeated_queries_total{label_set(endpoint=endpoint)} {m.repeated}"
+                    for endpoint, m in endpoints])
+            metric('booktracker_sql_query_duration_seconds', 'histogram', 'Latency of individual SQL statements.',
+                   list(self.state['queries'].lines('booktracker_sql_query_duration_seconds')))
+            metric('booktracker_sql_slow_queries_total', 'counter', 'Statements slower than SQL_SLOW_QUERY_MS.',
+                   [f"booktracker_sql_slow_queries_total {self.state['slow_queries']}"])
+
+        cache = response_cache.metrics()
+        metric('booktracker_response_cache_total', 'counter', 'Response cache lookups and invalidations.',
+               [f"booktracker_response_cache_total{label_set(result=name)} {cache[name]}"
+                for name in ('hits', 'misses', 'invalidations')])
+        identities = identity_cache.metrics()
+        metric('booktracker_identity_cache_total', 'counter', 'Login user loader lookups and invalidations.',
+               [f"booktracker_identity_cache_total{label_set(result=name)} {identities[name]}"
+                for name in ('hits', 'misses', 'invalidations')])
+        hashing = password_hasher.pool
+        with hashing.lock:
+            hashes = dict(hashing.metrics)
+        metric('booktracker_password_hashing_total', 'counter', 'Password hashes, checks, upgrades and rejections.',
+               [f"booktracker_password_hashing_total{label_set(operation=name)} {count}" for name, count in hashes.items()])
+        proxy = google_books.proxy
+        with proxy.lock:
+            books = dict(proxy.metrics)
+        metric('booktracker_google_books_total', 'counter', 'Google Books proxy lookups by outcome.',
+               [f"booktracker_google_books_total{label_set(result=name)} {count}" for name, count in books.items()])
+        return '\n'.join(lines) + '\n'
+
+sql_profiler = SQLProfiler()
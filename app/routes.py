@@ -1,34 +1,57 @@
-from flask import jsonify, render_template, request, redirect, url_for, flash
+import hmac
+from flask import abort, current_app, jsonify, render_template, request, redirect, url_for, flash, make_response, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import generate_csrf
-from .models import UserBook, BookShare
 from .forms import RegistrationForm, LoginForm
 from .blueprints import bp
+from .cache import cached_per_user
+from .google_books import RateLimited, UpstreamError
+from .passwords import HashingBusy
+from .statistics import stats_range
+from .profiling import sql_profiler
+from .export import EXPORT_FORMATS
 from .utils import (
     validate_registration_form, register_user,
-    validate_login_form, get_all_usernames,
-    get_user_library_books, get_user_books,
-    add_book_to_library, delete_book_from_library,
+    validate_login_form, search_usernames,
+    search_catalogue, get_catalogue_volume, check_catalogue_rate, search_books,
+    get_user_library_books, get_user_library_items,
+    get_user_books,
+    add_book_to_library, delete_book_from_library, import_library_upload,
+    export_user_library,
     share_book_with_user, get_community_feed,
+    get_community_feed_page, get_dashboard_summary,
     get_stats_summary, get_books_over_time,
     get_pages_over_time, get_genre_stats,
-    get_status_stats, get_author_stats
+    get_status_stats, get_author_stats,
+    get_stats_version, get_all_stats
 )
 
 # ----------------- Registration -----------------
 
+BUSY_MESSAGE = 'The server is busy, please try again in a moment'
+
+def busy_response(body):
+    response = make_response(body, 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
 @bp.route('/register', methods=['GET', 'POST'])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         valid, errors = validate_registration_form(form)
         if valid:
-            register_user(form)
-            return redirect(url_for('main.login'))
-        else:
-            for field, msgs in errors.items():
-                for msg in msgs:
-                    getattr(form, field).errors.append(msg)
+            try:
+                created, result = register_user(form)
+            except HashingBusy:
+                form.password.errors.append(BUSY_MESSAGE)
+                return busy_response(render_template('register.html', form=form))
+            if created:
+                return redirect(url_for('main.login'))
+            errors = result
+        for field, msgs in errors.items():
+            for msg in msgs:
+                getattr(form, field).errors.append(msg)
     return render_template('register.html', form=form)
 
 # ----------------- Login/Logout -----------------
@@ -37,7 +60,11 @@ def register():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        valid, user = validate_login_form(form)
+        try:
+            valid, user = validate_login_form(form)
+        except HashingBusy:
+            form.username.errors.append(BUSY_MESSAGE)
+            return busy_response(render_template('login.html', form=form))
         if valid:
             login_user(user)
             return redirect(url_for('main.dashboard'))
@@ -105,26 +132,8 @@ def forgot():
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    feed_items = BookShare.query\
-        .filter(
-            (BookShare.from_user_id == current_user.id) |
-            (BookShare.to_user_id == current_user.id)
-        )\
-        .order_by(BookShare.timestamp.desc())\
-        .limit(10).all()
-    has_feed = len(feed_items) > 0
-
-    currently_reading_books = UserBook.query\
-        .filter(UserBook.user_id == current_user.id, UserBook.status == 'currently_reading')\
-        .all()
-    has_currently_reading = len(currently_reading_books) > 0
-
-    return render_template(
-        "dashboard.html",
-        active_page='dashboard',
-        has_feed=has_feed,
-        has_currently_reading=has_currently_reading
-    )
+    summary = get_dashboard_summary(current_user.id, current_app.config['DASHBOARD_INLINE_ITEMS'])
+    return render_template("dashboard.html", active_page='dashboard', **summary)
 
 @bp.route('/explore')
 @login_required
@@ -163,20 +172,93 @@ def csrf_token():
 
 # ----------------- API Endpoints -----------------
 
-@bp.route('/all_usernames')
+@bp.route('/metrics')
+def metrics():
+    # Only served once a scrape token is configured.
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(sql_profiler.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def catalogue_response(result):
+    status, body, cache_state = result
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['X-Cache'] = cache_state
+    response.cache_control.public = True
+    response.cache_control.max_age = 300 if status == 200 else 60
+    return response
+
+def rate_limited_response(error):
+    response = jsonify({'error': 'Too many requests'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def catalogue_client():
+    return current_user.id if current_user.is_authenticated else None, request.remote_addr
+
+@bp.route('/api/books/search')
+def api_books_search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    try:
+        check_catalogue_rate(*catalogue_client())
+        result = search_catalogue(
+            query,
+            request.args.get('maxResults', 20, type=int),
+            request.args.get('orderBy', 'relevance'),
+            request.args.get('startIndex', 0, type=int)
+        )
+    except RateLimited as error:
+        return rate_limited_response(error)
+    except UpstreamError:
+        return jsonify({'error': 'Book search is unavailable'}), 502
+    return catalogue_response(result)
+
+@bp.route('/api/books/<google_id>')
+def api_book_volume(google_id):
+    try:
+        check_catalogue_rate(*catalogue_client())
+        result = get_catalogue_volume(google_id)
+    except RateLimited as error:
+        return rate_limited_response(error)
+    except UpstreamError:
+        return jsonify({'error': 'Book details are unavailable'}), 502
+    if result is None:
+        return jsonify({'error': 'Book not found'}), 404
+    return catalogue_response(result)
+
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    results = search_books(query, request.args.get('limit', 20, type=int))
+    return jsonify({'query': query, 'results': results})
+
+@bp.route('/usernames')
 @login_required
-def all_usernames():
-    usernames = get_all_usernames(current_user.id)
-    return jsonify(usernames)
+def usernames():
+    prefix = request.args.get('prefix', '').strip()
+    result = search_usernames(prefix, current_user.id, request.args.get('limit', 8, type=int))
+    response = jsonify(result)
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
 
 @bp.route('/my_library_books')
 @login_required
+@cached_per_user
 def my_library_books():
-    books = get_user_library_books(current_user.id)
+    books = get_user_library_items(current_user.id)
     return jsonify(books)
 
 @bp.route('/my_books')
 @login_required
+@cached_per_user
 def my_books():
     books = get_user_books(current_user.id)
     return jsonify(books)
@@ -188,6 +270,29 @@ def add_book():
     result = add_book_to_library(current_user.id, data)
     return jsonify(result)
 
+@bp.route('/import_library', methods=['POST'])
+@login_required
+def import_library_route():
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No file uploaded'}), 400
+    result, code = import_library_upload(current_user.id, upload, request.form.get('format'))
+    return jsonify(result), code
+
+@bp.route('/export')
+@login_required
+def export_library():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    chunks = export_user_library(current_user.id, export_format)
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', filename=f"booktracker-{current_user.username}.{extension}")
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
 @bp.route('/share_book', methods=['POST'])
 @login_required
 def share_book():
@@ -195,25 +300,36 @@ def share_book():
     book_id = data.get('book_id')
     username = data.get('username')
     status = data.get('status')
-    result, code = share_book_with_user(current_user.id, book_id, username, status)
+    result, code = share_book_with_user(current_user.id, book_id, username, status, current_user.username)
     return jsonify(result), code
 
+FEED_PER_PAGE = 10
+
 @bp.route('/community_feed')
 @login_required
+@cached_per_user
 def community_feed():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    feed = get_community_feed(current_user.id, page, per_page)
+    per_page = FEED_PER_PAGE
+    if 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+        feed = get_community_feed(current_user.id, page, per_page)
+        return jsonify(feed)
+    try:
+        feed = get_community_feed_page(current_user.id, request.args.get('cursor'), per_page)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     return jsonify(feed)
 
 @bp.route('/stats/summary')
 @login_required
+@cached_per_user
 def stats_summary():
     summary = get_stats_summary(current_user.id)
     return jsonify(summary)
 
 @bp.route('/stats/books_over_time')
 @login_required
+@cached_per_user
 def stats_books_over_time():
     range_type = request.args.get('range', 'months')
     data = get_books_over_time(current_user.id, range_type)
@@ -221,6 +337,7 @@ def stats_books_over_time():
 
 @bp.route('/stats/pages_over_time')
 @login_required
+@cached_per_user
 def stats_pages_over_time():
     range_type = request.args.get('range', 'months')
     data = get_pages_over_time(current_user.id, range_type)
@@ -228,18 +345,36 @@ def stats_pages_over_time():
 
 @bp.route('/stats/genres')
 @login_required
+@cached_per_user
 def stats_genres():
     data = get_genre_stats(current_user.id)
     return jsonify(data)
 
 @bp.route('/stats/statuses')
 @login_required
+@cached_per_user
 def stats_statuses():
     data = get_status_stats(current_user.id)
     return jsonify(data)
 
 @bp.route('/stats/authors')
 @login_required
+@cached_per_user
 def stats_authors():
     data = get_author_stats(current_user.id)
     return jsonify(data)
+
+@bp.route('/stats/all')
+@login_required
+def stats_all():
+    range_type = stats_range(request.args.get('range'))
+    version = get_stats_version(current_user.id) if request.if_none_match else None
+    if version is not None and request.if_none_match.contains(f"stats-{current_user.id}-{version}-{range_type}"):
+        response = make_response('', 304)
+    else:
+        data, version = get_all_stats(current_user.id, range_type)
+        response = jsonify(data)
+    response.set_etag(f"stats-{current_user.id}-{version}-{range_type}")
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
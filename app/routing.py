@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+from .cache import response_cache
+
+# --------- Read Replica Routing ---------
+# Functions marked @replica_read send their SELECTs to the READ_REPLICA_BIND
+# engine when SQLALCHEMY_BINDS defines one. Flushes, INSERT/UPDATE/DELETE,
+# raw SQL and every query outside those functions stay on the primary. Once a
+# request commits a write, that browser's reads are pinned to the primary for
+# READ_YOUR_WRITES_SECONDS so a lagging replica never hides the user's own
+# change from them. Users whose data someone else changed (the recipient of
+# a share) are marked by ResponseCache.bump() for as long, and their
+# requests read the primary too.
+
+PIN_KEY = '_read_primary_until'
+replica_reads = ContextVar('replica_reads', default=False)
+
+def replica_read(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = replica_reads.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+    return wrapper
+
+@contextmanager
+def primary_reads():
+    # For read-repair inside a @replica_read function: anything derived from
+    # what is read here gets written back, so it must not come from a
+    # replica that may be behind.
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+def replica_engine(db):
+    return db.engines.get(current_app.config.get('READ_REPLICA_BIND', 'replica'))
+
+def recently_written():
+    # Checked once per request; the mark may live in a shared store.
+    if 'booktracker.read_primary' not in request.environ:
+        user_id = flask_session.get('_user_id')
+        request.environ['booktracker.read_primary'] = user_id is not None and response_cache.recently_written(user_id)
+    return request.environ['booktracker.read_primary']
+
+def pinned_to_primary():
+    if not has_request_context():
+        return False
+    return flask_session.get(PIN_KEY, 0) > time.time() or recently_written()
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and replica_reads.get() and not self._flushing and isinstance(clause, Select):
+            replica = replica_engine(self._db)
+            if replica is not None and not pinned_to_primary():
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_flush(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def record_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def pin_writer(session):
+    if not session.info.pop('wrote', False) or not has_request_context():
+        return
+    seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+    if seconds and replica_engine(session._db) is not None:
+        flask_session[PIN_KEY] = time.time() + seconds
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_writes(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,237 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import DDL, event, func, select, text
+from sqlalchemy.orm import load_only
+from .models import Book
+from . import db
+
+# --------- Tokenising ---------
+# Both backends fold case and strip accents the same way, and every query
+# term is treated as a prefix so "harr pot" finds "Harry Potter".
+
+SEARCH_FIELDS = ('title', 'author', 'genre', 'description')
+FIELD_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(value):
+    folded = unicodedata.normalize('NFKD', value or '')
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).lower()
+    return TOKEN_PATTERN.findall(folded)
+
+# --------- SQLite FTS5 Backend ---------
+# book_search is an FTS5 table keyed by book.id. It is created alongside the
+# book table wherever the SQLite build has FTS5, and is written in the same
+# transaction as the Book rows it mirrors.
+
+def sqlite_has_fts5(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+CREATE_BOOK_SEARCH = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+    "title, author, genre, description, tokenize='unicode61 remove_diacritics 2')"
+)
+
+event.listen(Book.__table__, 'after_create', DDL(CREATE_BOOK_SEARCH).execute_if(callable_=sqlite_has_fts5))
+event.listen(Book.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS book_search").execute_if(callable_=sqlite_has_fts5))
+
+class FTS5Index:
+    name = 'fts5'
+
+    def add(self, books):
+        rows = [dict(id=book.id, **{field: getattr(book, field) or '' for field in SEARCH_FIELDS}) for book in books]
+        if not rows:
+            return
+        db.session.execute(text("DELETE FROM book_search WHERE rowid = :id"), rows)
+        db.session.execute(text(
+            "INSERT INTO book_search (rowid, title, author, genre, description) "
+            "VALUES (:id, :title, :author, :genre, :description)"
+        ), rows)
+
+    def rebuild(self):
+        db.session.execute(text("DELETE FROM book_search"))
+        return db.session.execute(text(
+            "INSERT INTO book_search (rowid, title, author, genre, description) "
+            "SELECT id, title, author, coalesce(genre, ''), coalesce(description, '') FROM book"
+        )).rowcount
+
+    def search(self, terms, limit):
+        rows = db.session.execute(text(
+            "SELECT rowid, bm25(book_search, :w0, :w1, :w2, :w3) AS rank FROM book_search "
+            "WHERE book_search MATCH :match ORDER BY rank, rowid LIMIT :limit"
+        ), {
+            'match': ' '.join(f'"{term}"*' for term in terms),
+            'limit': limit,
+            **{f"w{i}": weight for i, weight in enumerate(FIELD_WEIGHTS)}
+        })
+        return [(book_id, -rank) for book_id, rank in rows]
+
+# --------- Pure-Python Fallback ---------
+# For databases without FTS5. Postings map each token to {book_id: weight}
+# and a sorted vocabulary answers prefix lookups with bisect. The index is
+# built from the book table on first use and lives in this process only.
+#
+# Other workers add and backfill books too. At most every refresh_seconds a
+# search compares the book table's row count and highest id with the index
+# and indexes the missing rows, rebuilding if that does not account for the
+# difference; every max_age seconds it rebuilds outright, which also picks
+# up fields another worker backfilled.
+
+def indexed_books():
+    return Book.query.options(load_only(Book.id, *(getattr(Book, f) for f in SEARCH_FIELDS)))
+
+class InvertedIndex:
+    name = 'python'
+
+    def __init__(self, refresh_seconds=30, max_age=3600):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.vocabulary = []
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.refresh_seconds = refresh_seconds
+        self.max_age = max_age
+        self.max_id = 0
+        self.built = self.checked = 0.0
+
+    def load(self):
+        with self.lock:
+            now = time.monotonic()
+            if not self.loaded or (self.max_age and now - self.built >= self.max_age):
+                self.rebuild()
+            elif now - self.checked >= self.refresh_seconds:
+                self.refresh()
+
+    def rebuild(self):
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.vocabulary = []
+            self.max_id = 0
+            count = 0
+            for book in indexed_books().yield_per(1000):
+                self.add_one(book)
+                count += 1
+            self.loaded = True
+            self.built = self.checked = time.monotonic()
+            return count
+
+    def refresh(self):
+        with self.lock:
+            count, max_id = db.session.execute(select(func.count(Book.id), func.max(Book.id))).one()
+            if count != len(self.documents) or (max_id or 0) != self.max_id:
+                for book in indexed_books().filter(Book.id > self.max_id).yield_per(1000):
+                    self.add_one(book)
+                if count != len(self.documents):
+                    self.rebuild()
+            self.checked = time.monotonic()
+
+    def add(self, books):
+        with self.lock:
+            if self.loaded:
+                for book in books:
+                    self.add_one(book)
+
+    def add_one(self, book):
+        self.remove(book.id)
+        weights = defaultdict(float)
+        for field, weight in zip(SEARCH_FIELDS, FIELD_WEIGHTS):
+            for token in tokenize(getattr(book, field)):
+                weights[token] += weight
+        for token, weight in weights.items():
+            if token not in self.postings:
+                bisect.insort(self.vocabulary, token)
+            self.postings[token][book.id] = weight
+        self.documents[book.id] = tuple(weights)
+        self.max_id = max(self.max_id, book.id)
+
+    def remove(self, book_id):
+        for token in self.documents.pop(book_id, ()):
+            posting = self.postings[token]
+            posting.pop(book_id, None)
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def expand(self, prefix):
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            yield self.vocabulary[i]
+            i += 1
+
+    def search(self, terms, limit):
+        self.load()
+        with self.lock:
+            total = len(self.documents)
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for token in self.expand(term):
+                    posting = self.postings[token]
+                    idf = math.log(1 + total / len(posting))
+                    for book_id, weight in posting.items():
+                        term_scores[book_id] += weight * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {book_id: score + term_scores[book_id]
+                              for book_id, score in scores.items() if book_id in term_scores}
+                if not scores:
+                    return []
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+# --------- Flask Extension ---------
+# SEARCH_BACKEND is 'fts5', 'python' or 'auto'; auto uses FTS5 whenever the
+# book_search table exists and the in-process index otherwise.
+
+class BookSearch:
+    def init_app(self, app):
+        app.extensions['book_search'] = {
+            'backend': app.config.get('SEARCH_BACKEND', 'auto'),
+            'index': None,
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def index(self):
+        state = current_app.extensions['book_search']
+        with state['lock']:
+            if state['index'] is None:
+                backend = state['backend']
+                if backend == 'auto':
+                    backend = 'fts5' if self.fts5_table_exists() else 'python'
+                if backend == 'fts5':
+                    state['index'] = FTS5Index()
+                else:
+                    config = current_app.config
+                    state['index'] = InvertedIndex(config.get('SEARCH_INDEX_REFRESH', 30), config.get('SEARCH_INDEX_MAX_AGE', 3600))
+            return state['index']
+
+    def fts5_table_exists(self):
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        return db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_search'"
+        )).first() is not None
+
+    def index_books(self, books):
+        self.index.add(books)
+
+    def rebuild(self):
+        return self.index.rebuild()
+
+    def search(self, query, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return self.index.search(terms, limit)
+
+book_search = BookSearch()
@@ -1,10 +1,9 @@
 let myLibrary = [];
 let selectedBook = null;
-let userList = [];
+const usernameLookups = new Map();
+let usernameTimer = null;
 let selectedUser = null;
 let currentUsername = null;
-let feedPage = 1;
-let feedPages = 1;
 
 // Fuzzy match helper
 function fuzzyMatch(str, query) {
@@ -19,6 +18,24 @@ function fuzzyMatch(str, query) {
     return false;
 }
 
+// Username prefix lookups. A response without has_more holds every match for
+// its prefix, so longer prefixes are filtered from it instead of refetched.
+function lookupUsernames(prefix) {
+    const key = prefix.toLowerCase();
+    for (let i = key.length; i > 0; i--) {
+        const cached = usernameLookups.get(key.slice(0, i));
+        if (cached && (i === key.length || !cached.has_more)) {
+            return Promise.resolve(cached.usernames.filter(u => u.toLowerCase().startsWith(key)));
+        }
+    }
+    return fetch(`/usernames?prefix=${encodeURIComponent(prefix)}&limit=8`)
+        .then(res => res.json())
+        .then(data => {
+            usernameLookups.set(key, data);
+            return data.usernames;
+        });
+}
+
 // Book autocomplete rendering
 function renderBookSuggestions(matches) {
     const suggestions = document.getElementById('bookSuggestions');
@@ -84,17 +101,17 @@ function renderUserSuggestions(matches) {
     suggestions.style.display = 'block';
 }
 
-function renderFeed(feed, page, pages) {
+function renderFeed(feed, nextCursor, append) {
     const feedList = document.getElementById('feedList');
     const feedPagination = document.getElementById('feedPagination');
     if (!feedList || !feedPagination) return;
 
-    if (!feed.length) {
+    if (!feed.length && !append) {
         feedList.innerHTML = '<div class="text-muted">No shares yet. Start sharing books with friends!</div>';
         feedPagination.innerHTML = '';
         return;
     }
-    feedList.innerHTML = '';
+    if (!append) feedList.innerHTML = '';
     feed.forEach(item => {
         const div = document.createElement('div');
         div.className = 'feed-item';
@@ -121,19 +138,13 @@ function renderFeed(feed, page, pages) {
         feedList.appendChild(div);
     });
 
-    // Pagination UI
+    // Pagination UI: older shares are fetched with the cursor from the last page
     feedPagination.innerHTML = '';
-    if (pages > 1) {
-        for (let i = 1; i <= pages; i++) {
-            const btn = document.createElement('button');
-            btn.textContent = i;
-            btn.className = (i === page) ? 'active' : '';
-            btn.onclick = () => {
-                loadFeed(i);
-                feedPage = i;
-            };
-            feedPagination.appendChild(btn);
-        }
+    if (nextCursor) {
+        const btn = document.createElement('button');
+        btn.textContent = 'Load more';
+        btn.onclick = () => loadFeed(nextCursor);
+        feedPagination.appendChild(btn);
     }
 }
 
@@ -147,16 +158,16 @@ function hideCommunityLoadingBar() {
     document.getElementById('feedList').style.display = 'flex';
 }
 
-function loadFeed(page = 1) {
-    const feedList = document.getElementById('feedList');
+function loadFeed(cursor = null) {
     const feedPagination = document.getElementById('feedPagination');
     showCommunityLoadingBar();
     feedPagination.innerHTML = '';
-    fetch(`/community_feed?page=${page}`)
+    const url = cursor ? `/community_feed?cursor=${encodeURIComponent(cursor)}` : '/community_feed';
+    fetch(url)
         .then(res => res.json())
         .then(data => {
             hideCommunityLoadingBar();
-            renderFeed(data.feed, data.page, data.pages);
+            renderFeed(data.feed, data.next_cursor, cursor !== null);
         });
 }
 
@@ -171,11 +182,6 @@ document.addEventListener('DOMContentLoaded', function () {
         .then(res => res.json())
         .then(books => { myLibrary = books; });
     
-    // Fetch all usernames for autocomplete
-    fetch('/all_usernames')
-        .then(res => res.json())
-        .then(users => { userList = users; });
-
     // Book autocomplete
     const bookInput = document.getElementById('bookSearchInput');
     const bookSuggestions = document.getElementById('bookSuggestions');
@@ -220,8 +226,12 @@ document.addEventListener('DOMContentLoaded', function () {
                 userSuggestions.style.display = 'none';
                 return;
             }
-            const matches = userList.filter(username => fuzzyMatch(username, value));
-            renderUserSuggestions(matches.slice(0, 8));
+            clearTimeout(usernameTimer);
+            usernameTimer = setTimeout(() => {
+                lookupUsernames(value).then(matches => {
+                    if (userInput.value.trim() === value) renderUserSuggestions(matches);
+                });
+            }, 150);
         });
 
         userInput.addEventListener('focus', function () {
@@ -257,7 +267,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 .then(res => res.json())
                 .then(data => {
                     document.getElementById('shareMsg').textContent = data.message;
-                    loadFeed(feedPage); // reload current feed page after sharing
+                    loadFeed(); // reload the feed from the newest share after sharing
                     // Reset form
                     userInput.value = "";
                     bookInput.value = "";
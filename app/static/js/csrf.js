@@ -1,24 +1,71 @@
-// Save the native fetch function
+// The CSRF token arrives with the page in <meta name="csrf-token">, so reads
+// go straight to the server and only mutating same-origin requests carry the
+// token. It is fetched again from /csrf-token only when it is about to
+// expire or the server rejects it, and the rejected request is retried once.
+
 const originalFetch = window.fetch;
+const MUTATING_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE'];
+
+const csrfMeta = document.querySelector('meta[name="csrf-token"]');
+let csrfToken = csrfMeta ? csrfMeta.content : null;
+let csrfIssuedAt = Date.now();
+const csrfMaxAge = csrfMeta && csrfMeta.dataset.maxAge ? Number(csrfMeta.dataset.maxAge) * 1000 : null;
 
-async function getCsrfToken() {
-    const response = await originalFetch('/csrf-token'); // Use original fetch
+async function refreshCsrfToken() {
+    const response = await originalFetch('/csrf-token');
     const data = await response.json();
-    return data.csrf_token;
+    csrfToken = data.csrf_token;
+    csrfIssuedAt = Date.now();
+    return csrfToken;
+}
+
+async function currentCsrfToken() {
+    // Renew a minute early so a token never expires in flight.
+    const expired = csrfMaxAge !== null && Date.now() - csrfIssuedAt > csrfMaxAge - 60000;
+    if (!csrfToken || expired) {
+        return refreshCsrfToken();
+    }
+    return csrfToken;
+}
+
+function needsCsrfToken(url, method) {
+    if (!MUTATING_METHODS.includes(method)) {
+        return false;
+    }
+    return new URL(url, window.location.href).origin === window.location.origin;
+}
+
+function withCsrfToken(options, token) {
+    const headers = new Headers(options.headers || {});
+    headers.set('X-CSRFToken', token);
+    return { ...options, headers };
 }
 
-async function customFetch(url, options = {}) {
-    // Bypass CSRF for external APIs
-    if (url.startsWith('https://www.googleapis.com')) {
-        return originalFetch(url, options);
+async function isCsrfRejection(response) {
+    if (response.status !== 400) {
+        return false;
+    }
+    try {
+        const data = await response.clone().json();
+        return data.csrf === true;
+    } catch (err) {
+        return false;
     }
+}
 
-    const csrfToken = await getCsrfToken();
-    options.headers = options.headers || {};
-    options.headers['X-CSRF-Token'] = csrfToken;
+async function customFetch(resource, options = {}) {
+    const url = resource instanceof Request ? resource.url : String(resource);
+    const method = (options.method || (resource instanceof Request ? resource.method : 'GET')).toUpperCase();
+    if (!needsCsrfToken(url, method)) {
+        return originalFetch(resource, options);
+    }
 
-    return originalFetch(url, options);
+    const response = await originalFetch(resource, withCsrfToken(options, await currentCsrfToken()));
+    if (await isCsrfRejection(response)) {
+        return originalFetch(resource, withCsrfToken(options, await refreshCsrfToken()));
+    }
+    return response;
 }
 
 // Override global fetch function
-window.fetch = customFetch;
\ No newline at end of file
+window.fetch = customFetch;
@@ -14,7 +14,7 @@ const googleid = document.getElementById('detailsCard').dataset.googleid;
   }
 
   async function fetchBookDetails() {
-    const url = `https://www.googleapis.com/books/v1/volumes/${googleid}`;
+    const url = `/api/books/${encodeURIComponent(googleid)}`;
     const resp = await fetch(url);
     const data = await resp.json();
     return data;
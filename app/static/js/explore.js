@@ -1,5 +1,5 @@
 async function fetchBooks(query, maxResults = 20, orderBy = 'relevance') {
-    const url = `https://www.googleapis.com/books/v1/volumes?q=${encodeURIComponent(query)}&maxResults=${maxResults}&orderBy=${orderBy}`;
+    const url = `/api/books/search?q=${encodeURIComponent(query)}&maxResults=${maxResults}&orderBy=${orderBy}`;
     const resp = await fetch(url);
     const data = await resp.json();
     return (data.items || []);
@@ -9,19 +9,11 @@ document.addEventListener("DOMContentLoaded", function () {
       if (!confirmed) return;
 
       try {
-        const tokenRes = await fetch('/csrf-token');
-        const tokenData = await tokenRes.json();
-
+        // csrf.js attaches the token to DELETE requests.
         const res = await fetch(`/delete_book/${userBookId}`, {
-          method: "DELETE",
-          headers: {
-            "X-CSRFToken": tokenData.csrf_token
-          }
+          method: "DELETE"
         });
 
-
-
-        
         if (!res.ok) {
           const data = await res.json();
           alert(data.error || "An error occurred while deleting the book.");
@@ -1,9 +1,7 @@
 document.addEventListener('DOMContentLoaded', function () {
     // --- Stat Cards ---
-    fetch('/stats/summary')
-        .then(res => res.json())
-        .then(stats => {
-            document.getElementById('statCards').innerHTML = `
+    function renderStatCards(stats) {
+        document.getElementById('statCards').innerHTML = `
         <div class="stat-card">
             <div class="stat-label">Total Books Read</div>
             <div class="stat-value">${stats.total_books_read}</div>
@@ -37,163 +35,169 @@ document.addEventListener('DOMContentLoaded', function () {
             <div class="stat-value">${stats.books_shared}</div>
         </div>
     `;
-        });
+    }
 
     // --- Books Over Time Chart ---
     let booksOverTimeChart;
+    function drawBooksOverTime(range, booksOverTimeData) {
+        const ctx = document.getElementById('booksOverTime');
+        if (booksOverTimeChart) booksOverTimeChart.destroy();
+        booksOverTimeChart = new Chart(ctx, {
+            type: range === 'years' || range === 'all' ? 'bar' : 'line',
+            data: {
+                labels: booksOverTimeData.labels,
+                datasets: [{
+                    label: "Books Completed",
+                    data: booksOverTimeData.data,
+                    backgroundColor: "#0d6efd",
+                    borderColor: "#0d6efd",
+                    tension: 0.25,
+                    fill: true
+                }]
+            },
+            options: {
+                scales: {
+                    y: { beginAtZero: true, ticks: { stepSize: 1 } }
+                }
+            }
+        });
+    }
     function renderBooksOverTime(range) {
         fetch(`/stats/books_over_time?range=${range}`)
             .then(res => res.json())
-            .then(booksOverTimeData => {
-                const ctx = document.getElementById('booksOverTime');
-                if (booksOverTimeChart) booksOverTimeChart.destroy();
-                booksOverTimeChart = new Chart(ctx, {
-                    type: range === 'years' || range === 'all' ? 'bar' : 'line',
-                    data: {
-                        labels: booksOverTimeData.labels,
-                        datasets: [{
-                            label: "Books Completed",
-                            data: booksOverTimeData.data,
-                            backgroundColor: "#0d6efd",
-                            borderColor: "#0d6efd",
-                            tension: 0.25,
-                            fill: true
-                        }]
-                    },
-                    options: {
-                        scales: {
-                            y: { beginAtZero: true, ticks: { stepSize: 1 } }
-                        }
-                    }
-                });
-            });
+            .then(booksOverTimeData => drawBooksOverTime(range, booksOverTimeData));
     }
-    renderBooksOverTime('months');
     document.getElementById('booksTimeRange').addEventListener('change', function () {
         renderBooksOverTime(this.value);
     });
 
     // --- Pages Over Time Chart ---
     let pagesOverTimeChart;
+    function drawPagesOverTime(range, pagesOverTimeData) {
+        const ctx = document.getElementById('pagesOverTime');
+        if (pagesOverTimeChart) pagesOverTimeChart.destroy();
+        pagesOverTimeChart = new Chart(ctx, {
+            type: range === 'years' || range === 'all' ? 'bar' : 'line',
+            data: {
+                labels: pagesOverTimeData.labels,
+                datasets: [{
+                    label: "Pages Read",
+                    data: pagesOverTimeData.data,
+                    backgroundColor: "#20c997",
+                    borderColor: "#20c997",
+                    tension: 0.25,
+                    fill: true
+                }]
+            },
+            options: {
+                scales: {
+                    y: { beginAtZero: true }
+                }
+            }
+        });
+    }
     function renderPagesOverTime(range) {
         fetch(`/stats/pages_over_time?range=${range}`)
             .then(res => res.json())
-            .then(pagesOverTimeData => {
-                const ctx = document.getElementById('pagesOverTime');
-                if (pagesOverTimeChart) pagesOverTimeChart.destroy();
-                pagesOverTimeChart = new Chart(ctx, {
-                    type: range === 'years' || range === 'all' ? 'bar' : 'line',
-                    data: {
-                        labels: pagesOverTimeData.labels,
-                        datasets: [{
-                            label: "Pages Read",
-                            data: pagesOverTimeData.data,
-                            backgroundColor: "#20c997",
-                            borderColor: "#20c997",
-                            tension: 0.25,
-                            fill: true
-                        }]
-                    },
-                    options: {
-                        scales: {
-                            y: { beginAtZero: true }
-                        }
-                    }
-                });
-            });
+            .then(pagesOverTimeData => drawPagesOverTime(range, pagesOverTimeData));
     }
-    renderPagesOverTime('months');
     document.getElementById('pagesTimeRange').addEventListener('change', function () {
         renderPagesOverTime(this.value);
     });
 
     // --- Genre Pie Chart ---
-    fetch('/stats/genres')
-        .then(res => res.json())
-        .then(genreData => {
-            const genreLabels = Object.keys(genreData);
-            const genreCounts = Object.values(genreData);
-            new Chart(document.getElementById('genrePie'), {
-                type: 'doughnut',
-                data: {
-                    labels: genreLabels,
-                    datasets: [{
-                        data: genreCounts,
-                        backgroundColor: [
-                            "#0d6efd", "#6610f2", "#6f42c1", "#d63384", "#fd7e14", "#ffc107", "#198754", "#20c997", "#0dcaf0", "#adb5bd", "#6c757d"
-                        ]
-                    }]
-                },
-                options: {
-                    plugins: {
-                        legend: { position: 'right' },
-                        tooltip: {
-                            callbacks: {
-                                label: function (context) {
-                                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                                    const count = context.parsed;
-                                    const percent = ((count / total) * 100).toFixed(1);
-                                    return `${context.label}: ${count} (${percent}%)`;
-                                }
+    function renderGenres(genreData) {
+        const genreLabels = Object.keys(genreData);
+        const genreCounts = Object.values(genreData);
+        new Chart(document.getElementById('genrePie'), {
+            type: 'doughnut',
+            data: {
+                labels: genreLabels,
+                datasets: [{
+                    data: genreCounts,
+                    backgroundColor: [
+                        "#0d6efd", "#6610f2", "#6f42c1", "#d63384", "#fd7e14", "#ffc107", "#198754", "#20c997", "#0dcaf0", "#adb5bd", "#6c757d"
+                    ]
+                }]
+            },
+            options: {
+                plugins: {
+                    legend: { position: 'right' },
+                    tooltip: {
+                        callbacks: {
+                            label: function (context) {
+                                const total = context.dataset.data.reduce((a, b) => a + b, 0);
+                                const count = context.parsed;
+                                const percent = ((count / total) * 100).toFixed(1);
+                                return `${context.label}: ${count} (${percent}%)`;
                             }
                         }
                     }
                 }
-            });
+            }
         });
+    }
 
     // --- Status Pie Chart ---
-    fetch('/stats/statuses')
-        .then(res => res.json())
-        .then(statusData => {
-            new Chart(document.getElementById('statusPie'), {
-                type: 'doughnut',
-                data: {
-                    labels: Object.keys(statusData),
-                    datasets: [{
-                        data: Object.values(statusData),
-                        backgroundColor: ["#0d6efd", "#ffc107", "#6f42c1"]
-                    }]
-                },
-                options: {
-                    cutout: '65%',
-                    plugins: {
-                        legend: { position: 'right' },
-                        tooltip: {
-                            callbacks: {
-                                label: function (context) {
-                                    const total = context.dataset.data.reduce((a, b) => a + b, 0);
-                                    const count = context.parsed;
-                                    const percent = ((count / total) * 100).toFixed(1);
-                                    return `${context.label}: ${count} (${percent}%)`;
-                                }
+    function renderStatuses(statusData) {
+        new Chart(document.getElementById('statusPie'), {
+            type: 'doughnut',
+            data: {
+                labels: Object.keys(statusData),
+                datasets: [{
+                    data: Object.values(statusData),
+                    backgroundColor: ["#0d6efd", "#ffc107", "#6f42c1"]
+                }]
+            },
+            options: {
+                cutout: '65%',
+                plugins: {
+                    legend: { position: 'right' },
+                    tooltip: {
+                        callbacks: {
+                            label: function (context) {
+                                const total = context.dataset.data.reduce((a, b) => a + b, 0);
+                                const count = context.parsed;
+                                const percent = ((count / total) * 100).toFixed(1);
+                                return `${context.label}: ${count} (${percent}%)`;
                             }
                         }
                     }
                 }
-            });
+            }
         });
+    }
 
     // --- Top Authors Bar Chart ---
-    fetch('/stats/authors')
-        .then(res => res.json())
-        .then(authorData => {
-            new Chart(document.getElementById('authorBar'), {
-                type: 'bar',
-                data: {
-                    labels: Object.keys(authorData),
-                    datasets: [{
-                        label: "Books Read",
-                        data: Object.values(authorData),
-                        backgroundColor: "#0d6efd"
-                    }]
-                },
-                options: {
-                    indexAxis: 'y',
-                    scales: {
-                        x: { beginAtZero: true }
-                    }
+    function renderAuthors(authorData) {
+        new Chart(document.getElementById('authorBar'), {
+            type: 'bar',
+            data: {
+                labels: Object.keys(authorData),
+                datasets: [{
+                    label: "Books Read",
+                    data: Object.values(authorData),
+                    backgroundColor: "#0d6efd"
+                }]
+            },
+            options: {
+                indexAxis: 'y',
+                scales: {
+                    x: { beginAtZero: true }
                 }
-            });
+            }
+        });
+    }
+
+    // --- Initial load: every panel from one request ---
+    fetch('/stats/all?range=months')
+        .then(res => res.json())
+        .then(stats => {
+            renderStatCards(stats.summary);
+            drawBooksOverTime('months', stats.books_over_time);
+            drawPagesOverTime('months', stats.pages_over_time);
+            renderGenres(stats.genres);
+            renderStatuses(stats.statuses);
+            renderAuthors(stats.authors);
         });
 });
\ No newline at end of file
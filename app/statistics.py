@@ -0,0 +1,504 @@
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import case, delete, func, select, true, tuple_
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import String
+from .library import insert_or_increment
+from .models import User, UserBook, Book, BookShare, UserStats
+from .routing import primary_reads
+from . import db
+
+# --------- Statistics Query Layer ---------
+
+def summary_query(user_id):
+    # Everything in one statement: the user's library is read once into a CTE,
+    # totals come from conditional aggregation over it, and the "top" picks are
+    # small ORDER BY ... LIMIT 1 subqueries against the same CTE.
+    completed = UserBook.status == 'completed'
+    library = (
+        select(
+            UserBook.id.label('user_book_id'),
+            case((completed, 1), else_=0).label('is_completed'),
+            Book.title,
+            Book.author,
+            Book.genre,
+            Book.page_count,
+        )
+        .join(Book, UserBook.book_id == Book.id)
+        .where(UserBook.user_id == user_id)
+        .cte('library')
+    )
+    lib = library.c
+
+    def most_common(column):
+        return (
+            select(column)
+            .group_by(column)
+            .order_by(func.count().desc(), column)
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    def first_completed(*order_by):
+        return (
+            select(lib.title, lib.page_count)
+            .where(lib.is_completed == 1, lib.page_count != None)
+            .order_by(*order_by, lib.user_book_id)
+            .limit(1)
+            .subquery()
+        )
+
+    totals = (
+        select(
+            func.coalesce(func.sum(lib.is_completed), 0).label('total_books_read'),
+            func.coalesce(func.sum(case((lib.is_completed == 1, lib.page_count))), 0).label('total_pages_read'),
+        )
+        .subquery()
+    )
+    longest = first_completed(lib.page_count.desc())
+    shortest = first_completed(lib.page_count)
+    books_shared = (
+        select(func.count())
+        .select_from(BookShare)
+        .where(BookShare.from_user_id == user_id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            totals.c.total_books_read,
+            totals.c.total_pages_read,
+            most_common(lib.genre).label('favorite_genre'),
+            most_common(lib.author).label('most_read_author'),
+            longest.c.title.label('longest_title'),
+            longest.c.page_count.label('longest_pages'),
+            shortest.c.title.label('shortest_title'),
+            shortest.c.page_count.label('shortest_pages'),
+            books_shared.label('books_shared'),
+        )
+        .select_from(totals)
+        .outerjoin(longest, true())
+        .outerjoin(shortest, true())
+    )
+
+def summary_row(user_id):
+    return db.session.execute(summary_query(user_id)).one()
+
+# --------- Time Bucketing ---------
+# Completion dates are bucketed in SQL so time series transfer one row per
+# bucket. Bucket keys sort chronologically: 'YYYY-Www' (ISO week),
+# 'YYYY-MM' and 'YYYY'.
+
+class time_bucket(FunctionElement):
+    type = String()
+    inherit_cache = True
+    _traverse_internals = FunctionElement._traverse_internals + [
+        ('dimension', InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, dimension, column):
+        self.dimension = dimension
+        super().__init__(column)
+
+@compiles(time_bucket)
+def compile_time_bucket(element, compiler, **kw):
+    raise CompileError(f"time_bucket is not supported on {compiler.dialect.name}")
+
+@compiles(time_bucket, 'sqlite')
+def compile_time_bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    if element.dimension == 'week':
+        # The Thursday of a date's ISO week decides its ISO year and week number.
+        thursday = f"date({column}, 'weekday 0', '-3 days')"
+        return (
+            f"printf('%s-W%02d', strftime('%Y', {thursday}), "
+            f"(CAST(strftime('%j', {thursday}) AS INTEGER) - 1) / 7 + 1)"
+        )
+    fmt = {'month': '%Y-%m', 'year': '%Y'}[element.dimension]
+    return f"strftime('{fmt}', {column})"
+
+@compiles(time_bucket, 'postgresql')
+def compile_time_bucket_postgresql(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    fmt = {'week': 'IYYY-"W"IW', 'month': 'YYYY-MM', 'year': 'YYYY'}[element.dimension]
+    return f"to_char({column}, '{fmt}')"
+
+@compiles(time_bucket, 'mysql')
+def compile_time_bucket_mysql(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    fmt = {'week': '%x-W%v', 'month': '%Y-%m', 'year': '%Y'}[element.dimension]
+    return f"DATE_FORMAT({column}, '{fmt}')"
+
+def completion_series(user_id, dimension):
+    bucket = time_bucket(dimension, UserBook.date_completed).label('bucket')
+    return (
+        db.session.query(bucket, func.count(UserBook.id), func.coalesce(func.sum(Book.page_count), 0))
+        .join(Book, UserBook.book_id == Book.id)
+        .filter(
+            UserBook.user_id == user_id,
+            UserBook.status == 'completed',
+            UserBook.date_completed != None
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+        .all()
+    )
+
+def next_bucket(dimension, bucket):
+    if dimension == 'week':
+        year, week = bucket.split('-W')
+        following = date.fromisocalendar(int(year), int(week), 1) + timedelta(weeks=1)
+        iso_year, iso_week, _ = following.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if dimension == 'month':
+        year, month = (int(part) for part in bucket.split('-'))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return f"{year}-{month:02d}"
+    return f"{int(bucket) + 1}"
+
+def fill_buckets(dimension, values):
+    # values maps bucket -> number; every bucket between the first and last
+    # one is returned, empty periods as 0.
+    if not values:
+        return []
+    bucket, last = min(values), max(values)
+    filled = []
+    while bucket <= last:
+        filled.append((bucket, values.get(bucket, 0)))
+        bucket = next_bucket(dimension, bucket)
+    return filled
+
+# --------- Per-user Rollups ---------
+# UserStats keeps one row per (user, dimension, bucket) so the /stats/*
+# endpoints read a handful of pre-aggregated rows instead of the library.
+# Writes in utils.py pass what they removed/added to update_user_stats(),
+# which applies the deltas inside the caller's transaction as SQL increments,
+# so concurrent writers never lose each other's counts. Writers to one user's
+# rollups first lock that user's row, which keeps a rebuild from deleting
+# rows under a concurrent update (SQLite serialises writers anyway).
+
+TIME_DIMENSIONS = ('week', 'month', 'year')
+EXTREME_DIMENSIONS = ('longest', 'shortest')
+VERSION_KEY = ('meta', 'version')
+
+def completion_buckets(date_completed):
+    iso_year, iso_week, _ = date_completed.isocalendar()
+    return {
+        'week': f"{iso_year}-W{iso_week:02d}",
+        'month': f"{date_completed.year}-{date_completed.month:02d}",
+        'year': f"{date_completed.year}",
+    }
+
+def library_deltas(entry, sign, deltas):
+    book, status, date_completed = entry
+
+    def bump(dimension, bucket, pages=0):
+        counts = deltas[(dimension, bucket)]
+        counts[0] += sign
+        counts[1] += sign * pages
+
+    bump('status', status)
+    bump('genre', book.genre or '')
+    bump('author', book.author or '')
+    if status == 'completed':
+        pages = book.page_count or 0
+        bump('total', '', pages)
+        if date_completed:
+            for dimension, bucket in completion_buckets(date_completed).items():
+                bump(dimension, bucket, pages)
+
+def extreme_book(user_id, dimension):
+    order = Book.page_count.desc() if dimension == 'longest' else Book.page_count
+    return (
+        db.session.query(Book.title, Book.page_count)
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id, UserBook.status == 'completed', Book.page_count != None)
+        .order_by(order, UserBook.id)
+        .first()
+    )
+
+def compute_user_stats(user_id):
+    stats = {}
+    summary = summary_row(user_id)
+    if summary.total_books_read:
+        stats[('total', '')] = (summary.total_books_read, summary.total_pages_read)
+    if summary.books_shared:
+        stats[('shared', '')] = (summary.books_shared, 0)
+    if summary.longest_pages is not None:
+        stats[('longest', summary.longest_title)] = (1, summary.longest_pages)
+        stats[('shortest', summary.shortest_title)] = (1, summary.shortest_pages)
+
+    statuses = (
+        db.session.query(UserBook.status, func.count(UserBook.id))
+        .filter(UserBook.user_id == user_id)
+        .group_by(UserBook.status)
+    )
+    for status, count in statuses:
+        stats[('status', status)] = (count, 0)
+    for dimension, column in (('genre', Book.genre), ('author', Book.author)):
+        key = func.coalesce(column, '')
+        rows = (
+            db.session.query(key, func.count(UserBook.id))
+            .join(UserBook, Book.id == UserBook.book_id)
+            .filter(UserBook.user_id == user_id)
+            .group_by(key)
+        )
+        for bucket, count in rows:
+            stats[(dimension, bucket)] = (count, 0)
+
+    for dimension in TIME_DIMENSIONS:
+        for bucket, books, pages in completion_series(user_id, dimension):
+            stats[(dimension, bucket)] = (books, pages)
+    return stats
+
+STATS_KEY = ['user_id', 'dimension', 'bucket']
+
+def lock_user_stats(user_id):
+    db.session.execute(select(User.id).where(User.id == user_id).with_for_update())
+
+def increment_stats(user_id, deltas):
+    rows = [
+        {'user_id': user_id, 'dimension': dimension, 'bucket': bucket, 'books': books, 'pages': pages}
+        for (dimension, bucket), (books, pages) in deltas.items()
+    ]
+    insert_or_increment(UserStats, rows, STATS_KEY, ('books', 'pages'))
+
+def bump_version(user_id):
+    increment_stats(user_id, {VERSION_KEY: (1, 0)})
+
+def rebuild_user_stats(user_id):
+    lock_user_stats(user_id)
+    dimension, bucket = VERSION_KEY
+    version = (
+        db.session.query(UserStats.books)
+        .filter_by(user_id=user_id, dimension=dimension, bucket=bucket)
+        .scalar() or 0
+    )
+    UserStats.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    rows = [
+        UserStats(user_id=user_id, dimension=dim, bucket=key, books=books, pages=pages)
+        for (dim, key), (books, pages) in compute_user_stats(user_id).items()
+    ]
+    rows.append(UserStats(user_id=user_id, dimension=dimension, bucket=bucket, books=version + 1, pages=0))
+    db.session.add_all(rows)
+    db.session.flush()
+
+def check_user_stats(user_id):
+    stored = {
+        (row.dimension, row.bucket): (row.books, row.pages)
+        for row in UserStats.query.filter(UserStats.user_id == user_id, UserStats.dimension != VERSION_KEY[0])
+    }
+    live = compute_user_stats(user_id)
+    return [
+        (dimension, bucket, stored.get((dimension, bucket)), live.get((dimension, bucket)))
+        for dimension, bucket in sorted(set(stored) | set(live))
+        if stored.get((dimension, bucket)) != live.get((dimension, bucket))
+    ]
+
+def has_user_stats(user_id):
+    dimension, bucket = VERSION_KEY
+    return db.session.query(
+        UserStats.query.filter_by(user_id=user_id, dimension=dimension, bucket=bucket).exists()
+    ).scalar()
+
+def refresh_extremes(user_id, removed, added):
+    changed = [
+        entry for entry in (removed, added)
+        if entry and entry[1] == 'completed' and entry[0].page_count is not None
+    ]
+    if not changed:
+        return
+    stored = {
+        row.dimension: row
+        for row in UserStats.query.filter(
+            UserStats.user_id == user_id, UserStats.dimension.in_(EXTREME_DIMENSIONS)
+        ).populate_existing()
+    }
+    for dimension in EXTREME_DIMENSIONS:
+        row = stored.get(dimension)
+        better = (lambda a, b: a > b) if dimension == 'longest' else (lambda a, b: a < b)
+        recompute = bool(removed in changed and row and removed[0].page_count == row.pages)
+        if not recompute and added in changed:
+            pages = added[0].page_count
+            if row is None or better(pages, row.pages):
+                if row is None:
+                    row = UserStats(user_id=user_id, dimension=dimension, books=1)
+                    db.session.add(row)
+                row.bucket, row.pages = added[0].title, pages
+            elif pages == row.pages:
+                recompute = True
+        if recompute:
+            if row:
+                db.session.delete(row)
+                db.session.flush()
+            extreme = extreme_book(user_id, dimension)
+            if extreme:
+                db.session.add(UserStats(
+                    user_id=user_id, dimension=dimension, bucket=extreme.title, books=1, pages=extreme.page_count
+                ))
+
+def update_user_stats(user_id, removed=None, added=None, shared=0):
+    # removed/added are (book, status, date_completed) tuples describing the
+    # library entry before and after the write.
+    lock_user_stats(user_id)
+    if not has_user_stats(user_id):
+        rebuild_user_stats(user_id)
+        return
+
+    deltas = defaultdict(lambda: [0, 0])
+    if removed:
+        library_deltas(removed, -1, deltas)
+    if added:
+        library_deltas(added, 1, deltas)
+    if shared:
+        deltas[('shared', '')][0] += shared
+    deltas = {key: counts for key, counts in deltas.items() if counts != [0, 0]}
+
+    if deltas:
+        increment_stats(user_id, deltas)
+        db.session.execute(
+            delete(UserStats).where(
+                UserStats.user_id == user_id,
+                tuple_(UserStats.dimension, UserStats.bucket).in_(list(deltas)),
+                UserStats.books <= 0,
+                UserStats.pages <= 0
+            ),
+            execution_options={'synchronize_session': False}
+        )
+
+    refresh_extremes(user_id, removed, added)
+    bump_version(user_id)
+
+def update_book_holders(book_id, previous, book):
+    # A backfilled genre/author/page_count moves every holder's entry from
+    # the book's old values to its new ones. previous and book only need the
+    # title, author, genre and page_count. Holders are locked in id order.
+    entries = db.session.execute(
+        select(UserBook.user_id, UserBook.status, UserBook.date_completed)
+        .where(UserBook.book_id == book_id)
+        .order_by(UserBook.user_id)
+    ).all()
+    for user_id, status, date_completed in entries:
+        update_user_stats(user_id, removed=(previous, status, date_completed), added=(book, status, date_completed))
+    return [user_id for user_id, _, _ in entries]
+
+def stats_select(user_id, dimensions):
+    dimensions = tuple(dimensions) + (VERSION_KEY[0],)
+    return select(UserStats).where(UserStats.user_id == user_id, UserStats.dimension.in_(dimensions))
+
+def group_stats(rows):
+    # None when the version row is missing, i.e. the rollup needs a rebuild.
+    if not any((row.dimension, row.bucket) == VERSION_KEY for row in rows):
+        return None
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.dimension].append(row)
+    return grouped
+
+def read_user_stats(user_id, dimensions):
+    statement = stats_select(user_id, dimensions)
+    grouped = group_stats(db.session.scalars(statement).all())
+    if grouped is None:
+        with primary_reads():
+            rebuild_user_stats(user_id)
+            db.session.commit()
+            grouped = group_stats(db.session.scalars(statement).all())
+    return grouped
+
+# --------- Rollup Views ---------
+# Each view shapes the JSON for one /stats/* panel from rows already returned
+# by read_user_stats(), so /stats/all can build every panel from one read.
+
+SUMMARY_DIMENSIONS = ('total', 'shared', 'genre', 'author', 'longest', 'shortest')
+STATUS_LABELS = {
+    "completed": "Completed",
+    "currently_reading": "Currently Reading",
+    "wishlist": "Wishlist"
+}
+
+STATS_RANGES = ('weeks', 'months', 'years', 'all')
+
+def stats_range(value):
+    # Unknown ranges fall back to months, so request input never reaches an ETag.
+    return value if value in STATS_RANGES else 'months'
+
+def range_dimension(range_type):
+    return {'weeks': 'week', 'months': 'month', 'years': 'year'}.get(range_type, 'year')
+
+def stats_version(stats):
+    rows = stats.get(VERSION_KEY[0])
+    return rows[0].books if rows else None
+
+def current_stats_version(user_id):
+    dimension, bucket = VERSION_KEY
+    return (
+        db.session.query(UserStats.books)
+        .filter_by(user_id=user_id, dimension=dimension, bucket=bucket)
+        .scalar()
+    )
+
+def top_bucket(rows):
+    if not rows:
+        return None
+    return min(rows, key=lambda row: (-row.books, row.bucket)).bucket
+
+def top_10_counts(rows, fallback):
+    counts = defaultdict(int)
+    for row in rows:
+        counts[row.bucket or fallback] += row.books
+    ranked = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+    top_10 = dict(ranked[:10])
+    if len(ranked) > 10:
+        others = sum(count for _, count in ranked[10:])
+        top_10["Other"] = top_10.get("Other", 0) + others
+    return top_10
+
+def bucket_label(dimension, bucket):
+    if dimension == 'week':
+        year, week = bucket.split('-W')
+        return f"{year} W{int(week)}"
+    if dimension == 'month':
+        year, month = bucket.split('-')
+        return f"{calendar.month_abbr[int(month)]} {year}"
+    return bucket
+
+def summary_view(stats):
+    total = stats['total'][0] if stats['total'] else None
+    shared = stats['shared'][0] if stats['shared'] else None
+    longest = stats['longest'][0] if stats['longest'] else None
+    shortest = stats['shortest'][0] if stats['shortest'] else None
+    return {
+        "total_books_read": total.books if total else 0,
+        "total_pages_read": total.pages if total else 0,
+        "favorite_genre": top_bucket(stats['genre']) or None,
+        "most_read_author": top_bucket(stats['author']) or None,
+        "longest_book": {"title": longest.bucket, "pages": longest.pages} if longest else None,
+        "shortest_book": {"title": shortest.bucket, "pages": shortest.pages} if shortest else None,
+        "books_shared": shared.books if shared else 0,
+    }
+
+def series_view(stats, range_type, field):
+    dimension = range_dimension(range_type)
+    values = {row.bucket: getattr(row, field) for row in stats[dimension]}
+    if range_type not in ('weeks', 'months', 'years'):  # 'all'
+        return {
+            "labels": ["All Time"],
+            "data": [sum(values.values())]
+        }
+    series = fill_buckets(dimension, values)
+    return {
+        "labels": [bucket_label(dimension, bucket) for bucket, _ in series],
+        "data": [value for _, value in series]
+    }
+
+def genre_view(stats):
+    return top_10_counts(stats['genre'], "Other")
+
+def status_view(stats):
+    return {STATUS_LABELS.get(row.bucket, row.bucket.title()): row.books for row in stats['status']}
+
+def author_view(stats):
+    return top_10_counts(stats['author'], "Unknown")
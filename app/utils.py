@@ -1,45 +1,84 @@
 import re
-import calendar
-from collections import defaultdict
 from datetime import datetime, timezone
-from sqlalchemy import desc, func
-from werkzeug.security import generate_password_hash, check_password_hash
-from .models import User, UserBook, Book, BookShare
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from .models import User, UserBook, Book, BookShare, username_key
+from .cache import response_cache
+from .google_books import google_books
+from .passwords import password_hasher
+from .search import book_search
+from .importer import IMPORT_FORMATS, UNREADABLE, import_library, read_import
+from .export import library_export
+from .community import (
+    feed_page, feed_offset_page, encode_cursor, decode_cursor, fan_out_share
+)
+from .dashboard import dashboard_summary
+from .routing import replica_read
+from .library import library_entries, library_rows, upsert_book, upsert_user_book, BOOK_FIELDS
+from .statistics import (
+    update_user_stats, update_book_holders, read_user_stats,
+    current_stats_version, stats_version, range_dimension, SUMMARY_DIMENSIONS,
+    summary_view, series_view, genre_view, status_view, author_view
+)
 from . import db
 
 # --------- Registration & Login Utilities ---------
+# Uniqueness is checked with one lookup over the username and email indexes,
+# but the unique constraints have the final say: a sign-up that loses a race
+# after passing validation is turned back into the same form errors.
+
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@([\w-]+\.)+[\w-]{2,4}$')
+PASSWORD_RULES = (
+    (re.compile(r'[a-z]'), 'Password must contain a lowercase letter'),
+    (re.compile(r'[A-Z]'), 'Password must contain an uppercase letter'),
+    (re.compile(r'\d'), 'Password must contain a number'),
+)
+
+def taken_fields(username, email):
+    conditions = []
+    if username:
+        conditions.append(User.username == username)
+    if email:
+        conditions.append(User.email == email)
+    if not conditions:
+        return {}
+    errors = {}
+    for taken_username, taken_email in db.session.execute(
+        select(User.username, User.email).where(or_(*conditions)).limit(2)
+    ):
+        if username and taken_username == username:
+            errors['username'] = ['Username already exists']
+        if email and taken_email == email:
+            errors['email'] = ['Email already exists']
+    return errors
 
 def validate_registration_form(form):
     errors = {'username': [], 'email': [], 'password': [], 'confirm_password': []}
     username = form.username.data
     email = form.email.data
-    password = form.password.data
+    password = form.password.data or ''
     confirm_password = form.confirm_password.data
 
     if not username:
         errors['username'].append('Username is required')
     elif len(username) < 5:
         errors['username'].append('Username must be at least 5 characters')
-    if User.query.filter_by(username=username).first():
-        errors['username'].append('Username already exists')
 
     if not email:
         errors['email'].append('Email is required')
-    elif not re.match(r'^[\w\.-]+@([\w-]+\.)+[\w-]{2,4}$', email):
+    elif not EMAIL_PATTERN.match(email):
         errors['email'].append('Invalid email address')
-    if User.query.filter_by(email=email).first():
-        errors['email'].append('Email already exists')
+
+    for field, messages in taken_fields(username, email).items():
+        errors[field].extend(messages)
 
     if not password:
         errors['password'].append('Password is required')
     elif len(password) < 6:
         errors['password'].append('Password must be at least 6 characters')
-    if not re.match(r'.*[a-z].*', password):
-        errors['password'].append('Password must contain a lowercase letter')
-    if not re.match(r'.*[A-Z].*', password):
-        errors['password'].append('Password must contain an uppercase letter')
-    if not re.match(r'.*\d.*', password):
-        errors['password'].append('Password must contain a number')
+    for pattern, message in PASSWORD_RULES:
+        if not pattern.search(password):
+            errors['password'].append(message)
 
     if not confirm_password:
         errors['confirm_password'].append('Must confirm password')
@@ -50,119 +89,195 @@ def validate_registration_form(form):
     return (not errors), errors
 
 def register_user(form):
-    hashed_pw = generate_password_hash(form.password.data)
+    # Returns (True, user), or (False, errors) if another sign-up took the
+    # username or email after validation.
+    hashed_pw = password_hasher.hash(form.password.data)
     user = User(email=form.email.data, username=form.username.data, password=hashed_pw)
     db.session.add(user)
-    db.session.commit()
-    return user
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        errors = taken_fields(form.username.data, form.email.data)
+        if not errors:
+            raise
+        return False, errors
+    return True, user
 
 def validate_login_form(form):
     user = User.query.filter_by(username=form.username.data).first()
-    if user and check_password_hash(user.password, form.password.data):
-        return True, user
-    else:
+    if not user:
         return False, None
+    matches, new_hash = password_hasher.check(user.password, form.password.data)
+    if not matches:
+        return False, None
+    if new_hash is not None:
+        user.password = new_hash
+        db.session.commit()
+    return True, user
 
 # --------- User Utilities ---------
 
-def get_all_usernames(exclude_user_id):
-    users = User.query.filter(User.id != exclude_user_id).all()
-    return [user.username for user in users]
+MAX_CODE_POINT = 0x10FFFF
+SURROGATES = range(0xD800, 0xE000)
+
+def prefix_upper_bound(prefix):
+    # The smallest string above every string starting with prefix, or None
+    # when there is none (the prefix is all U+10FFFF). Surrogates cannot be
+    # stored, so the bound steps over them.
+    prefix = prefix.rstrip(chr(MAX_CODE_POINT))
+    if not prefix:
+        return None
+    code_point = ord(prefix[-1]) + 1
+    if code_point in SURROGATES:
+        code_point = SURROGATES.stop
+    return prefix[:-1] + chr(code_point)
+
+@replica_read
+def search_usernames(prefix, exclude_user_id, limit=8):
+    # A range on the case-folded username_lower rather than LIKE so the
+    # index ix_user_username_lower serves it on every backend.
+    limit = min(max(limit, 1), 25)
+    key = User.username_lower
+    query = db.session.query(User.username).filter(User.id != exclude_user_id)
+    prefix = username_key(prefix)
+    if prefix:
+        query = query.filter(key >= prefix)
+        upper = prefix_upper_bound(prefix)
+        if upper is not None:
+            query = query.filter(key < upper)
+    usernames = [username for username, in query.order_by(key).limit(limit + 1)]
+    return {'usernames': usernames[:limit], 'has_more': len(usernames) > limit}
+
+# --------- Book Catalogue Utilities ---------
+
+GOOGLE_ID_PATTERN = re.compile(r'^[\w-]{1,64}$')
+SEARCH_ORDERS = ('relevance', 'newest')
+
+MAX_QUERY_LENGTH = 200
+MAX_START_INDEX = 400
+
+def check_catalogue_rate(user_id, remote_addr):
+    # Raises RateLimited once the user, or the address when signed out, has
+    # used up its share of catalogue requests.
+    google_books.check_rate(f"user:{user_id}" if user_id is not None else f"addr:{remote_addr}")
+
+def search_catalogue(query, max_results=20, order_by='relevance', start_index=0):
+    max_results = min(max(max_results, 1), 40)
+    order_by = order_by if order_by in SEARCH_ORDERS else 'relevance'
+    start_index = min(max(start_index, 0), MAX_START_INDEX)
+    return google_books.search(query[:MAX_QUERY_LENGTH], max_results, order_by, start_index)
+
+def get_catalogue_volume(google_id):
+    if not GOOGLE_ID_PATTERN.match(google_id):
+        return None
+    return google_books.volume(google_id)
+
+def search_books(query, limit=20):
+    limit = min(max(limit, 1), 50)
+    ranked = book_search.search(query, limit)
+    if not ranked:
+        return []
+    books = {book.id: book for book in Book.query.filter(Book.id.in_([book_id for book_id, _ in ranked]))}
+    return [{
+        "google_id": books[book_id].google_id or "",
+        "title": books[book_id].title,
+        "author": books[book_id].author,
+        "genre": books[book_id].genre,
+        "cover_url": books[book_id].cover_url,
+        "page_count": books[book_id].page_count,
+        "score": round(score, 4)
+    } for book_id, score in ranked if book_id in books]
 
 # --------- Library Utilities ---------
 
+@replica_read
 def get_user_library_books(user_id):
-    user_books = UserBook.query.filter_by(user_id=user_id).all()
-    return user_books
+    return library_entries(user_id)
+
+@replica_read
+def get_user_library_items(user_id):
+    rows = library_rows(
+        user_id,
+        UserBook.id, UserBook.status,
+        Book.title, Book.author, Book.cover_url
+    )
+    return [{
+        "id": row.id,
+        "title": row.title,
+        "author": row.author,
+        "cover_url": row.cover_url,
+        "status": row.status
+    } for row in rows]
+
+USER_BOOK_COLUMNS = (
+    Book.google_id, Book.title, Book.author, Book.genre, Book.cover_url,
+    UserBook.status, UserBook.date_added, UserBook.date_completed
+)
+
+def serialize_user_book(row):
+    return {
+        "google_id": row.google_id or "",
+        "title": row.title,
+        "author": row.author,
+        "genre": row.genre,
+        "cover_url": row.cover_url or "https://via.placeholder.com/60x90?text=No+Cover",
+        "status": row.status,
+        "date_added": row.date_added.isoformat() if row.date_added else "",
+        "date_completed": row.date_completed.isoformat() if row.date_completed else ""
+    }
 
+@replica_read
 def get_user_books(user_id):
-    return [{
-        "google_id": ub.book.google_id or "",
-        "title": ub.book.title,
-        "author": ub.book.author,
-        "genre": ub.book.genre,
-        "cover_url": ub.book.cover_url or "https://via.placeholder.com/60x90?text=No+Cover",
-        "status": ub.status,
-        "date_added": ub.date_added.isoformat() if ub.date_added else "",
-        "date_completed": ub.date_completed.isoformat() if ub.date_completed else ""
-    } for ub in UserBook.query.filter_by(user_id=user_id)]
+    return [serialize_user_book(row) for row in library_rows(user_id, *USER_BOOK_COLUMNS)]
 
 def add_book_to_library(user_id, data):
-    google_id = data.get('google_id')
-    title = data.get('title')
-    author = data.get('author')
-    description = data.get('description')
-    cover_url = data.get('cover_url')
     status = data.get('status')
-    genre = data.get('genre')
-    page_count = data.get('page_count')
-
-    book = Book.query.filter_by(google_id=google_id).first()
-    if not book:
-        book = Book(
-            google_id=google_id,
-            title=title,
-            author=author,
-            description=description,
-            cover_url=cover_url,
-            genre=genre,
-            page_count=page_count
-        )
-        db.session.add(book)
-        db.session.commit()
-    else:
-        updated = False
-        if not book.title and title:
-            book.title = title
-            updated = True
-        if not book.author and author:
-            book.author = author
-            updated = True
-        if not book.description and description:
-            book.description = description
-            updated = True
-        if not book.cover_url and cover_url:
-            book.cover_url = cover_url
-            updated = True
-        if not book.genre and genre:
-            book.genre = genre
-            updated = True
-        if not book.page_count and page_count:
-            book.page_count = page_count
-            updated = True
-        if updated:
-            db.session.commit()
-
-    userbook = UserBook.query.filter_by(user_id=user_id, book_id=book.id).first()
-    message = "Book status updated in your library!" if userbook else "Book added to your library!"
-    if userbook:
-        userbook.status = status
-        if status == "completed":
-            userbook.date_completed = datetime.now(timezone.utc)
-        else:
-            userbook.date_completed = None
-    else:
-        date_completed = datetime.now(timezone.utc) if status == "completed" else None
-        db.session.add(UserBook(
-            user_id=user_id,
-            book_id=book.id,
-            status=status,
-            date_completed=date_completed
-        ))
+    book_id, created, original = upsert_book(
+        data.get('google_id'), {field: data.get(field) for field in BOOK_FIELDS}
+    )
+    book = db.session.get(Book, book_id)
+    holders = []
+    if created or original:
+        book_search.index_books([book])
+    if original:
+        holders = update_book_holders(book_id, original, book)
+
+    date_completed = datetime.now(timezone.utc) if status == "completed" else None
+    previous = upsert_user_book(user_id, book_id, status, date_completed)
+    removed = (book, *previous) if previous else None
+    update_user_stats(user_id, removed=removed, added=(book, status, date_completed))
     db.session.commit()
+    response_cache.bump(user_id, *holders)
+    message = "Book status updated in your library!" if previous else "Book added to your library!"
     return {"success": True, "message": message}
 
 def delete_book_from_library(user_id, user_book_id):
-    user_book = UserBook.query.get(user_book_id)
+    user_book = db.session.get(UserBook, user_book_id)
     if not user_book or user_book.user_id != user_id:
         return {'error': 'Unauthorized'}, 403
+    removed = (user_book.book, user_book.status, user_book.date_completed)
     db.session.delete(user_book)
+    update_user_stats(user_id, removed=removed)
     db.session.commit()
+    response_cache.bump(user_id)
     return {'success': True}, 200
 
+def import_library_upload(user_id, upload, import_format=None):
+    if import_format and import_format not in IMPORT_FORMATS:
+        return {'error': f"Unknown format, expected one of {', '.join(IMPORT_FORMATS)}"}, 400
+    try:
+        rows = read_import(upload.stream, upload.filename or '', import_format)
+        return import_library(user_id, rows), 200
+    except UNREADABLE as error:
+        return {'error': f"Could not read the file, it must be UTF-8 CSV or JSON Lines ({error})"}, 400
+
+def export_user_library(user_id, export_format='csv'):
+    return library_export(user_id, export_format)
+
 # --------- Book Sharing Utilities ---------
 
-def share_book_with_user(from_user_id, book_id, to_username, status):
+def share_book_with_user(from_user_id, book_id, to_username, status, from_username=None):
     if not book_id or not to_username or not status:
         return {'success': False, 'message': 'Missing data.'}, 400
 
@@ -177,255 +292,122 @@ def share_book_with_user(from_user_id, book_id, to_username, status):
     if not user_book:
         return {'success': False, 'message': 'Book not found in your library.'}, 404
 
+    if from_username is None:
+        from_username = db.session.get(User, from_user_id).username
+
     share = BookShare(
         from_user_id=from_user_id,
         to_user_id=to_user.id,
         book_id=user_book.book_id,
-        status=status
+        status=status,
+        timestamp=datetime.now(timezone.utc)
     )
     db.session.add(share)
+    fan_out_share(share, user_book.book, from_username, to_user.username)
+    update_user_stats(from_user_id, shared=1)
     db.session.commit()
+    response_cache.bump(from_user_id, to_user.id)
     return {'success': True, 'message': f'Shared "{user_book.book.title}" with {to_username}.'}, 200
 
-def get_community_feed(user_id, page=1, per_page=10):
-    shares = BookShare.query.filter(
-        (BookShare.from_user_id == user_id) | (BookShare.to_user_id == user_id)
-    ).order_by(BookShare.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
-
-    feed = []
-    for share in shares.items:
-        book = share.book
-        feed.append({
-            'title': book.title,
-            'cover_url': book.cover_url,
-            'status': share.status.title(),
-            'from_username': share.from_user.username,
-            'to_username': share.to_user.username,
-            'timestamp': share.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'google_id': book.google_id
-        })
+def serialize_feed_item(item):
+    return {
+        'title': item.title,
+        'cover_url': item.cover_url,
+        'status': item.status.title(),
+        'from_username': item.from_username,
+        'to_username': item.to_username,
+        'timestamp': item.timestamp.strftime('%Y-%m-%d %H:%M'),
+        'google_id': item.google_id
+    }
 
+@replica_read
+def get_community_feed(user_id, page=1, per_page=10):
+    items = feed_offset_page(user_id, page, per_page)
     return {
-        'feed': feed,
-        'has_next': shares.has_next,
-        'has_prev': shares.has_prev,
-        'page': shares.page,
-        'pages': shares.pages
+        'feed': [serialize_feed_item(item) for item in items.items],
+        'has_next': items.has_next,
+        'has_prev': items.has_prev,
+        'page': items.page,
+        'pages': items.pages
     }
 
-# --------- Statistics Utilities ---------
+@replica_read
+def get_community_feed_page(user_id, cursor=None, per_page=10):
+    after = decode_cursor(cursor) if cursor else None
+    return feed_page_view(*feed_page(user_id, after, per_page))
 
-def get_stats_summary(user_id):
-    total_books_read = (
-        db.session.query(func.count(UserBook.id))
-        .filter(UserBook.user_id == user_id, UserBook.status == 'completed')
-        .scalar()
-    )
-    total_pages_read = (
-        db.session.query(func.sum(Book.page_count))
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id, UserBook.status == 'completed')
-        .scalar() or 0
-    )
-    genre_result = (
-        db.session.query(Book.genre, func.count(Book.id))
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id)
-        .group_by(Book.genre)
-        .order_by(desc(func.count(Book.id)))
-        .first()
-    )
-    favorite_genre = genre_result[0] if genre_result else None
-
-    author_result = (
-        db.session.query(Book.author, func.count(Book.id))
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id)
-        .group_by(Book.author)
-        .order_by(desc(func.count(Book.id)))
-        .first()
-    )
-    most_read_author = author_result[0] if author_result else None
-
-    longest = (
-        db.session.query(Book.title, Book.page_count)
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id, UserBook.status == 'completed', Book.page_count != None)
-        .order_by(desc(Book.page_count))
-        .first()
-    )
-    longest_book = {"title": longest[0], "pages": longest[1]} if longest else None
-
-    shortest = (
-        db.session.query(Book.title, Book.page_count)
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id, UserBook.status == 'completed', Book.page_count != None)
-        .order_by(Book.page_count)
-        .first()
-    )
-    shortest_book = {"title": shortest[0], "pages": shortest[1]} if shortest else None
+def feed_page_view(items, next_after):
+    return {
+        'feed': [serialize_feed_item(item) for item in items],
+        'has_next': next_after is not None,
+        'next_cursor': encode_cursor(next_after) if next_after is not None else None
+    }
 
-    books_shared = (
-        db.session.query(func.count())
-        .select_from(BookShare)
-        .filter(BookShare.from_user_id == user_id)
-        .scalar()
+# --------- Dashboard Utilities ---------
+
+@replica_read
+def get_dashboard_summary(user_id, inline_items=0):
+    has_feed, has_currently_reading, feed, reading = dashboard_summary(user_id, inline_items)
+    books, more_reading = reading
+    return dict(
+        feed_page_view(*feed),
+        has_feed=has_feed,
+        has_currently_reading=has_currently_reading,
+        currently_reading=[{
+            'google_id': row.google_id,
+            'title': row.title,
+            'author': row.author,
+            'cover_url': row.cover_url
+        } for row in books],
+        more_currently_reading=more_reading
     )
 
-    return {
-        "total_books_read": total_books_read or 0,
-        "total_pages_read": total_pages_read or 0,
-        "favorite_genre": favorite_genre,
-        "most_read_author": most_read_author,
-        "longest_book": longest_book,
-        "shortest_book": shortest_book,
-        "books_shared": books_shared or 0,
-    }
+# --------- Statistics Utilities ---------
 
+@replica_read
+def get_stats_summary(user_id):
+    return summary_view(read_user_stats(user_id, SUMMARY_DIMENSIONS))
+
+@replica_read
 def get_books_over_time(user_id, range_type='months'):
-    query = (
-        db.session.query(UserBook.date_completed)
-        .filter(
-            UserBook.user_id == user_id,
-            UserBook.status == 'completed',
-            UserBook.date_completed != None
-        )
-    )
-    dates = [ub.date_completed for ub in query if ub.date_completed]
-    data = {}
-    if range_type == 'weeks':
-        week_counts = defaultdict(int)
-        for d in dates:
-            year, week, _ = d.isocalendar()
-            key = f"{year} W{week}"
-            week_counts[key] += 1
-        sorted_weeks = sorted(week_counts.items())
-        data = {
-            "labels": [k for k, _ in sorted_weeks],
-            "data": [v for _, v in sorted_weeks]
-        }
-    elif range_type == 'months':
-        month_counts = defaultdict(int)
-        for d in dates:
-            key = f"{calendar.month_abbr[d.month]} {d.year}"
-            month_counts[key] += 1
-        sorted_months = sorted(month_counts.items(), key=lambda x: (int(x[0].split()[1]), list(calendar.month_abbr).index(x[0].split()[0])))
-        data = {
-            "labels": [k for k, _ in sorted_months],
-            "data": [v for _, v in sorted_months]
-        }
-    elif range_type == 'years':
-        year_counts = defaultdict(int)
-        for d in dates:
-            year_counts[str(d.year)] += 1
-        sorted_years = sorted(year_counts.items())
-        data = {
-            "labels": [k for k, _ in sorted_years],
-            "data": [v for _, v in sorted_years]
-        }
-    else:  # 'all'
-        data = {
-            "labels": ["All Time"],
-            "data": [len(dates)]
-        }
-    return data
+    stats = read_user_stats(user_id, (range_dimension(range_type),))
+    return series_view(stats, range_type, 'books')
 
+@replica_read
 def get_pages_over_time(user_id, range_type='months'):
-    query = (
-        db.session.query(UserBook.date_completed, Book.page_count)
-        .join(Book, UserBook.book_id == Book.id)
-        .filter(
-            UserBook.user_id == user_id,
-            UserBook.status == 'completed',
-            UserBook.date_completed != None,
-            Book.page_count != None
-        )
-    )
-    data = {}
-    if range_type == 'weeks':
-        week_counts = defaultdict(int)
-        for d, pages in query:
-            if d:
-                year, week, _ = d.isocalendar()
-                key = f"{year} W{week}"
-                week_counts[key] += pages or 0
-        sorted_weeks = sorted(week_counts.items())
-        data = {
-            "labels": [k for k, _ in sorted_weeks],
-            "data": [v for _, v in sorted_weeks]
-        }
-    elif range_type == 'months':
-        month_counts = defaultdict(int)
-        for d, pages in query:
-            if d:
-                key = f"{calendar.month_abbr[d.month]} {d.year}"
-                month_counts[key] += pages or 0
-        sorted_months = sorted(month_counts.items(), key=lambda x: (int(x[0].split()[1]), list(calendar.month_abbr).index(x[0].split()[0])))
-        data = {
-            "labels": [k for k, _ in sorted_months],
-            "data": [v for _, v in sorted_months]
-        }
-    elif range_type == 'years':
-        year_counts = defaultdict(int)
-        for d, pages in query:
-            if d:
-                year_counts[str(d.year)] += pages or 0
-        sorted_years = sorted(year_counts.items())
-        data = {
-            "labels": [k for k, _ in sorted_years],
-            "data": [v for _, v in sorted_years]
-        }
-    else:  # 'all'
-        total = sum(pages or 0 for _, pages in query)
-        data = {
-            "labels": ["All Time"],
-            "data": [total]
-        }
-    return data
+    stats = read_user_stats(user_id, (range_dimension(range_type),))
+    return series_view(stats, range_type, 'pages')
 
+@replica_read
 def get_genre_stats(user_id):
-    results = (
-        db.session.query(Book.genre, func.count(Book.id))
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id)
-        .group_by(Book.genre)
-        .all()
-    )
-    genre_counts = {genre or "Other": count for genre, count in results}
-    sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
-    top_10 = dict(sorted_genres[:10])
-    if len(sorted_genres) > 10:
-        others = sum(count for _, count in sorted_genres[10:])
-        top_10["Other"] = top_10.get("Other", 0) + others
-    return top_10
+    return genre_view(read_user_stats(user_id, ('genre',)))
 
+@replica_read
 def get_status_stats(user_id):
-    results = (
-        db.session.query(UserBook.status, func.count(UserBook.id))
-        .filter(UserBook.user_id == user_id)
-        .group_by(UserBook.status)
-        .all()
-    )
-    status_map = {
-        "completed": "Completed",
-        "currently_reading": "Currently Reading",
-        "wishlist": "Wishlist"
-    }
-    status_counts = {status_map.get(status, status.title()): count for status, count in results}
-    return status_counts
+    return status_view(read_user_stats(user_id, ('status',)))
 
+@replica_read
 def get_author_stats(user_id):
-    results = (
-        db.session.query(Book.author, func.count(Book.id))
-        .join(UserBook, Book.id == UserBook.book_id)
-        .filter(UserBook.user_id == user_id)
-        .group_by(Book.author)
-        .all()
-    )
-    author_counts = {author or "Unknown": count for author, count in results}
-    sorted_authors = sorted(author_counts.items(), key=lambda x: x[1], reverse=True)
-    top_10 = dict(sorted_authors[:10])
-    if len(sorted_authors) > 10:
-        others = sum(count for _, count in sorted_authors[10:])
-        top_10["Other"] = top_10.get("Other", 0) + others
-    return top_10
+    return author_view(read_user_stats(user_id, ('author',)))
+
+@replica_read
+def get_stats_version(user_id):
+    return current_stats_version(user_id)
+
+@replica_read
+def get_all_stats(user_id, range_type='months'):
+    stats = read_user_stats(user_id, all_stats_dimensions(range_type))
+    return all_stats_view(stats, range_type), stats_version(stats)
+
+def all_stats_dimensions(range_type):
+    return SUMMARY_DIMENSIONS + ('status', range_dimension(range_type))
+
+def all_stats_view(stats, range_type):
+    return {
+        "summary": summary_view(stats),
+        "books_over_time": series_view(stats, range_type, 'books'),
+        "pages_over_time": series_view(stats, range_type, 'pages'),
+        "genres": genre_view(stats),
+        "statuses": status_view(stats),
+        "authors": author_view(stats),
+    }
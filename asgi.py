@@ -0,0 +1,10 @@
+# ASGI entry point. The JSON read endpoints run as async views on the event
+# loop; every other request is served by the Flask app on a thread pool.
+#
+#   uvicorn asgi:app --workers 4
+
+from app import create_app
+from app.asgi import AsyncAPI
+from config import DeploymentConfig
+
+app = AsyncAPI(create_app(DeploymentConfig))
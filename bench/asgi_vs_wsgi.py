@@ -0,0 +1,123 @@
+# Concurrent throughput of the JSON read endpoints through the Flask app on
+# a thread pool (what a WSGI server does, here via a2wsgi) against the async
+# views in app/asgi.py. Both run in-process behind the same ASGI driver, so
+# the comparison leaves out the network and the server. The response cache is
+# off so every request reaches the database; "books" mode swaps in a Google
+# Books client that takes upstream_ms per call to model a slow upstream.
+#
+#   python -m bench.asgi_vs_wsgi [requests] [upstream_ms]
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from a2wsgi import WSGIMiddleware
+from app import db
+from app.asgi import AsyncAPI
+from app.cache import NullCache, response_cache
+from app.google_books import google_books
+from bench.dataset import CannedBooksClient, generate, make_app
+
+CONCURRENCY = (1, 16, 64)
+DB_URLS = ["/my_books", "/community_feed", "/stats/all?range=months", "/stats/summary"]
+
+class SlowBooksClient(CannedBooksClient):
+    def __init__(self, upstream_ms):
+        self.upstream_ms = upstream_ms
+
+    def get(self, url):
+        time.sleep(self.upstream_ms / 1000)
+        return super().get(url)
+
+async def call(app, url, cookie):
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "server": ("localhost", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(b"cookie", cookie.encode())],
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+async def load(app, requests, concurrency, pick):
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(pick(i))
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            url, cookie = queue.get_nowait()
+            started = time.perf_counter()
+            if await call(app, url, cookie) != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95)], errors
+
+def cookies_for(flask_app, user_ids):
+    cookies = {}
+    for user_id in user_ids:
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(user_id)
+        cookies[user_id] = f"session={client.get_cookie('session').value}"
+    return cookies
+
+async def compare(flask_app, data, requests, upstream_ms):
+    rng = random.Random(3)
+    users = rng.choices(data.user_ids, data.weights, k=requests)
+    cookies = cookies_for(flask_app, set(users))
+    modes = {
+        "db": lambda i: (DB_URLS[i % len(DB_URLS)], cookies[users[i]]),
+        # A distinct query each time so every call goes upstream.
+        "books": lambda i: (f"/api/books/search?q=slow{i}", cookies[users[i]]),
+    }
+    apps = {"wsgi": WSGIMiddleware(flask_app, workers=flask_app.config["ASYNC_FALLBACK_WORKERS"]), "asgi": AsyncAPI(flask_app)}
+    try:
+        for mode, pick in modes.items():
+            with flask_app.app_context():
+                google_books.use_client(SlowBooksClient(upstream_ms) if mode == "books" else CannedBooksClient())
+            count = requests if mode == "db" else requests // 4
+            for concurrency in CONCURRENCY:
+                for name, app in apps.items():
+                    with flask_app.app_context():
+                        google_books.proxy.store.purge(time.time() + 10 ** 9)
+                    rps, p50, p95, errors = await load(app, count, concurrency, pick)
+                    print(f"{mode:<5} {name:<4} c={concurrency:<3} {rps:8.1f} req/s  p50 {p50 * 1000:8.2f} ms  "
+                          f"p95 {p95 * 1000:8.2f} ms  errors {errors}")
+    finally:
+        await apps["asgi"].close()
+
+def main(requests=800, upstream_ms=50):
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = make_app(os.path.join(tmp, "bench.db"))
+        with flask_app.app_context():
+            db.create_all()
+            data = generate()
+            response_cache.use(NullCache())
+            db.session.remove()
+        asyncio.run(compare(flask_app, data, requests, upstream_ms))
+        with flask_app.app_context():
+            db.engine.dispose()
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,120 @@
+# Deterministic dataset for the benchmark suite: the same arguments always
+# produce the same rows. Library sizes, book popularity and the share graph
+# follow a Zipf-like skew, so a few heavy readers own most of the rows and
+# send and receive most of the shares, as in a real community.
+
+import json
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.models import Book, BookShare, User, UserBook
+from app.community import backfill_activity_feed
+from app.search import book_search
+from app.statistics import rebuild_user_stats
+from config import TestingConfig
+
+PASSWORD = "Password1"
+STATUSES = ["completed", "currently_reading", "wishlist"]
+STATUS_WEIGHTS = [6, 1, 3]
+GENRES = ["Fiction", "Fantasy", "Mystery", "Romance", "History", "Science", "Poetry", "Horror", None]
+GENRE_WEIGHTS = [30, 20, 15, 12, 8, 6, 3, 3, 3]
+WORDS = [
+    "silent", "river", "winter", "garden", "shadow", "empire", "stone", "glass", "night", "harbor",
+    "crown", "forest", "letters", "house", "ember", "tide", "orchard", "map", "iron", "lantern",
+]
+START = datetime(2020, 1, 1)
+
+def make_app(path):
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + path
+        SECRET_KEY = "bench"
+        WTF_CSRF_ENABLED = False
+        SQL_SLOW_QUERY_MS = None
+    return create_app(BenchConfig)
+
+class CannedBooksClient:
+    # Stands in for the Google Books API so catalogue lookups measure the
+    # proxy and its cache rather than the network.
+    def get(self, url):
+        return 200, json.dumps({"totalItems": 1, "items": [{"id": "bench0", "volumeInfo": {"title": "Bench"}}]}).encode()
+
+def zipf_weights(n, exponent=1.1):
+    return [1 / rank ** exponent for rank in range(1, n + 1)]
+
+def generate(users=200, books=5000, library_rows=20000, shares=2000, seed=42):
+    rng = random.Random(seed)
+    password = generate_password_hash(PASSWORD)
+    db.session.execute(insert(User), [
+        {"username": f"reader{i:05d}", "email": f"reader{i}@example.com", "password": password}
+        for i in range(users)
+    ])
+    db.session.execute(insert(Book), [{
+        "google_id": f"bench{i}",
+        "title": f"The {rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+        "author": f"Author {int(rng.paretovariate(1.2)) % 800}",
+        "genre": rng.choices(GENRES, GENRE_WEIGHTS)[0],
+        "description": " ".join(rng.choices(WORDS, k=12)),
+        "cover_url": f"https://covers.example.com/{i}.jpg",
+        "page_count": rng.choice([None, rng.randrange(60, 1200)]),
+    } for i in range(books)])
+    user_ids = list(db.session.scalars(select(User.id).order_by(User.id)))
+    book_ids = list(db.session.scalars(select(Book.id).order_by(Book.id)))
+
+    # User i is the i-th heaviest reader; popular books are popular for
+    # everyone. Duplicate (user, book) draws are dropped, so heavy users end
+    # up a little below their share of library_rows.
+    owners = rng.choices(user_ids, zipf_weights(users), k=library_rows)
+    titles = rng.choices(book_ids, zipf_weights(books, 0.8), k=library_rows)
+    libraries, rows = {}, []
+    for i, (user_id, book_id) in enumerate(zip(owners, titles)):
+        if book_id in libraries.setdefault(user_id, set()):
+            continue
+        libraries[user_id].add(book_id)
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        added = START + timedelta(minutes=37 * i)
+        rows.append({
+            "user_id": user_id,
+            "book_id": book_id,
+            "status": status,
+            "date_added": added,
+            "date_completed": added + timedelta(days=rng.randrange(1, 60)) if status == "completed" else None,
+        })
+    db.session.execute(insert(UserBook), rows)
+
+    senders = rng.choices(user_ids, zipf_weights(users), k=shares)
+    recipients = rng.choices(list(reversed(user_ids)), zipf_weights(users, 0.7), k=shares)
+    share_rows = []
+    for i, (from_id, to_id) in enumerate(zip(senders, recipients)):
+        if from_id == to_id or not libraries.get(from_id):
+            continue
+        share_rows.append({
+            "from_user_id": from_id,
+            "to_user_id": to_id,
+            "book_id": rng.choice(sorted(libraries[from_id])),
+            "status": rng.choices(STATUSES, STATUS_WEIGHTS)[0],
+            "timestamp": START + timedelta(minutes=53 * i),
+        })
+    if share_rows:
+        db.session.execute(insert(BookShare), share_rows)
+    db.session.commit()
+
+    backfill_activity_feed()
+    for user_id in user_ids:
+        rebuild_user_stats(user_id)
+    book_search.rebuild()
+    db.session.commit()
+
+    by_size = sorted(user_ids, key=lambda user_id: (-len(libraries.get(user_id, ())), user_id))
+    usernames = dict(db.session.execute(select(User.id, User.username)).all())
+    return SimpleNamespace(
+        user_ids=user_ids,
+        weights=zipf_weights(users),
+        heavy_user=by_size[0],
+        typical_user=by_size[len(by_size) // 2],
+        usernames=usernames,
+        library_rows=len(rows),
+        shares=len(share_rows),
+    )
@@ -0,0 +1,121 @@
+# End-to-end load profile for the JSON endpoints through the Flask test
+# client, so routing, login, the response cache and serialisation are all in
+# the measured path. Requests are drawn from a weighted mix by a seeded RNG
+# and users are picked with the dataset's skew, so a given request count
+# always replays the same sequence of requests.
+#
+#   python -m bench.load [requests]
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from sqlalchemy import event, select
+from app import db
+from app.google_books import google_books
+from app.models import UserBook
+from bench.dataset import CannedBooksClient, generate, make_app
+
+# (weight, name, method, path, body) where path and body are built from
+# (rng, data, user_id, user_book_ids).
+MIX = [
+    (14, "my_books", "GET", lambda rng, data, uid, ubs: "/my_books", None),
+    (8, "my_library_books", "GET", lambda rng, data, uid, ubs: "/my_library_books", None),
+    (12, "community_feed", "GET", lambda rng, data, uid, ubs: "/community_feed", None),
+    (12, "stats_all", "GET", lambda rng, data, uid, ubs: "/stats/all?range=months", None),
+    (4, "stats_summary", "GET", lambda rng, data, uid, ubs: "/stats/summary", None),
+    (6, "usernames", "GET", lambda rng, data, uid, ubs: f"/usernames?prefix=reader00{rng.randrange(10)}", None),
+    (8, "search", "GET", lambda rng, data, uid, ubs: f"/search?q={rng.choice(['silent', 'winter gar', 'harbor', 'iron lan'])}", None),
+    (4, "api_books_search", "GET", lambda rng, data, uid, ubs: f"/api/books/search?q=bench{rng.randrange(20)}", None),
+    (10, "add_book", "POST", lambda rng, data, uid, ubs: "/add_book", lambda rng, data, uid, ubs: {
+        "google_id": f"bench{rng.randrange(500)}", "title": "Bench", "author": "Author",
+        "status": rng.choice(["wishlist", "currently_reading", "completed"])}),
+    (2, "share_book", "POST", lambda rng, data, uid, ubs: "/share_book", lambda rng, data, uid, ubs: {
+        "book_id": rng.choice(ubs), "username": data.usernames[rng.choice(data.user_ids)], "status": "completed"}),
+]
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def run(app, data, requests=1000, seed=7):
+    rng = random.Random(seed)
+    with app.app_context():
+        google_books.use_client(CannedBooksClient())
+        user_books = defaultdict(list)
+        for user_book_id, user_id in db.session.execute(select(UserBook.id, UserBook.user_id).order_by(UserBook.id)):
+            user_books[user_id].append(user_book_id)
+        engine = db.engine
+        db.session.remove()
+
+    clients = {}
+
+    def client_for(user_id):
+        if user_id not in clients:
+            clients[user_id] = app.test_client()
+            with clients[user_id].session_transaction() as sess:
+                sess['_user_id'] = str(user_id)
+        return clients[user_id]
+
+    statements = [0]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    timings, queries, failures = defaultdict(list), defaultdict(int), 0
+    weights = [weight for weight, *_ in MIX]
+    active = [user_id for user_id in data.user_ids if user_books[user_id]]
+    active_weights = [data.weights[data.user_ids.index(user_id)] for user_id in active]
+    event.listen(engine, "before_cursor_execute", record)
+    started = time.perf_counter()
+    try:
+        for _ in range(requests):
+            weight, name, method, path, body = rng.choices(MIX, weights)[0]
+            user_id = rng.choices(active, active_weights)[0]
+            args = (rng, data, user_id, user_books[user_id])
+            url, payload = path(*args), body(*args) if body else None
+            client = client_for(user_id)
+            statements[0] = 0
+            request_started = time.perf_counter()
+            response = client.open(url, method=method, json=payload)
+            timings[name].append(time.perf_counter() - request_started)
+            queries[name] += statements[0]
+            failures += response.status_code >= 500
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(engine, "before_cursor_execute", record)
+
+    results = {name: {
+        "requests": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "queries": round(queries[name] / len(samples), 2),
+    } for name, samples in sorted(timings.items())}
+    results["total"] = {
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 1),
+        "errors": failures,
+    }
+    return results
+
+def main(requests=1000):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            data = generate()
+            db.session.remove()
+        results = run(app, data, requests)
+        with app.app_context():
+            db.engine.dispose()
+    total = results.pop("total")
+    for name, result in results.items():
+        print(f"{name:<18} {result['requests']:5d} req  p50 {result['p50_ms']:8.3f} ms  "
+              f"p95 {result['p95_ms']:8.3f} ms  {result['queries']:6.2f} queries/req")
+    print(f"{total['requests']} requests at {total['requests_per_second']} req/s, {total['errors']} server errors")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
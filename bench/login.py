@@ -0,0 +1,73 @@
+# Login throughput under concurrency, with password checks on the request
+# thread against the hashing process pool in app/passwords.py. Each round
+# posts `logins` logins from `concurrency` threads while one more thread
+# keeps requesting /stats/summary as a logged-in user, which shows how far
+# a login burst slows the rest of the worker. The pool caps how many hashes
+# run at once, so on a small pool the burst itself goes no faster, but it
+# cannot take every core away from the other requests.
+#
+#   python -m bench.login [logins] [workers]
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import db
+from app.passwords import HashingPool
+from bench.dataset import PASSWORD, generate, make_app
+
+CONCURRENCY = (1, 4, 16)
+
+def login(app, username):
+    response = app.test_client().post("/login", data={"username": username, "password": PASSWORD})
+    return response.status_code
+
+def background(app, user_id, stop, latencies):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+    while not stop.is_set():
+        started = time.perf_counter()
+        client.get("/stats/summary")
+        latencies.append(time.perf_counter() - started)
+
+def burst(app, data, logins, concurrency):
+    usernames = [data.usernames[data.user_ids[i % len(data.user_ids)]] for i in range(logins)]
+    stop, latencies = threading.Event(), []
+    other = threading.Thread(target=background, args=(app, data.typical_user, stop, latencies))
+    other.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        statuses = list(executor.map(lambda username: login(app, username), usernames))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    other.join()
+    failed = sum(status != 302 for status in statuses)
+    return logins / elapsed, statistics.median(latencies) if latencies else float("nan"), failed
+
+def main(logins=64, workers=None):
+    workers = os.cpu_count() if workers is None else workers
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            data = generate(users=50, books=200, library_rows=500, shares=50)
+            db.session.remove()
+        for name, pool in (("inline", HashingPool(workers=0)), (f"pool({workers})", HashingPool(workers=workers))):
+            app.extensions["password_hasher"] = pool
+            try:
+                burst(app, data, workers, 1)  # starts the pool's processes outside the timing
+                for concurrency in CONCURRENCY:
+                    rate, other_p50, failed = burst(app, data, logins, concurrency)
+                    print(f"{name:<9} c={concurrency:<3} {rate:7.1f} logins/s  "
+                          f"/stats/summary p50 {other_p50 * 1000:8.2f} ms  failed {failed}")
+            finally:
+                pool.close()
+        with app.app_context():
+            db.engine.dispose()
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,151 @@
+# Microbenchmarks for the public functions in app/utils.py, run against the
+# seeded dataset as its heaviest reader. Each case gets a fresh session per
+# call, as a request would, and any per-call setup (a new registration form,
+# a book to delete) is left out of the timing. Statement counts are recorded
+# alongside the latencies; for a fixed dataset they do not vary between runs.
+#
+#   python -m bench.micro [repeat]
+
+import csv
+import io
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from sqlalchemy import event, insert, select
+from app import db
+from app.google_books import google_books
+from app.models import Book, User, UserBook
+from app import utils
+from bench.dataset import PASSWORD, CannedBooksClient, generate, make_app
+
+def form(**fields):
+    return SimpleNamespace(**{name: SimpleNamespace(data=value) for name, value in fields.items()})
+
+def csv_upload(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["google_id", "title", "author", "genre", "page_count", "status"])
+    writer.writeheader()
+    for i in range(rows):
+        writer.writerow({
+            "google_id": f"bench{i * 7}", "title": f"Import {i}", "author": f"Author {i % 40}",
+            "genre": "Fiction", "page_count": 100 + i, "status": ("wishlist", "completed")[i % 2],
+        })
+    return buffer.getvalue().encode()
+
+class Case:
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup or (lambda: ())
+
+def cases(data):
+    heavy, typical = data.heavy_user, data.typical_user
+    counter = itertools.count()
+    statuses = itertools.cycle(["completed", "wishlist", "currently_reading"])
+    upload = csv_upload(200)
+    shared_book = db.session.scalar(select(UserBook.id).where(UserBook.user_id == heavy).order_by(UserBook.id))
+
+    def new_registration():
+        n = next(counter)
+        return (form(username=f"newreader{n}", email=f"new{n}@example.com",
+                     password=PASSWORD, confirm_password=PASSWORD),)
+
+    def book_to_delete():
+        n = next(counter)
+        utils.add_book_to_library(heavy, {"google_id": f"delete{n}", "title": f"Delete {n}", "author": "Nobody", "status": "wishlist"})
+        book_id = db.session.scalar(select(Book.id).where(Book.google_id == f"delete{n}"))
+        user_book_id = db.session.scalar(select(UserBook.id).where(UserBook.user_id == heavy, UserBook.book_id == book_id))
+        return heavy, user_book_id
+
+    def fresh_importer():
+        n = next(counter)
+        db.session.execute(insert(User), {"username": f"importer{n}", "email": f"importer{n}@example.com", "password": "x"})
+        user_id = db.session.scalar(select(User.id).where(User.username == f"importer{n}"))
+        db.session.commit()
+        return user_id, SimpleNamespace(stream=io.BytesIO(upload), filename="library.csv")
+
+    return [
+        Case("validate_registration_form", utils.validate_registration_form, new_registration),
+        Case("register_user", utils.register_user, new_registration),
+        Case("validate_login_form", utils.validate_login_form,
+             lambda: (form(username=data.usernames[heavy], password=PASSWORD),)),
+        Case("search_usernames", lambda: utils.search_usernames("reader001", heavy)),
+        Case("search_catalogue", lambda: utils.search_catalogue("winter garden")),
+        Case("get_catalogue_volume", lambda: utils.get_catalogue_volume("bench1")),
+        Case("search_books", lambda: utils.search_books("silent riv")),
+        Case("get_user_library_books", lambda: utils.get_user_library_books(heavy)),
+        Case("get_user_library_items", lambda: utils.get_user_library_items(heavy)),
+        Case("get_user_books", lambda: utils.get_user_books(heavy)),
+        Case("add_book_to_library", utils.add_book_to_library, lambda: (heavy, {
+            "google_id": "bench0", "title": "Bench", "author": "Author 0", "status": next(statuses)})),
+        Case("delete_book_from_library", utils.delete_book_from_library, book_to_delete),
+        Case("import_library_upload", utils.import_library_upload, fresh_importer),
+        Case("export_user_library", lambda: sum(len(chunk) for chunk in utils.export_user_library(heavy, "csv"))),
+        Case("share_book_with_user", lambda: utils.share_book_with_user(
+            heavy, shared_book, data.usernames[typical], "completed")),
+        Case("get_community_feed", lambda: utils.get_community_feed(heavy)),
+        Case("get_community_feed_page", lambda: utils.get_community_feed_page(heavy)),
+        Case("get_dashboard_summary", lambda: utils.get_dashboard_summary(heavy, 5)),
+        Case("get_dashboard_flags", lambda: utils.get_dashboard_summary(heavy)),
+        Case("get_stats_summary", lambda: utils.get_stats_summary(heavy)),
+        Case("get_books_over_time", lambda: utils.get_books_over_time(heavy, "months")),
+        Case("get_pages_over_time", lambda: utils.get_pages_over_time(heavy, "weeks")),
+        Case("get_genre_stats", lambda: utils.get_genre_stats(heavy)),
+        Case("get_status_stats", lambda: utils.get_status_stats(heavy)),
+        Case("get_author_stats", lambda: utils.get_author_stats(heavy)),
+        Case("get_stats_version", lambda: utils.get_stats_version(heavy)),
+        Case("get_all_stats", lambda: utils.get_all_stats(heavy, "months")),
+    ]
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def measure(case, repeat):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    timings, queries = [], 0
+    for i in range(repeat + 1):
+        args = case.setup()
+        db.session.remove()
+        event.listen(db.engine, "before_cursor_execute", record)
+        started = time.perf_counter()
+        try:
+            case.func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            event.remove(db.engine, "before_cursor_execute", record)
+        if i:  # the first call warms caches and is not counted
+            timings.append(elapsed)
+            queries = max(queries, len(statements))
+        statements.clear()
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "queries": queries,
+    }
+
+def run(data, repeat=15):
+    google_books.use_client(CannedBooksClient())
+    return {case.name: measure(case, repeat) for case in cases(data)}
+
+def main(repeat=15):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            results = run(generate(), repeat)
+            db.session.remove()
+            db.engine.dispose()
+    for name, result in results.items():
+        print(f"{name:<28} {result['median_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  {result['queries']:4d} queries")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,127 @@
+# Runs the microbenchmarks and the load profile on freshly seeded databases
+# and compares them with bench/baseline.json. A case regresses when it runs
+# more SQL statements than the baseline, or when its latency exceeds the
+# baseline by more than --tolerance (plus --slack-ms, so sub-millisecond
+# cases do not fail on timer noise). Any regression exits non-zero.
+#
+#   python -m bench.run                   compare against the baseline
+#   python -m bench.run --update          record a new baseline
+#
+# Latencies depend on the machine, so record the baseline on the machine
+# that runs the comparison; statement counts hold anywhere.
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+from app import db
+from bench import load, micro
+from bench.dataset import generate, make_app
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def seeded(dataset, func):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            data = generate(**dataset)
+            db.session.remove()
+        try:
+            return func(app, data)
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+
+def run_micro(app, data, repeat):
+    with app.app_context():
+        return micro.run(data, repeat)
+
+def collect(dataset, repeat, requests):
+    return {
+        "dataset": dataset,
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version},
+        "micro": seeded(dataset, lambda app, data: run_micro(app, data, repeat)),
+        "load": seeded(dataset, lambda app, data: load.run(app, data, requests)),
+    }
+
+def compare(baseline, results, tolerance, slack_ms):
+    regressions = []
+    for section, latency_key in (("micro", "median_ms"), ("load", "p50_ms")):
+        for name, result in results[section].items():
+            expected = baseline[section].get(name)
+            if expected is None or latency_key not in result:
+                continue
+            if result["queries"] > expected["queries"]:
+                regressions.append(f"{section}.{name}: {result['queries']} queries, baseline {expected['queries']}")
+            limit = expected[latency_key] * tolerance + slack_ms
+            if result[latency_key] > limit:
+                regressions.append(
+                    f"{section}.{name}: {latency_key} {result[latency_key]:.3f}, "
+                    f"baseline {expected[latency_key]:.3f} (limit {limit:.3f})"
+                )
+    total, expected = results["load"]["total"], baseline["load"]["total"]
+    if total["errors"] > expected["errors"]:
+        regressions.append(f"load: {total['errors']} server errors, baseline {expected['errors']}")
+    if total["requests_per_second"] * tolerance < expected["requests_per_second"]:
+        regressions.append(
+            f"load: {total['requests_per_second']} req/s, baseline {expected['requests_per_second']}"
+        )
+    return regressions
+
+def report(results, baseline):
+    for section, latency_key in (("micro", "median_ms"), ("load", "p50_ms")):
+        print(f"{section}:")
+        for name, result in results[section].items():
+            if latency_key not in result:
+                continue
+            was = (baseline or {}).get(section, {}).get(name, {})
+            previous = f"(baseline {was[latency_key]:.3f} ms, {was['queries']} queries)" if was else "(new)"
+            print(f"  {name:<28} {result[latency_key]:9.3f} ms  {result['queries']:7} queries  {previous}")
+    print(f"load: {results['load']['total']['requests_per_second']} req/s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed latency ratio over the baseline")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="allowed absolute latency over the limit")
+    parser.add_argument("--repeat", type=int, default=15, help="timed calls per microbenchmark")
+    parser.add_argument("--requests", type=int, default=1000, help="requests in the load profile")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--library-rows", type=int, default=20000)
+    parser.add_argument("--shares", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    dataset = {"users": args.users, "books": args.books, "library_rows": args.library_rows, "shares": args.shares}
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = collect(dataset, args.repeat, args.requests)
+    report(results, baseline)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update to record one.")
+        return 1
+    if baseline["dataset"] != dataset:
+        print(f"Baseline was recorded with {baseline['dataset']}, not {dataset}; not comparing.")
+        return 1
+    regressions = compare(baseline, results, args.tolerance, args.slack_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
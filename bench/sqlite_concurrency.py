@@ -0,0 +1,124 @@
+# Mixed read/write load against a file-backed SQLite database, once with the
+# driver defaults and once with the production profile from DeploymentConfig
+# (WAL, synchronous=NORMAL, busy_timeout, mmap, a sized pool). Writer
+# processes toggle books through add_book_to_library while reader processes
+# load whole libraries with get_user_books.
+#
+#   python -m bench.sqlite_concurrency [seconds] [readers] [writers] [library_rows]
+
+import multiprocessing
+import os
+import sys
+import random
+import tempfile
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import User, UserBook, Book
+from app.statistics import rebuild_user_stats
+from app.utils import add_book_to_library, get_user_books
+from config import DeploymentConfig, TestingConfig
+
+USERS = 20
+
+def seed(library_rows):
+    db.session.execute(insert(User), [
+        {"username": f"loaduser{i}", "email": f"load{i}@example.com", "password": "x"} for i in range(USERS)
+    ])
+    db.session.execute(insert(Book), [{
+        "google_id": f"load{i}",
+        "title": f"Book {i}",
+        "author": f"Author {i % 300}",
+        "genre": "Fiction",
+        "page_count": 100 + i % 900,
+    } for i in range(library_rows)])
+    db.session.execute(insert(UserBook), [{
+        "user_id": i % USERS + 1,
+        "book_id": i + 1,
+        "status": "wishlist",
+    } for i in range(library_rows)])
+    for user_id in range(1, USERS + 1):
+        rebuild_user_stats(user_id)
+    db.session.commit()
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+PROFILES = {"default": TestingConfig, "production": DeploymentConfig}
+
+def make_app(profile, path):
+    class LoadConfig(PROFILES[profile]):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + path
+    return create_app(LoadConfig)
+
+def worker(profile, path, kind, seed_value, deadline, library_rows, results):
+    # Each worker is its own process, as under a multi-worker WSGI server,
+    # so the comparison measures SQLite locking rather than the GIL.
+    app = make_app(profile, path)
+    rng = random.Random(seed_value)
+    latencies, errors = [], 0
+    with app.app_context():
+        while time.time() < deadline:
+            user_id = rng.randrange(USERS) + 1
+            started = time.perf_counter()
+            try:
+                if kind == "reads":
+                    get_user_books(user_id)
+                else:
+                    i = rng.randrange(library_rows)
+                    add_book_to_library(user_id, {
+                        "google_id": f"load{i}", "title": f"Book {i}", "author": f"Author {i % 300}",
+                        "status": rng.choice(["wishlist", "currently_reading", "completed"]),
+                    })
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+            finally:
+                db.session.remove()
+    results.put((kind, latencies, errors))
+
+def run_profile(profile, seconds, readers, writers, library_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "load.db")
+        app = make_app(profile, path)
+        with app.app_context():
+            db.create_all()
+            seed(library_rows)
+            db.session.remove()
+            db.engine.dispose()
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + seconds + 1
+        kinds = ["reads"] * readers + ["writes"] * writers
+        processes = [
+            multiprocessing.Process(target=worker, args=(profile, path, kind, i, deadline, library_rows, results))
+            for i, kind in enumerate(kinds)
+        ]
+        for process in processes:
+            process.start()
+        totals = {"reads": [], "writes": [], "errors": 0}
+        for _ in processes:
+            kind, latencies, errors = results.get()
+            totals[kind].extend(latencies)
+            totals["errors"] += errors
+        for process in processes:
+            process.join()
+
+    reads, writes = totals["reads"], totals["writes"]
+    elapsed = seconds + 1
+    print(f"{profile:<11} reads/s {len(reads) / elapsed:8.1f}  p95 {percentile(reads, 0.95) * 1000:7.2f} ms   "
+          f"writes/s {len(writes) / elapsed:7.1f}  p95 {percentile(writes, 0.95) * 1000:7.2f} ms   "
+          f"lock errors {totals['errors']}")
+
+def main(seconds=5, readers=8, writers=4, library_rows=2000):
+    print(f"{seconds}s per profile, {readers} readers, {writers} writers, {library_rows} library rows")
+    for profile in PROFILES:
+        run_profile(profile, seconds, readers, writers, library_rows)
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
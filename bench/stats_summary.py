@@ -0,0 +1,164 @@
+# Compares the previous seven-query stats summary against the single-statement
+# live query and the UserStats rollup read on a large library. SQLite runs in-process, so a
+# simulated network round trip (default 0.5 ms per statement) is added to
+# model a client/server database; pass 0 to measure raw SQLite.
+#
+#   python -m bench.stats_summary [library_rows] [repeat] [rtt_ms]
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import desc, event, func, insert
+from app import create_app, db
+from app.models import User, UserBook, Book, BookShare
+from app.statistics import summary_row
+from app.utils import get_stats_summary
+from config import TestingConfig
+
+GENRES = ["Fantasy", "Horror", "Romance", "History", "Science", "Poetry", None]
+STATUSES = ["completed", "currently_reading", "wishlist"]
+
+def legacy_stats_summary(user_id):
+    total_books_read = (
+        db.session.query(func.count(UserBook.id))
+        .filter(UserBook.user_id == user_id, UserBook.status == 'completed')
+        .scalar()
+    )
+    total_pages_read = (
+        db.session.query(func.sum(Book.page_count))
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id, UserBook.status == 'completed')
+        .scalar() or 0
+    )
+    genre_result = (
+        db.session.query(Book.genre, func.count(Book.id))
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id)
+        .group_by(Book.genre)
+        .order_by(desc(func.count(Book.id)))
+        .first()
+    )
+    favorite_genre = genre_result[0] if genre_result else None
+
+    author_result = (
+        db.session.query(Book.author, func.count(Book.id))
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id)
+        .group_by(Book.author)
+        .order_by(desc(func.count(Book.id)))
+        .first()
+    )
+    most_read_author = author_result[0] if author_result else None
+
+    longest = (
+        db.session.query(Book.title, Book.page_count)
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id, UserBook.status == 'completed', Book.page_count != None)
+        .order_by(desc(Book.page_count))
+        .first()
+    )
+    longest_book = {"title": longest[0], "pages": longest[1]} if longest else None
+
+    shortest = (
+        db.session.query(Book.title, Book.page_count)
+        .join(UserBook, Book.id == UserBook.book_id)
+        .filter(UserBook.user_id == user_id, UserBook.status == 'completed', Book.page_count != None)
+        .order_by(Book.page_count)
+        .first()
+    )
+    shortest_book = {"title": shortest[0], "pages": shortest[1]} if shortest else None
+
+    books_shared = (
+        db.session.query(func.count())
+        .select_from(BookShare)
+        .filter(BookShare.from_user_id == user_id)
+        .scalar()
+    )
+
+    return {
+        "total_books_read": total_books_read or 0,
+        "total_pages_read": total_pages_read or 0,
+        "favorite_genre": favorite_genre,
+        "most_read_author": most_read_author,
+        "longest_book": longest_book,
+        "shortest_book": shortest_book,
+        "books_shared": books_shared or 0,
+    }
+
+def seed(library_rows):
+    rng = random.Random(42)
+    user = User(username="benchreader", email="bench@example.com", password="x")
+    friend = User(username="benchfriend", email="friend@example.com", password="x")
+    db.session.add_all([user, friend])
+    db.session.commit()
+    db.session.execute(insert(Book), [{
+        "google_id": f"bench{i}",
+        "title": f"Book {i}",
+        "author": f"Author {rng.randrange(500)}",
+        "genre": rng.choice(GENRES),
+        "page_count": rng.choice([None, rng.randrange(50, 1500)]),
+    } for i in range(library_rows)])
+    start = datetime(2020, 1, 1)
+    db.session.execute(insert(UserBook), [{
+        "user_id": user.id,
+        "book_id": i + 1,
+        "status": rng.choice(STATUSES),
+        "date_completed": start + timedelta(hours=i),
+    } for i in range(library_rows)])
+    db.session.execute(insert(BookShare), [{
+        "from_user_id": user.id,
+        "to_user_id": friend.id,
+        "book_id": rng.randrange(library_rows) + 1,
+        "status": "completed",
+    } for _ in range(library_rows // 10)])
+    db.session.commit()
+    return user.id
+
+def timed(func, user_id, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        func(user_id)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def simulate_round_trips(engine, rtt_ms):
+    def delay(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(rtt_ms / 1000)
+    event.listen(engine, "before_cursor_execute", delay)
+
+def main(library_rows=10000, repeat=20, rtt_ms=0.5):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tmp, "bench.db")
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            user_id = seed(library_rows)
+            legacy = legacy_stats_summary(user_id)
+            current = get_stats_summary(user_id)
+            for key in ("total_books_read", "total_pages_read", "books_shared"):
+                assert legacy[key] == current[key], key
+            db.session.commit()
+            if rtt_ms:
+                simulate_round_trips(db.engine, rtt_ms)
+            legacy_time = timed(legacy_stats_summary, user_id, repeat)
+            single_time = timed(summary_row, user_id, repeat)
+            rollup_time = timed(get_stats_summary, user_id, repeat)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f"library rows:    {library_rows}")
+    print(f"round trip:      {rtt_ms} ms")
+    print(f"seven queries:   {legacy_time * 1000:.2f} ms")
+    print(f"single pass:     {single_time * 1000:.2f} ms ({legacy_time / single_time:.2f}x)")
+    print(f"rollup read:     {rollup_time * 1000:.2f} ms ({legacy_time / rollup_time:.2f}x)")
+
+if __name__ == "__main__":
+    main(*(float(arg) if i == 2 else int(arg) for i, arg in enumerate(sys.argv[1:])))
@@ -8,9 +8,65 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     WTF_CSRF_ENABLED = True
     WTF_CSRF_METHODS = ["POST", "PUT", "PATCH", "DELETE"]
+    SQLITE_PRAGMAS = {}  # applied to each new SQLite connection by app/database.py
+    READ_REPLICA_BIND = 'replica'  # SQLALCHEMY_BINDS key that @replica_read functions query
+    READ_YOUR_WRITES_SECONDS = 5  # how long reads by a writer, or a user whose data changed, stay on the primary
+    SQL_SLOW_QUERY_MS = 100  # statements at least this slow are logged; None turns it off
+    SQL_REPEATED_QUERY_THRESHOLD = 10  # same statement this often in one request is logged as a likely N+1
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # /metrics requires "Authorization: Bearer <token>" and is 404 while unset
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')  # defaults to the main URL with its async driver
+    ASYNC_FALLBACK_WORKERS = 10  # threads serving the Flask views under asgi.py
+    ASYNC_UPSTREAM_WORKERS = 32  # threads for Google Books calls made by async views
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # 'memory', 'redis' or 'none'
+    RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL')
+    RESPONSE_CACHE_TTL = 300
+    RESPONSE_CACHE_MAX_ENTRIES = 10000
+    PASSWORD_HASH_METHOD = 'scrypt'  # any werkzeug method, e.g. 'scrypt:65536:8:1'; older hashes are upgraded at login
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = None  # hashing processes, None for one per CPU; 0 hashes on the request thread
+    PASSWORD_HASH_QUEUE = 32  # hashes that may wait for a worker before logins are answered with 503
+    IDENTITY_CACHE_TTL = 300  # seconds a logged-in user's id and username are served without a query
+    IDENTITY_CACHE_MAX_ENTRIES = 10000
+    FEED_RETENTION_DAYS = 365
+    DASHBOARD_INLINE_ITEMS = 5  # feed items and current reads rendered into the dashboard; 0 renders only whether any exist
+    FEED_MAX_ITEMS_PER_USER = 1000
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')  # 'auto', 'fts5' or 'python'
+    SEARCH_INDEX_REFRESH = 30  # seconds between the python index's checks for books added by other workers
+    SEARCH_INDEX_MAX_AGE = 3600  # seconds before the python index is rebuilt to pick up other workers' edits; 0 never
+    GOOGLE_BOOKS_API_URL = 'https://www.googleapis.com/books/v1'
+    GOOGLE_BOOKS_API_KEY = os.environ.get('GOOGLE_BOOKS_API_KEY')
+    GOOGLE_BOOKS_CACHE_PATH = os.environ.get('GOOGLE_BOOKS_CACHE_PATH') or os.path.join(basedir, 'books_cache.db')
+    GOOGLE_BOOKS_TIMEOUT = 5
+    GOOGLE_BOOKS_SEARCH_TTL = 3600
+    GOOGLE_BOOKS_VOLUME_TTL = 86400
+    GOOGLE_BOOKS_NOT_FOUND_TTL = 300
+    GOOGLE_BOOKS_STALE_TTL = 86400  # how long past expiry an entry may be served while refreshing
+    GOOGLE_BOOKS_CACHE_MAX_ENTRIES = 10000  # least recently fetched responses are evicted past this
+    GOOGLE_BOOKS_RATE_LIMIT = 1.0  # catalogue requests per second per user or address after the burst; 0 disables
+    GOOGLE_BOOKS_RATE_BURST = 20
 
 class DeploymentConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or default_database_uri
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.environ.get('DATABASE_REPLICA_URL') else {}
+    # WAL lets readers run while a write is in progress, synchronous=NORMAL
+    # syncs at checkpoints rather than on every commit (still safe under WAL),
+    # and busy_timeout makes writers queue instead of failing with
+    # "database is locked". Ignored when DATABASE_URL is not SQLite.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -65536,  # negative means KiB: 64MB of page cache per connection
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 10)),
+        'pool_timeout': 30,
+    }
 
 class TestingConfig(Config):
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PASSWORD_HASH_WORKERS = 0
+    GOOGLE_BOOKS_CACHE_PATH = ':memory:'
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""Add user_stats rollup table
+
+Revision ID: 3b7e9f0c1d24
+Revises: 8d41c2a7e5b9
+Create Date: 2026-10-18 11:02:47.915306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e9f0c1d24'
+down_revision = '8d41c2a7e5b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rollups are built lazily on first read, or eagerly with `flask stats rebuild`.
+    op.create_table('user_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(length=20), nullable=False),
+    sa.Column('bucket', sa.String(length=150), nullable=False),
+    sa.Column('books', sa.Integer(), nullable=False),
+    sa.Column('pages', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'dimension', 'bucket', name='uq_user_stats_user_id_dimension_bucket')
+    )
+    with op.batch_alter_table('user_book', schema=None) as batch_op:
+        batch_op.create_index('ix_user_book_book_id', ['book_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_book', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_book_book_id')
+
+    op.drop_table('user_stats')
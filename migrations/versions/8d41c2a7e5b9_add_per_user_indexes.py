@@ -0,0 +1,75 @@
+"""Add per-user composite indexes
+
+Revision ID: 8d41c2a7e5b9
+Revises: 54c1367dc6a6
+Create Date: 2026-10-18 10:12:03.418211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c2a7e5b9'
+down_revision = '54c1367dc6a6'
+branch_labels = None
+depends_on = None
+
+
+def merge_duplicate_user_books():
+    # Nothing used to stop a user adding the same book twice. Each (user_id,
+    # book_id) keeps its newest row, which holds the latest status; it takes
+    # the earliest date_added and, if completed without a date, the latest
+    # date_completed of the rows it replaces. The others are deleted.
+    connection = op.get_bind()
+    user_book = sa.table(
+        'user_book', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('book_id', sa.Integer),
+        sa.column('status', sa.String), sa.column('date_added', sa.DateTime), sa.column('date_completed', sa.DateTime)
+    )
+    duplicated = (
+        sa.select(user_book.c.user_id, user_book.c.book_id)
+        .group_by(user_book.c.user_id, user_book.c.book_id)
+        .having(sa.func.count() > 1)
+        .subquery()
+    )
+    rows = connection.execute(
+        sa.select(user_book)
+        .join(duplicated, sa.and_(user_book.c.user_id == duplicated.c.user_id, user_book.c.book_id == duplicated.c.book_id))
+        .order_by(user_book.c.user_id, user_book.c.book_id, user_book.c.id)
+    ).all()
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.user_id, row.book_id), []).append(row)
+    for group in groups.values():
+        keep = group[-1]
+        date_added = min((row.date_added for row in group if row.date_added), default=None)
+        date_completed = keep.date_completed
+        if keep.status == 'completed' and date_completed is None:
+            date_completed = max((row.date_completed for row in group if row.date_completed), default=None)
+        connection.execute(
+            user_book.update().where(user_book.c.id == keep.id)
+            .values(date_added=date_added, date_completed=date_completed)
+        )
+        connection.execute(user_book.delete().where(user_book.c.id.in_([row.id for row in group[:-1]])))
+
+
+def upgrade():
+    merge_duplicate_user_books()
+
+    with op.batch_alter_table('user_book', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_user_book_user_id_book_id', ['user_id', 'book_id'])
+        batch_op.create_index('ix_user_book_user_id_status_date_completed', ['user_id', 'status', 'date_completed'], unique=False)
+
+    with op.batch_alter_table('book_share', schema=None) as batch_op:
+        batch_op.create_index('ix_book_share_from_user_id_timestamp', ['from_user_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_book_share_to_user_id_timestamp', ['to_user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('book_share', schema=None) as batch_op:
+        batch_op.drop_index('ix_book_share_to_user_id_timestamp')
+        batch_op.drop_index('ix_book_share_from_user_id_timestamp')
+
+    with op.batch_alter_table('user_book', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_book_user_id_status_date_completed')
+        batch_op.drop_constraint('uq_user_book_user_id_book_id', type_='unique')
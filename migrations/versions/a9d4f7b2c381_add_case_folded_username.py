@@ -0,0 +1,43 @@
+"""Store case-folded usernames for autocomplete
+
+Revision ID: a9d4f7b2c381
+Revises: f2b8d46a1c07
+Create Date: 2026-10-18 21:02:44.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4f7b2c381'
+down_revision = 'f2b8d46a1c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('username_lower', sa.String(length=150), nullable=True))
+        batch_op.drop_index('ix_user_username_lower')
+
+    # Folded in Python: SQLite's lower() leaves non-ASCII letters alone.
+    connection = op.get_bind()
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('username', sa.String), sa.column('username_lower', sa.String))
+    rows = connection.execute(sa.select(user.c.id, user.c.username)).all()
+    if rows:
+        connection.execute(
+            user.update().where(user.c.id == sa.bindparam('user_id')).values(username_lower=sa.bindparam('key')),
+            [{'user_id': id, 'key': username.casefold()} for id, username in rows]
+        )
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('username_lower', existing_type=sa.String(length=150), nullable=False)
+        batch_op.create_index('ix_user_username_lower', ['username_lower'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_username_lower')
+        batch_op.drop_column('username_lower')
+    op.create_index('ix_user_username_lower', 'user', [sa.text('lower(username)')], unique=False)
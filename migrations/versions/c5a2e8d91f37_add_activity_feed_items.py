@@ -0,0 +1,45 @@
+"""Add activity_feed_item inbox table
+
+Revision ID: c5a2e8d91f37
+Revises: 3b7e9f0c1d24
+Create Date: 2026-10-18 12:20:11.604532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a2e8d91f37'
+down_revision = '3b7e9f0c1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing shares are copied in with `flask feed backfill`.
+    op.create_table('activity_feed_item',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('share_id', sa.Integer(), nullable=False),
+    sa.Column('google_id', sa.String(length=40), nullable=True),
+    sa.Column('title', sa.String(length=150), nullable=False),
+    sa.Column('cover_url', sa.String(length=300), nullable=True),
+    sa.Column('status', sa.String(length=30), nullable=False),
+    sa.Column('from_username', sa.String(length=150), nullable=False),
+    sa.Column('to_username', sa.String(length=150), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['share_id'], ['book_share.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'share_id', name='uq_activity_feed_item_user_id_share_id')
+    )
+    with op.batch_alter_table('activity_feed_item', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_feed_item_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('activity_feed_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_feed_item_user_id_timestamp')
+
+    op.drop_table('activity_feed_item')
@@ -0,0 +1,42 @@
+"""Add book_search full-text index
+
+Revision ID: e7a3c1f05b92
+Revises: c5a2e8d91f37
+Create Date: 2026-10-18 14:05:37.218940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c1f05b92'
+down_revision = 'c5a2e8d91f37'
+branch_labels = None
+depends_on = None
+
+
+def has_fts5(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def upgrade():
+    # Other databases fall back to the in-process index in app/search.py.
+    bind = op.get_bind()
+    if not has_fts5(bind):
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5("
+        "title, author, genre, description, tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "INSERT INTO book_search (rowid, title, author, genre, description) "
+        "SELECT id, title, author, coalesce(genre, ''), coalesce(description, '') FROM book"
+    )
+
+
+def downgrade():
+    if has_fts5(op.get_bind()):
+        op.execute("DROP TABLE IF EXISTS book_search")
@@ -0,0 +1,26 @@
+"""Add lower(username) index for autocomplete
+
+Revision ID: f2b8d46a1c07
+Revises: e7a3c1f05b92
+Create Date: 2026-10-18 14:48:19.530126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d46a1c07'
+down_revision = 'e7a3c1f05b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_username_lower', [sa.text('lower(username)')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_username_lower')
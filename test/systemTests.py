@@ -137,6 +137,28 @@ class SystemTests(unittest.TestCase):
         self.assertEqual(self.driver.current_url, localHost)
         self.assertTrue("You have been logged out" in self.driver.page_source)
 
+    def test_statistics_page_makes_no_csrf_round_trips(self):
+        hashed_pw = generate_password_hash("Testpass1")
+        db.session.add(User(username="testuser3", email="testuser3@example.com", password=hashed_pw))
+        db.session.commit()
+
+        self.driver.get(localHost + "login")
+        self.driver.find_element(By.ID, "username").send_keys("testuser3")
+        self.driver.find_element(By.ID, "password").send_keys("Testpass1")
+        self.driver.find_element(By.ID, "submit").click()
+        WebDriverWait(self.driver, 10).until(expected_conditions.url_contains("/dashboard"))
+
+        self.driver.get(localHost + "statistics")
+        WebDriverWait(self.driver, 10).until(lambda driver: driver.execute_script(
+            "return performance.getEntriesByType('resource').some(e => e.name.includes('/stats/'))"
+        ))
+        requests = self.driver.execute_script(
+            "return performance.getEntriesByType('resource')"
+            ".filter(e => e.initiatorType === 'fetch').map(e => new URL(e.name).pathname)"
+        )
+        self.assertNotIn("/csrf-token", requests)
+        self.assertEqual(requests, ["/stats/all"])
+
     def tearDown(self):
         self.server_thread.terminate()
         self.driver.close()
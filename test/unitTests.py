@@ -1,13 +1,38 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from datetime import datetime
+from flask import g
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 from app import create_app, db
-from config import TestingConfig
-from app.models import User, UserBook, Book, BookShare
+from config import DeploymentConfig, TestingConfig
+from app.models import User, UserBook, Book, BookShare, UserStats, ActivityFeedItem
+from app.cache import LRUCache, RedisCache, response_cache
+from app.google_books import RateLimiter, SQLiteStore, google_books
+from app.identity import identity_cache
+from app.passwords import HashingPool, password_hasher
+from app.importer import import_library, read_import
+from app import export
+from app.asgi import AsyncAPI
+from app.database import sqlite_settings
+from app.statistics import check_user_stats, rebuild_user_stats, completion_series
 from app.utils import (
     validate_registration_form, register_user, validate_login_form,
-    get_all_usernames, get_user_library_books, get_user_books,
+    search_usernames, prefix_upper_bound, get_user_library_books, get_user_library_items,
+    get_user_books,
     add_book_to_library, delete_book_from_library, share_book_with_user,
-    get_community_feed, get_stats_summary
+    get_community_feed, get_community_feed_page, get_dashboard_summary, get_stats_summary, get_books_over_time,
+    get_pages_over_time, get_genre_stats, get_status_stats, get_author_stats,
+    search_books
 )
 
 class DummyForm:
@@ -17,6 +42,37 @@ class DummyForm:
         self.password = type('obj', (object,), {'data': password})()
         self.confirm_password = type('obj', (object,), {'data': confirm_password})()
 
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+def make_book_data(i, status="wishlist"):
+    return {
+        "google_id": f"gid{i}",
+        "title": f"Book{i}",
+        "author": f"Author{i}",
+        "description": f"Desc{i}",
+        "cover_url": f"url{i}",
+        "status": status,
+        "genre": "Fiction",
+        "page_count": 100 + i
+    }
+
 class UtilsTestCase(unittest.TestCase):
     def setUp(self):
         self.app = create_app(TestingConfig)
@@ -51,10 +107,30 @@ class UtilsTestCase(unittest.TestCase):
 
     def test_register_user(self):
         form = DummyForm("reguser", "reg@example.com", "Password1", "Password1")
-        user = register_user(form)
+        created, user = register_user(form)
+        self.assertTrue(created)
         self.assertIsNotNone(User.query.filter_by(username="reguser").first())
         self.assertEqual(user.email, "reg@example.com")
 
+    def test_registration_checks_uniqueness_in_one_query(self):
+        with QueryCounter(db.engine) as counter:
+            valid, errors = validate_registration_form(DummyForm("testuser", "test@example.com", "Password1", "Password1"))
+        self.assertEqual(counter.count, 1)
+        self.assertFalse(valid)
+        self.assertEqual(errors, {'username': ['Username already exists'], 'email': ['Email already exists']})
+        valid, errors = validate_registration_form(DummyForm("otheruser", "test@example.com", "password", "password"))
+        self.assertEqual(errors, {'email': ['Email already exists'], 'password': [
+            'Password must contain an uppercase letter', 'Password must contain a number']})
+
+    def test_racing_registrations_fall_back_to_form_errors(self):
+        first = DummyForm("raceuser", "race@example.com", "Password1", "Password1")
+        second = DummyForm("raceuser", "race2@example.com", "Password1", "Password1")
+        self.assertEqual(validate_registration_form(first), (True, {}))
+        self.assertEqual(validate_registration_form(second), (True, {}))
+        self.assertTrue(register_user(first)[0])
+        self.assertEqual(register_user(second), (False, {'username': ['Username already exists']}))
+        self.assertEqual(User.query.filter_by(username="raceuser").count(), 1)
+
     def test_validate_login_form_success(self):
         class LoginForm:
             username = type('obj', (object,), {'data': "testuser"})()
@@ -71,14 +147,38 @@ class UtilsTestCase(unittest.TestCase):
         self.assertFalse(valid)
         self.assertIsNone(user)
 
-    def test_get_all_usernames(self):
-        user2 = User(username="otheruser", email="other@example.com")
-        user2.password = generate_password_hash("Password2")
-        db.session.add(user2)
+    def test_search_usernames(self):
+        for name in ("otheruser", "OtherReader", "another"):
+            db.session.add(User(username=name, email=f"{name}@example.com", password="x"))
+        db.session.commit()
+        result = search_usernames("oth", self.user_id)
+        self.assertEqual(result, {'usernames': ["OtherReader", "otheruser"], 'has_more': False})
+        result = search_usernames("", self.user_id, limit=2)
+        self.assertEqual(result, {'usernames': ["another", "OtherReader"], 'has_more': True})
+        self.assertNotIn("testuser", search_usernames("test", self.user_id)['usernames'])
+
+    def test_search_usernames_folds_non_ascii_case(self):
+        for name in ("Élodie", "émile", "Zoë"):
+            db.session.add(User(username=name, email=None, password="x"))
         db.session.commit()
-        usernames = get_all_usernames(self.user_id)
-        self.assertIn("otheruser", usernames)
-        self.assertNotIn("testuser", usernames)
+        self.assertEqual(search_usernames("É", self.user_id)['usernames'], ["Élodie", "émile"])
+        self.assertEqual(search_usernames("ZOË", self.user_id)['usernames'], ["Zoë"])
+        self.assertEqual(search_usernames(chr(0x10FFFF), self.user_id)['usernames'], [])
+
+    def test_renamed_user_is_found_by_new_name(self):
+        user = User(username="oldname", email=None, password="x")
+        db.session.add(user)
+        db.session.commit()
+        user.username = "Newname"
+        db.session.commit()
+        self.assertEqual(search_usernames("new", self.user_id)['usernames'], ["Newname"])
+        self.assertEqual(search_usernames("old", self.user_id)['usernames'], [])
+
+    def test_prefix_upper_bound(self):
+        self.assertEqual(prefix_upper_bound("ab"), "ac")
+        self.assertEqual(prefix_upper_bound("a" + chr(0x10FFFF)), "b")
+        self.assertIsNone(prefix_upper_bound(chr(0x10FFFF)))
+        self.assertEqual(prefix_upper_bound(chr(0xD7FF)), chr(0xE000))
 
     def test_add_and_get_user_library_books(self):
         # Add a book
@@ -97,6 +197,19 @@ class UtilsTestCase(unittest.TestCase):
         self.assertEqual(len(books), 1)
         self.assertEqual(books[0].book.title, "Book1")
 
+    def test_books_without_google_id_are_matched_by_title_and_author(self):
+        user2 = User(username="otheruser", email="other@example.com")
+        user2.password = generate_password_hash("Password2")
+        db.session.add(user2)
+        db.session.commit()
+        add_book_to_library(self.user_id, dict(make_book_data(1), google_id=None, description=None))
+        add_book_to_library(user2.id, dict(make_book_data(1), google_id=None, title="BOOK1", author="author1"))
+        add_book_to_library(self.user_id, dict(make_book_data(2), google_id=""))
+        self.assertEqual(Book.query.count(), 2)
+        book = get_user_library_books(user2.id)[0].book
+        self.assertEqual((book.title, book.google_id, book.description), ("Book1", None, "Desc1"))
+        self.assertEqual(Book.query.filter_by(title="Book2").one().google_id, None)
+
     def test_delete_book_from_library(self):
         # Add a book
         data = {
@@ -157,5 +270,1483 @@ class UtilsTestCase(unittest.TestCase):
         self.assertEqual(summary['favorite_genre'], "Nonfiction")
         self.assertEqual(summary['most_read_author'], "Author4")
 
+class AppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app.config['SECRET_KEY'] = 'test'
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        self.user = User(username="libraryuser", email="library@example.com")
+        self.user.password = generate_password_hash("Password1")
+        db.session.add(self.user)
+        db.session.commit()
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_ctx.pop()
+
+    def add_books(self, start, stop):
+        for i in range(start, stop):
+            add_book_to_library(self.user_id, make_book_data(i))
+        db.session.expire_all()
+
+    def logged_in_client(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user_id)
+        return client
+
+    def count_queries(self, func):
+        with QueryCounter(db.engine) as counter:
+            func()
+        return counter.count
+
+    def scrape_metrics(self):
+        self.app.config['METRICS_TOKEN'] = 'scrape'
+        return self.app.test_client().get('/metrics', headers={'Authorization': 'Bearer scrape'})
+
+class LibraryQueryTestCase(AppTestCase):
+    def test_library_functions_use_one_query(self):
+        self.add_books(0, 25)
+        for func in (get_user_library_books, get_user_library_items, get_user_books):
+            db.session.expire_all()
+            def touch():
+                result = func(self.user_id)
+                if func is get_user_library_books:
+                    [ub.book.title for ub in result]
+            self.assertEqual(self.count_queries(touch), 1, func.__name__)
+
+    def test_library_page_query_count_is_constant(self):
+        client = self.logged_in_client()
+        self.add_books(0, 2)
+        client.get('/library')
+        small = self.count_queries(lambda: client.get('/library'))
+        self.add_books(2, 40)
+        large = self.count_queries(lambda: client.get('/library'))
+        self.assertEqual(small, large)
+
+    def test_my_library_books_returns_projected_items(self):
+        self.add_books(0, 3)
+        client = self.logged_in_client()
+        response = client.get('/my_library_books')
+        self.assertEqual(response.status_code, 200)
+        items = response.get_json()
+        self.assertEqual(len(items), 3)
+        self.assertEqual(set(items[0]), {"id", "title", "author", "cover_url", "status"})
+
+class ConcurrentAddBookTestCase(unittest.TestCase):
+    # Needs a real file: the in-memory database is one shared connection.
+    THREADS = 16
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+        class FileConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.db_path
+            SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+        self.app = create_app(FileConfig)
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        users = [User(username=f"racer{i}", email=f"racer{i}@example.com", password="x") for i in range(self.THREADS)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_ids = [user.id for user in users]
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app_ctx.pop()
+        os.remove(self.db_path)
+
+    def test_same_book_from_many_threads(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def hammer(i, user_id):
+            # Half the writers carry the genre and page count, so the insert
+            # race and the backfill race are both exercised.
+            data = dict(make_book_data(1), genre="Fiction" if i % 2 else None, page_count=300 if i % 2 else None)
+            with self.app.app_context():
+                try:
+                    barrier.wait()
+                    add_book_to_library(user_id, dict(data, status="wishlist"))
+                    add_book_to_library(user_id, dict(data, status="completed"))
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=hammer, args=(i, uid)) for i, uid in enumerate(self.user_ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        book = Book.query.one()
+        self.assertEqual((book.genre, book.page_count), ("Fiction", 300))
+        self.assertEqual(UserBook.query.filter_by(book_id=book.id, status="completed").count(), self.THREADS)
+        for user_id in self.user_ids:
+            self.assertEqual(check_user_stats(user_id), [])
+
+    def in_other_session(self, func):
+        # Runs func in its own app context, hence its own session, and
+        # commits before returning, while this test's session stays open.
+        errors = []
+
+        def run():
+            with self.app.app_context():
+                try:
+                    func()
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    db.session.remove()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(errors, [])
+
+    def loaded_stats(self, user_id):
+        return UserStats.query.filter_by(user_id=user_id).all()
+
+    def test_interleaved_writers_keep_every_increment(self):
+        user_id = self.user_ids[0]
+        add_book_to_library(user_id, dict(make_book_data(1), genre="Fiction"))
+        stale = self.loaded_stats(user_id)
+        self.in_other_session(lambda: add_book_to_library(user_id, dict(make_book_data(2), genre="Fiction")))
+        add_book_to_library(user_id, dict(make_book_data(3), genre="Fiction"))
+        self.assertTrue(stale)
+        self.assertEqual(check_user_stats(user_id), [])
+        self.assertEqual(get_genre_stats(user_id), {'Fiction': 3})
+
+    def test_backfill_by_another_user_does_not_disturb_a_holder(self):
+        holder, other = self.user_ids[:2]
+        add_book_to_library(holder, dict(make_book_data(1), genre=None, page_count=None, status="completed"))
+        stale = self.loaded_stats(holder)
+        self.in_other_session(lambda: add_book_to_library(other, dict(make_book_data(1), genre="Fiction", page_count=300)))
+        add_book_to_library(holder, dict(make_book_data(2), genre="Fiction"))
+        self.assertTrue(stale)
+        for user_id in (holder, other):
+            self.assertEqual(check_user_stats(user_id), [])
+        self.assertEqual(get_stats_summary(holder)['total_pages_read'], 300)
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    # Two SQLite files stand in for a primary and a replica that has not
+    # caught up: writes land only on the primary, so any read that sees
+    # them must have been routed there.
+    def setUp(self):
+        self.paths = []
+        for _ in range(2):
+            handle, path = tempfile.mkstemp(suffix='.db')
+            os.close(handle)
+            self.paths.append(path)
+
+        class ReplicaConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.paths[0]
+            SQLALCHEMY_BINDS = {'replica': 'sqlite:///' + self.paths[1]}
+            RESPONSE_CACHE_BACKEND = 'none'
+            WTF_CSRF_ENABLED = False
+
+        self.app = create_app(ReplicaConfig)
+        self.app.config['SECRET_KEY'] = 'test'
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        db.create_all(bind_key=None)
+        db.metadata.create_all(db.engines['replica'])
+        for engine in (db.engine, db.engines['replica']):
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), {"username": "libraryuser", "email": "library@example.com", "password": "x"})
+        self.user_id = 1
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_ctx.pop()
+        # init_app registers a MetaData per bind key on the shared db object;
+        # drop it so later apps without the bind can still create_all().
+        db.metadatas.pop('replica', None)
+        for path in self.paths:
+            os.remove(path)
+
+    def logged_in_client(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user_id)
+        return client
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        add_book_to_library(self.user_id, make_book_data(1))
+        self.assertEqual(get_user_books(self.user_id), [])
+        self.assertEqual(UserBook.query.count(), 1)
+
+    def test_rollup_repair_reads_primary(self):
+        # A missing rollup is rebuilt and written back, so it has to be
+        # computed from the primary rather than the lagging replica.
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        UserStats.query.delete()
+        db.session.commit()
+        self.assertEqual(get_stats_summary(self.user_id)['total_books_read'], 1)
+        self.assertGreater(UserStats.query.filter_by(user_id=self.user_id).count(), 0)
+        with db.engines['replica'].connect() as connection:
+            self.assertEqual(connection.execute(UserStats.__table__.select()).all(), [])
+
+    def test_writer_reads_own_writes(self):
+        # From the browser that wrote and, through bump()'s mark, any other.
+        writer, other = self.logged_in_client(), self.logged_in_client()
+        writer.post('/add_book', json=make_book_data(1))
+        self.assertEqual([book['google_id'] for book in writer.get('/my_books').get_json()], ['gid1'])
+        self.assertEqual([book['google_id'] for book in other.get('/my_books').get_json()], ['gid1'])
+
+    def test_share_recipient_reads_primary(self):
+        # The recipient never wrote anything, but bump() marked them, so
+        # their next feed read (and the cached copy of it) sees the share.
+        for engine in (db.engine, db.engines['replica']):
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), {"username": "reader", "email": "reader@example.com", "password": "x"})
+        add_book_to_library(self.user_id, make_book_data(1))
+        user_book_id = UserBook.query.one().id
+        sharer, recipient = self.logged_in_client(), self.app.test_client()
+        with recipient.session_transaction() as sess:
+            sess['_user_id'] = '2'
+        response = sharer.post('/share_book', json={'book_id': user_book_id, 'username': 'reader', 'status': 'reading'})
+        self.assertEqual(response.status_code, 200)
+        g.pop('_login_user', None)
+        feed = recipient.get('/community_feed').get_json()
+        self.assertEqual([item['to_username'] for item in feed['feed']], ['reader'])
+
+    def test_pin_expires(self):
+        self.app.config['READ_YOUR_WRITES_SECONDS'] = 0.2
+        writer = self.logged_in_client()
+        writer.post('/add_book', json=make_book_data(1))
+        self.assertEqual(len(writer.get('/my_books').get_json()), 1)
+        time.sleep(0.3)
+        self.assertEqual(writer.get('/my_books').get_json(), [])
+
+class SQLiteProfileTestCase(unittest.TestCase):
+    def test_production_pragmas_and_pool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            class ProfileConfig(DeploymentConfig):
+                SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'profile.db')
+
+            app = create_app(ProfileConfig)
+            with app.app_context():
+                with db.engine.connect() as conn:
+                    settings = sqlite_settings(conn, ProfileConfig.SQLITE_PRAGMAS)
+                self.assertEqual(settings, {
+                    'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000,
+                    'cache_size': -65536, 'mmap_size': 268435456, 'temp_store': 2,
+                })
+                self.assertEqual(db.engine.pool.size(), ProfileConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_size'])
+                db.engine.dispose()
+
+    def test_testing_profile_is_untouched(self):
+        app = create_app(TestingConfig)
+        with app.app_context(), db.engine.connect() as conn:
+            self.assertEqual(sqlite_settings(conn, ['journal_mode', 'synchronous']),
+                             {'journal_mode': 'memory', 'synchronous': 2})
+
+class IndexUsageTestCase(AppTestCase):
+    FULL_SCAN = re.compile(r"^SCAN (user|user_book|book_share|book|user_stats|activity_feed_item)\b")
+
+    def record_statements(self, func):
+        calls = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            calls.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return [(st, params) for st, params in calls if st.lstrip().upper().startswith('SELECT')]
+
+    def assert_uses_indexes(self, func):
+        statements = self.record_statements(func)
+        with db.engine.connect() as conn:
+            for statement, params in statements:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).all()
+                for row in plan:
+                    self.assertIsNone(self.FULL_SCAN.match(row[-1]), f"{row[-1]} in {statement}")
+
+    def test_utils_queries_use_indexes(self):
+        other = User(username="otherreader", email="other@example.com", password="x")
+        db.session.add(other)
+        db.session.commit()
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        user_book = get_user_library_books(self.user_id)[0]
+        calls = [
+            lambda: get_user_library_books(self.user_id),
+            lambda: search_usernames("other", self.user_id),
+            lambda: get_user_library_items(self.user_id),
+            lambda: get_user_books(self.user_id),
+            lambda: add_book_to_library(self.user_id, make_book_data(1, "wishlist")),
+            lambda: share_book_with_user(self.user_id, user_book.id, "otherreader", "wishlist"),
+            lambda: get_community_feed(self.user_id),
+            lambda: get_community_feed_page(self.user_id),
+            lambda: get_stats_summary(self.user_id),
+            lambda: get_books_over_time(self.user_id),
+            lambda: get_pages_over_time(self.user_id),
+            lambda: get_genre_stats(self.user_id),
+            lambda: get_status_stats(self.user_id),
+            lambda: get_author_stats(self.user_id),
+            lambda: delete_book_from_library(self.user_id, user_book.id),
+        ]
+        for call in calls:
+            self.assert_uses_indexes(call)
+
+class UsernameSearchTestCase(AppTestCase):
+    def test_usernames_endpoint(self):
+        for i in range(12):
+            db.session.add(User(username=f"reader{i:02d}", email=f"r{i}@example.com", password="x"))
+        db.session.commit()
+        response = self.logged_in_client().get('/usernames?prefix=READER0&limit=5')
+        data = response.get_json()
+        self.assertEqual(data['usernames'], [f"reader{i:02d}" for i in range(5)])
+        self.assertTrue(data['has_more'])
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertIn('max-age=60', response.headers['Cache-Control'])
+
+class StatsSummaryTestCase(AppTestCase):
+    def add_book(self, i, status, genre, author, page_count):
+        data = make_book_data(i, status)
+        data.update(genre=genre, author=author, page_count=page_count)
+        add_book_to_library(self.user_id, data)
+
+    def test_summary_matches_library(self):
+        self.add_book(1, "completed", "Fantasy", "Tolkien", 300)
+        self.add_book(2, "completed", "Fantasy", "Tolkien", 120)
+        self.add_book(3, "completed", "Horror", "King", None)
+        self.add_book(4, "wishlist", "Horror", "King", 900)
+        self.add_book(5, "currently_reading", "Fantasy", "Tolkien", 50)
+        other = User(username="summaryfriend", email="friend@example.com", password="x")
+        db.session.add(other)
+        db.session.commit()
+        user_book = get_user_library_books(self.user_id)[0]
+        share_book_with_user(self.user_id, user_book.id, "summaryfriend", "completed")
+
+        with QueryCounter(db.engine) as counter:
+            summary = get_stats_summary(self.user_id)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(summary, {
+            "total_books_read": 3,
+            "total_pages_read": 420,
+            "favorite_genre": "Fantasy",
+            "most_read_author": "Tolkien",
+            "longest_book": {"title": "Book1", "pages": 300},
+            "shortest_book": {"title": "Book2", "pages": 120},
+            "books_shared": 1,
+        })
+
+    def test_summary_empty_library(self):
+        self.assertEqual(get_stats_summary(self.user_id), {
+            "total_books_read": 0,
+            "total_pages_read": 0,
+            "favorite_genre": None,
+            "most_read_author": None,
+            "longest_book": None,
+            "shortest_book": None,
+            "books_shared": 0,
+        })
+
+class UserStatsRollupTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.friend = User(username="rollupfriend", email="rollup@example.com", password="x")
+        db.session.add(self.friend)
+        db.session.commit()
+
+    def user_book_id(self, google_id):
+        return (
+            UserBook.query.join(Book)
+            .filter(UserBook.user_id == self.user_id, Book.google_id == google_id)
+            .one().id
+        )
+
+    def test_incremental_updates_match_live_recomputation(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        add_book_to_library(self.user_id, make_book_data(2, "completed"))
+        add_book_to_library(self.user_id, make_book_data(3, "wishlist"))
+        add_book_to_library(self.user_id, make_book_data(3, "completed"))
+        add_book_to_library(self.user_id, make_book_data(2, "currently_reading"))
+        share_book_with_user(self.user_id, self.user_book_id("gid1"), "rollupfriend", "completed")
+        delete_book_from_library(self.user_id, self.user_book_id("gid3"))
+        self.assertEqual(check_user_stats(self.user_id), [])
+
+        summary = get_stats_summary(self.user_id)
+        self.assertEqual(summary["total_books_read"], 1)
+        self.assertEqual(summary["total_pages_read"], 101)
+        self.assertEqual(summary["longest_book"], {"title": "Book1", "pages": 101})
+        self.assertEqual(summary["books_shared"], 1)
+        self.assertEqual(get_status_stats(self.user_id), {"Completed": 1, "Currently Reading": 1})
+
+    def test_backfilled_book_fields_rebuild_other_holders(self):
+        data = make_book_data(1, "completed")
+        data["genre"] = None
+        data["page_count"] = None
+        add_book_to_library(self.friend.id, data)
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        self.assertEqual(check_user_stats(self.friend.id), [])
+        self.assertEqual(get_genre_stats(self.friend.id), {"Fiction": 1})
+
+    def test_missing_rollups_are_built_on_read(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        UserStats.query.delete()
+        db.session.commit()
+        self.assertEqual(get_books_over_time(self.user_id, 'all'), {"labels": ["All Time"], "data": [1]})
+        self.assertEqual(check_user_stats(self.user_id), [])
+
+    def test_stats_cli_rebuild_and_check(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        UserStats.query.filter_by(dimension='genre').delete()
+        db.session.commit()
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['stats', 'check'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("genre", result.output)
+        result = runner.invoke(args=['stats', 'rebuild'])
+        self.assertEqual(result.exit_code, 0)
+        result = runner.invoke(args=['stats', 'check'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+class TimeBucketTestCase(AppTestCase):
+    def complete_on(self, i, date_completed, page_count=100):
+        book = Book(google_id=f"tb{i}", title=f"Timed{i}", author="Author", page_count=page_count)
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(UserBook(user_id=self.user_id, book_id=book.id, status="completed", date_completed=date_completed))
+        db.session.commit()
+
+    def setUp(self):
+        super().setUp()
+        self.complete_on(1, datetime(2020, 11, 20))
+        self.complete_on(2, datetime(2020, 12, 31), 50)
+        self.complete_on(3, datetime(2021, 1, 3), None)
+        self.complete_on(4, datetime(2021, 1, 4, 23, 59), 25)
+        rebuild_user_stats(self.user_id)
+        db.session.commit()
+
+    def test_sql_buckets_use_iso_weeks(self):
+        self.assertEqual(completion_series(self.user_id, 'week'), [
+            ('2020-W47', 1, 100), ('2020-W53', 2, 50), ('2021-W01', 1, 25)
+        ])
+        self.assertEqual(completion_series(self.user_id, 'month'), [
+            ('2020-11', 1, 100), ('2020-12', 1, 50), ('2021-01', 2, 25)
+        ])
+
+    def test_series_fill_empty_periods(self):
+        self.assertEqual(get_books_over_time(self.user_id, 'months'), {
+            "labels": ["Nov 2020", "Dec 2020", "Jan 2021"],
+            "data": [1, 1, 2]
+        })
+        weeks = get_pages_over_time(self.user_id, 'weeks')
+        self.assertEqual(weeks["labels"][0], "2020 W47")
+        self.assertEqual(weeks["labels"][-2:], ["2020 W53", "2021 W1"])
+        self.assertEqual(len(weeks["labels"]), 8)
+        self.assertEqual(sum(weeks["data"]), 175)
+        self.assertEqual(get_pages_over_time(self.user_id, 'years'), {"labels": ["2020", "2021"], "data": [150, 25]})
+        self.assertEqual(get_books_over_time(self.user_id, 'all'), {"labels": ["All Time"], "data": [4]})
+
+    def test_incremental_buckets_match_sql_buckets(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        self.assertEqual(check_user_stats(self.user_id), [])
+
+class StatsAllTestCase(AppTestCase):
+    def test_stats_all_matches_individual_endpoints(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        add_book_to_library(self.user_id, make_book_data(2, "wishlist"))
+        client = self.logged_in_client()
+        summary = client.get('/stats/summary').get_json()
+        with QueryCounter(db.engine) as counter:
+            payload = client.get('/stats/all?range=months').get_json()
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(payload["summary"], summary)
+        self.assertEqual(payload["books_over_time"], client.get('/stats/books_over_time?range=months').get_json())
+        self.assertEqual(payload["pages_over_time"], client.get('/stats/pages_over_time?range=months').get_json())
+        self.assertEqual(payload["genres"], client.get('/stats/genres').get_json())
+        self.assertEqual(payload["statuses"], client.get('/stats/statuses').get_json())
+        self.assertEqual(payload["authors"], client.get('/stats/authors').get_json())
+
+    def test_stats_all_etag_revalidation(self):
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        client = self.logged_in_client()
+        first = client.get('/stats/all')
+        etag = first.headers['ETag']
+        self.assertEqual(client.get('/stats/all', headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(client.get('/stats/all?range=weeks', headers={'If-None-Match': etag}).status_code, 200)
+
+        add_book_to_library(self.user_id, make_book_data(2, "completed"))
+        changed = client.get('/stats/all', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        self.assertEqual(changed.get_json()["summary"]["total_books_read"], 2)
+
+    def test_unknown_range_falls_back_to_months(self):
+        client = self.logged_in_client()
+        response = client.get('/stats/all?range=%22')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['ETag'].endswith('-months"'))
+        self.assertEqual(response.get_json(), client.get('/stats/all?range=months').get_json())
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+class ResponseCacheTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.friend = User(username="cachefriend", email="cache@example.com", password="x")
+        db.session.add(self.friend)
+        db.session.commit()
+        self.friend_id = self.friend.id
+
+    def test_repeat_requests_are_served_from_cache(self):
+        add_book_to_library(self.user_id, make_book_data(1))
+        client = self.logged_in_client()
+        first = client.get('/my_books').get_json()
+        with QueryCounter(db.engine) as counter:
+            second = client.get('/my_books').get_json()
+        self.assertEqual(first, second)
+        self.assertEqual(counter.count, 0)
+        metrics = response_cache.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 1))
+        self.assertEqual(client.get('/cache_metrics').status_code, 404)
+
+    def test_writes_invalidate_cached_responses(self):
+        client = self.logged_in_client()
+        self.assertEqual(client.get('/my_books').get_json(), [])
+        add_book_to_library(self.user_id, make_book_data(1, "completed"))
+        self.assertEqual(len(client.get('/my_books').get_json()), 1)
+        self.assertEqual(client.get('/stats/summary').get_json()['total_books_read'], 1)
+        delete_book_from_library(self.user_id, get_user_library_books(self.user_id)[0].id)
+        self.assertEqual(client.get('/my_books').get_json(), [])
+        self.assertEqual(client.get('/stats/summary').get_json()['total_books_read'], 0)
+
+    def test_share_invalidates_recipient_feed(self):
+        friend_client = self.app.test_client()
+        with friend_client.session_transaction() as sess:
+            sess['_user_id'] = str(self.friend_id)
+        self.assertEqual(friend_client.get('/community_feed').get_json()['feed'], [])
+        add_book_to_library(self.user_id, make_book_data(1))
+        share_book_with_user(self.user_id, get_user_library_books(self.user_id)[0].id, "cachefriend", "wishlist")
+        self.assertEqual(len(friend_client.get('/community_feed').get_json()['feed']), 1)
+
+    def test_redis_compatible_backend(self):
+        fake = FakeRedis()
+        response_cache.use(RedisCache(fake, ttl=60))
+        client = self.logged_in_client()
+        client.get('/stats/genres')
+        client.get('/stats/genres')
+        self.assertEqual(response_cache.metrics()['hits'], 1)
+        self.assertTrue(any(key.startswith('booktracker:resp:') for key in fake.data))
+
+    def test_lru_eviction_and_ttl(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1')
+        cache.set('d', b'4', ttl=-1)
+        self.assertIsNone(cache.get('d'))
+
+class CommunityFeedTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.friend = User(username="feedfriend", email="feed@example.com", password="x")
+        db.session.add(self.friend)
+        db.session.commit()
+        self.friend_id = self.friend.id
+        add_book_to_library(self.user_id, make_book_data(1))
+        add_book_to_library(self.friend_id, make_book_data(2))
+        own = get_user_library_books(self.user_id)[0].id
+        theirs = get_user_library_books(self.friend_id)[0].id
+        for i in range(13):
+            share_book_with_user(self.user_id, own, "feedfriend", "wishlist")
+            share_book_with_user(self.friend_id, theirs, "libraryuser", "wishlist")
+        db.session.expire_all()
+
+    def expected_share_ids(self):
+        return [share.id for share in BookShare.query.order_by(BookShare.timestamp.desc(), BookShare.id.desc())]
+
+    def test_cursor_pages_walk_whole_feed_once(self):
+        client = self.logged_in_client()
+        client.get('/community_feed')
+        seen, cursor, pages = [], None, 0
+        while True:
+            url = '/community_feed' + (f'?cursor={cursor}' if cursor else '')
+            with QueryCounter(db.engine) as counter:
+                data = client.get(url).get_json()
+            self.assertEqual(counter.count, 1 if pages else 0)
+            seen.extend(item['title'] for item in data['feed'])
+            pages += 1
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 26)
+
+    def test_keyset_order_matches_timestamp_then_id(self):
+        from app.community import feed_page
+        ids, after = [], None
+        while True:
+            items, after = feed_page(self.user_id, after, limit=4)
+            ids.extend(item.share_id for item in items)
+            if after is None:
+                break
+        self.assertEqual(ids, self.expected_share_ids())
+
+    def test_legacy_page_mode(self):
+        client = self.logged_in_client()
+        data = client.get('/community_feed?page=3').get_json()
+        self.assertEqual((data['page'], data['pages'], len(data['feed'])), (3, 3, 6))
+        self.assertFalse(data['has_next'])
+
+    def test_share_fans_out_to_both_inboxes(self):
+        share = BookShare.query.order_by(BookShare.id.desc()).first()
+        items = ActivityFeedItem.query.filter_by(share_id=share.id).all()
+        self.assertEqual({item.user_id for item in items}, {self.user_id, self.friend_id})
+        self.assertEqual(items[0].title, "Book2")
+        self.assertEqual(items[0].from_username, "feedfriend")
+
+    def test_backfill_and_prune_commands(self):
+        ActivityFeedItem.query.delete()
+        db.session.commit()
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['feed', 'backfill', '--batch-size', '5'])
+        self.assertIn("Created 52", result.output)
+        result = runner.invoke(args=['feed', 'backfill', '--before', '2999-01-01'])
+        self.assertIn("Created 0", result.output)
+        self.assertEqual(self.expected_share_ids(), [
+            item.share_id for item in ActivityFeedItem.query.filter_by(user_id=self.user_id)
+            .order_by(ActivityFeedItem.timestamp.desc(), ActivityFeedItem.id.desc())
+        ])
+        result = runner.invoke(args=['feed', 'prune', '--keep', '5'])
+        self.assertIn("Pruned 42", result.output)
+        self.assertEqual(ActivityFeedItem.query.filter_by(user_id=self.user_id).count(), 5)
+        result = runner.invoke(args=['feed', 'prune', '--days', '0'])
+        self.assertEqual(ActivityFeedItem.query.count(), 0)
+
+    def test_cursor_survives_pruned_anchor(self):
+        from app.community import feed_page
+        first, after = feed_page(self.user_id, limit=4)
+        ActivityFeedItem.query.filter_by(id=first[-1].id).delete()
+        db.session.commit()
+        rest, _ = feed_page(self.user_id, after, limit=30)
+        self.assertEqual([item.share_id for item in first + rest], self.expected_share_ids())
+
+    def test_backfill_skips_pruned_shares(self):
+        from app.community import backfill_activity_feed
+        oldest = self.expected_share_ids()[-10:]
+        ActivityFeedItem.query.filter(ActivityFeedItem.share_id.in_(oldest)).delete()
+        db.session.commit()
+        with self.assertRaises(ValueError):
+            backfill_activity_feed()
+        cutoff = BookShare.query.filter(BookShare.id.in_(oldest)).order_by(BookShare.timestamp.desc()).first().timestamp
+        self.assertEqual(backfill_activity_feed(before=cutoff), 18)
+        result = self.app.test_cli_runner().invoke(args=['feed', 'backfill'])
+        self.assertIn("pass the time the inbox went live", result.output)
+
+    def test_invalid_cursor_is_rejected(self):
+        client = self.logged_in_client()
+        self.assertEqual(client.get('/community_feed?cursor=bogus').status_code, 400)
+
+class FakeBooksClient:
+    def __init__(self, status=200, gate=None):
+        self.status = status
+        self.gate = gate
+        self.urls = []
+        self.called = threading.Event()
+
+    def get(self, url):
+        self.urls.append(url)
+        self.called.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.status is None:
+            raise OSError("connection refused")
+        return self.status, json.dumps({'url': url, 'items': []}).encode()
+
+class GoogleBooksProxyTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fake = FakeBooksClient()
+        google_books.use_client(self.fake)
+        self.proxy = google_books.proxy
+        self.now = 1_000_000.0
+        self.proxy.clock = lambda: self.now
+
+    def test_search_is_fetched_once_then_cached(self):
+        client = self.app.test_client()
+        first = client.get('/api/books/search?q=dune&maxResults=20&orderBy=relevance')
+        second = client.get('/api/books/search?q=dune&maxResults=20&orderBy=relevance')
+        self.assertEqual((first.headers['X-Cache'], second.headers['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.get_json(), second.get_json())
+        self.assertEqual(len(self.fake.urls), 1)
+        self.assertIn('/volumes?q=dune&maxResults=20&orderBy=relevance', self.fake.urls[0])
+        self.assertIn('public', second.headers['Cache-Control'])
+
+    def test_expired_entry_is_served_stale_and_refreshed(self):
+        client = self.app.test_client()
+        client.get('/api/books/abc123')
+        self.now += self.proxy.volume_ttl + 1
+        response = client.get('/api/books/abc123')
+        self.assertEqual(response.headers['X-Cache'], 'STALE')
+        deadline = time.monotonic() + 5
+        while self.proxy.store.get('volume:abc123').expires_at <= self.now and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.fake.urls), 2)
+        self.assertEqual(client.get('/api/books/abc123').headers['X-Cache'], 'HIT')
+
+    def test_concurrent_identical_misses_share_one_fetch(self):
+        self.fake.gate = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.proxy.search('dune')))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.proxy.metrics['coalesced'] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.fake.gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.fake.urls), 1)
+        self.assertEqual(len({body for _, body, _ in results}), 1)
+
+    def test_upstream_failure(self):
+        client = self.app.test_client()
+        client.get('/api/books/abc123')
+        self.fake.status = None
+        self.now += self.proxy.volume_ttl + self.proxy.stale_ttl + 1
+        self.assertEqual(client.get('/api/books/abc123').headers['X-Cache'], 'STALE')
+        self.assertEqual(client.get('/api/books/other').status_code, 502)
+        self.fake.status = 503
+        self.assertEqual(client.get('/api/books/search?q=dune').status_code, 502)
+
+    def test_search_parameters_are_normalised_and_clamped(self):
+        client = self.app.test_client()
+        client.get('/api/books/search?q=Dune%20%20Messiah')
+        self.assertEqual(client.get('/api/books/search?q=dune messiah').headers['X-Cache'], 'HIT')
+        client.get('/api/books/search?q=dune&maxResults=5000&orderBy=bogus&startIndex=100000')
+        self.assertEqual(len(self.fake.urls), 2)
+        self.assertIn('maxResults=40&orderBy=relevance&startIndex=400', self.fake.urls[1])
+
+    def test_store_evicts_least_recently_fetched(self):
+        store = SQLiteStore(':memory:', max_entries=2)
+        for i, key in enumerate(('a', 'b', 'c')):
+            store.set(key, 200, b'{}', float(i), float(i) + 60)
+        self.assertIsNone(store.get('a'))
+        self.assertIsNotNone(store.get('c'))
+
+    def test_catalogue_requests_are_rate_limited(self):
+        self.app.extensions['google_books_limiter'] = RateLimiter(rate=0.5, burst=2, clock=lambda: self.now)
+        client = self.app.test_client()
+        statuses = [client.get(f'/api/books/search?q=q{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = client.get('/api/books/abc123')
+        self.assertEqual((response.status_code, response.headers['Retry-After']), (429, '2'))
+        other = self.app.test_client().get('/api/books/abc123', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(other.status_code, 200)
+        self.now += 2
+        self.assertEqual(client.get('/api/books/abc123').status_code, 200)
+        self.assertEqual(len(self.fake.urls), 3)
+
+    def test_invalid_requests_skip_upstream(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/api/books/search?q=').status_code, 400)
+        self.assertEqual(client.get('/api/books/bad%20id').status_code, 404)
+        self.assertEqual(self.fake.urls, [])
+
+class BookSearchTestCase(AppTestCase):
+    backend = 'fts5'
+
+    def setUp(self):
+        super().setUp()
+        self.app.extensions['book_search']['backend'] = self.backend
+        for i, (title, author, description) in enumerate([
+            ("Harry Potter and the Philosopher's Stone", "J. K. Rowling", "A boy wizard."),
+            ("The Hobbit", "J. R. R. Tolkien", "There and back again, with a wizard."),
+            ("Cien años de soledad", "Gabriel García Márquez", "Macondo."),
+            ("Potting Sheds", "Harriet Green", "Gardening."),
+        ]):
+            add_book_to_library(self.user_id, dict(make_book_data(i), title=title, author=author, description=description))
+
+    def titles(self, query):
+        return [book['title'] for book in search_books(query)]
+
+    def test_prefix_terms_must_all_match(self):
+        self.assertCountEqual(self.titles("harr pot"), ["Harry Potter and the Philosopher's Stone", "Potting Sheds"])
+        self.assertEqual(self.titles("harry potter"), ["Harry Potter and the Philosopher's Stone"])
+        self.assertEqual(self.titles("dragon"), [])
+
+    def test_title_matches_outrank_description_matches(self):
+        add_book_to_library(self.user_id, dict(make_book_data(9), title="Wizard's First Rule", author="Terry Goodkind"))
+        self.assertEqual(self.titles("wizard")[0], "Wizard's First Rule")
+        self.assertEqual(len(self.titles("wizard")), 3)
+
+    def test_accents_are_folded(self):
+        self.assertEqual(self.titles("anos marquez"), ["Cien años de soledad"])
+
+    def test_backfilled_fields_are_reindexed(self):
+        add_book_to_library(self.user_id, dict(make_book_data(20), title="Untitled", genre=None))
+        self.assertEqual(self.titles("horror"), [])
+        add_book_to_library(self.user_id, dict(make_book_data(20), title="Untitled", genre="Horror"))
+        self.assertEqual(self.titles("horror"), ["Untitled"])
+
+    def test_search_endpoint(self):
+        client = self.app.test_client()
+        data = client.get('/search?q=tolk&limit=5').get_json()
+        self.assertEqual(self.app.extensions['book_search']['index'].name, self.backend)
+        self.assertEqual([book['google_id'] for book in data['results']], ['gid1'])
+        self.assertEqual(client.get('/search?q=').status_code, 400)
+
+    def test_rebuild_command(self):
+        result = self.app.test_cli_runner().invoke(args=['search', 'rebuild'])
+        self.assertIn(f"Indexed 4 book(s) with the {self.backend} backend", result.output)
+        self.assertEqual(self.titles("hobbit"), ["The Hobbit"])
+
+class PythonBookSearchTestCase(BookSearchTestCase):
+    backend = 'python'
+
+    def test_index_catches_up_with_other_workers(self):
+        # Rows written straight to the table stand in for another worker,
+        # whose index_books() calls never reach this process's index.
+        self.assertEqual(self.titles("hobbit"), ["The Hobbit"])
+        index = self.app.extensions['book_search']['index']
+        db.session.execute(Book.__table__.insert(), {"google_id": "elsewhere", "title": "Dune", "author": "Frank Herbert"})
+        db.session.execute(Book.__table__.update().where(Book.title == "The Hobbit").values(genre="Fantasy"))
+        db.session.commit()
+        self.assertEqual(self.titles("dune"), [])
+        index.refresh_seconds = 0
+        self.assertEqual(self.titles("dune"), ["Dune"])
+        self.assertEqual(self.titles("fantasy"), [])
+        index.max_age = 0.01
+        time.sleep(0.02)
+        self.assertEqual(self.titles("fantasy"), ["The Hobbit"])
+
+GOODREADS_EXPORT = '''Book Id,Title,Author,ISBN,ISBN13,Number of Pages,Date Read,Date Added,Exclusive Shelf
+1,Dune,Frank Herbert,"=""0441013597""","=""9780441013593""",604,2023/05/01,2023/01/02,read
+2,Emma,Jane Austen,,,474,,2023/02/03,currently-reading
+3,Ulysses,James Joyce,,,730,,2023/03/04,to-read
+4,,Nobody,,,,,,read
+'''
+
+class ImportLibraryTestCase(AppTestCase):
+    def jsonl(self, rows):
+        return io.BytesIO(''.join(json.dumps(row) + '\n' for row in rows).encode())
+
+    def test_jsonl_import_upserts_in_batches(self):
+        add_book_to_library(self.user_id, make_book_data(0, "wishlist"))
+        rows = [make_book_data(i, "completed" if i % 2 else "wishlist") for i in range(100)]
+        rows.append(dict(make_book_data(0), status="completed"))
+        progress = []
+        with QueryCounter(db.engine) as counter:
+            report = import_library(self.user_id, read_import(self.jsonl(rows), 'books.jsonl'), 25,
+                                    lambda r: progress.append(r['rows']))
+        self.assertEqual(progress, [25, 50, 75, 100, 101])
+        self.assertEqual((report['books_created'], report['added'], report['updated']), (99, 99, 1))
+        # Five batches of a select, the inserts and an update each; the rest
+        # is the one-off statistics rebuild.
+        batch_statements = [st for st in counter.statements if 'user_stats' not in st and 'user_book.date_completed' not in st]
+        self.assertLess(len(batch_statements), 40)
+        self.assertEqual(UserBook.query.filter_by(user_id=self.user_id).count(), 100)
+        self.assertEqual(get_stats_summary(self.user_id)['total_books_read'], 51)
+        self.assertEqual(check_user_stats(self.user_id), [])
+        self.assertEqual([b['google_id'] for b in search_books("book42")], ["gid42"])
+
+        report = import_library(self.user_id, read_import(self.jsonl(rows), 'books.jsonl'))
+        self.assertEqual((report['books_created'], report['added'], report['updated']), (0, 0, 0))
+
+    def test_goodreads_export(self):
+        stream = io.BytesIO(GOODREADS_EXPORT.encode('utf-8-sig'))
+        report = import_library(self.user_id, read_import(stream, 'goodreads_library_export.csv'))
+        self.assertEqual((report['added'], report['skipped']), (3, 1))
+        self.assertIn("line 5", report['errors'][0])
+        statuses = {ub.book.title: (ub.status, ub.date_completed) for ub in get_user_library_books(self.user_id)}
+        self.assertEqual(statuses["Dune"], ("completed", datetime(2023, 5, 1)))
+        self.assertEqual(statuses["Emma"][0], "currently_reading")
+        self.assertEqual(Book.query.filter_by(title="Dune").one().description, "ISBN 9780441013593")
+        import_library(self.user_id, read_import(io.BytesIO(GOODREADS_EXPORT.encode()), 'export.csv'))
+        self.assertEqual(Book.query.count(), 3)
+
+    def test_upload_and_cli(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        csv_file = io.BytesIO(b"google_id,title,author,status\ng1,One,A,completed\ng2,Two,B,wishlist\n")
+        response = self.logged_in_client().post('/import_library', data={'file': (csv_file, 'books.csv')})
+        self.assertEqual(response.get_json()['added'], 2)
+        response = self.logged_in_client().post('/import_library', data={'file': (io.BytesIO(b''), 'x'), 'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+        path = self.app.instance_path + '-import-test.jsonl'
+        with open(path, 'wb') as f:
+            f.write(self.jsonl([make_book_data(i) for i in range(5)]).getvalue())
+        try:
+            result = self.app.test_cli_runner().invoke(args=['import-library', path, '--user', 'libraryuser', '--batch-size', '2'])
+        finally:
+            os.remove(path)
+        self.assertIn("Imported 5 row(s)", result.output)
+        self.assertEqual(UserBook.query.filter_by(user_id=self.user_id).count(), 7)
+
+    def test_unreadable_upload_is_rejected(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        latin1 = GOODREADS_EXPORT.replace("Emma", "Émile").encode('latin-1')
+        response = self.logged_in_client().post('/import_library', data={'file': (io.BytesIO(latin1), 'export.csv')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("UTF-8", response.get_json()['error'])
+
+    def test_existing_books_are_matched_and_backfilled(self):
+        friend = User(username="importfriend", email="importfriend@example.com", password="x")
+        db.session.add(friend)
+        db.session.commit()
+        add_book_to_library(friend.id, dict(make_book_data(1, "completed"), genre=None))
+        db.session.add(Book(title="The Hobbit", author="J.R.R. Tolkien"))
+        db.session.commit()
+        rows = [dict(make_book_data(1), genre="Fantasy"),
+                {"title": "the hobbit", "author": "j.r.r. tolkien", "status": "wishlist"}]
+        report = import_library(self.user_id, read_import(self.jsonl(rows), 'books.jsonl'))
+        self.assertEqual((report['books_created'], report['added']), (0, 2))
+        self.assertEqual(Book.query.count(), 2)
+        self.assertEqual(Book.query.filter_by(google_id="gid1").one().genre, "Fantasy")
+        self.assertEqual(get_stats_summary(friend.id)['favorite_genre'], "Fantasy")
+        self.assertEqual(check_user_stats(friend.id), [])
+
+    def test_failed_batch_still_refreshes_stats(self):
+        def rows():
+            for i in range(4):
+                yield i + 1, dict(make_book_data(i), status="completed")
+            raise OSError("connection lost")
+
+        client = self.logged_in_client()
+        self.assertEqual(client.get('/stats/summary').get_json()['total_books_read'], 0)
+        with self.assertRaises(OSError):
+            import_library(self.user_id, rows(), batch_size=2)
+        self.assertEqual(UserBook.query.filter_by(user_id=self.user_id).count(), 4)
+        self.assertEqual(check_user_stats(self.user_id), [])
+        self.assertEqual(client.get('/stats/summary').get_json()['total_books_read'], 4)
+
+    def test_entries_added_concurrently_are_updated(self):
+        # The first lookup misses the entry, as if another writer added it
+        # between that select and the insert.
+        from app import importer
+        add_book_to_library(self.user_id, make_book_data(1, "wishlist"))
+        lookup = importer.library_rows
+        calls = []
+
+        def racing_lookup(user_id, book_ids):
+            calls.append(book_ids)
+            return {} if len(calls) == 1 else lookup(user_id, book_ids)
+
+        with mock.patch.object(importer, 'library_rows', racing_lookup):
+            report = import_library(self.user_id, [(2, dict(make_book_data(1), status="completed", date_completed="2023-05-01"))])
+        self.assertEqual((report['added'], report['updated']), (0, 1))
+        self.assertEqual(UserBook.query.filter_by(user_id=self.user_id).one().status, "completed")
+        self.assertEqual(check_user_stats(self.user_id), [])
+
+    def test_refresh_error_does_not_mask_import_error(self):
+        from app import importer
+
+        def rows():
+            yield 1, dict(make_book_data(1), status="completed")
+            raise OSError("connection lost")
+
+        with mock.patch.object(importer, 'rebuild_user_stats', side_effect=RuntimeError("database is locked")) as rebuild:
+            with self.assertLogs('app.importer', 'ERROR'):
+                with self.assertRaises(OSError):
+                    import_library(self.user_id, rows(), batch_size=1)
+            rebuild.reset_mock()
+            with self.assertRaises(OSError):
+                import_library(self.user_id, rows(), batch_size=2)
+            rebuild.assert_not_called()
+
+class ExportLibraryTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        statuses = ("wishlist", "currently_reading", "completed")
+        for i in range(30):
+            add_book_to_library(self.user_id, make_book_data(i, statuses[i % 3]))
+
+    def test_formats_stream_as_attachments(self):
+        client = self.logged_in_client()
+        response = client.get('/export?format=csv')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=booktracker-libraryuser.csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['google_id'] for row in rows], [f"gid{i}" for i in range(30)])
+        self.assertEqual(rows[2]['status'], "completed")
+        self.assertTrue(rows[2]['date_completed'])
+
+        items = json.loads(client.get('/export?format=json').get_data(as_text=True))
+        lines = client.get('/export?format=jsonl').get_data(as_text=True).splitlines()
+        self.assertEqual(items, [json.loads(line) for line in lines])
+        self.assertEqual(items[5]['page_count'], 105)
+        self.assertEqual(client.get('/export?format=xml').status_code, 400)
+
+    def test_large_exports_leave_in_chunks(self):
+        original = export.CHUNK_SIZE
+        export.CHUNK_SIZE = 512
+        try:
+            chunks = list(export.library_export(self.user_id, 'jsonl'))
+        finally:
+            export.CHUNK_SIZE = original
+        self.assertGreater(len(chunks), 5)
+        self.assertEqual(len(''.join(chunks).splitlines()), 30)
+
+    def test_export_round_trips_through_import(self):
+        other = User(username="exportcopy", email="copy@example.com", password="x")
+        db.session.add(other)
+        db.session.commit()
+        exported = ''.join(export.library_export(self.user_id, 'csv')).encode()
+        import_library(other.id, read_import(io.BytesIO(exported), 'library.csv'))
+        library = lambda uid: sorted((b['google_id'], b['status']) for b in get_user_books(uid))
+        self.assertEqual(library(other.id), library(self.user_id))
+
+    def test_sharded_cli_export(self):
+        for i in range(3):
+            user = User(username=f"shardreader{i}", email=f"s{i}@example.com", password="x")
+            db.session.add(user)
+            db.session.commit()
+            add_book_to_library(user.id, make_book_data(100 + i))
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.app.test_cli_runner().invoke(
+                args=['export-libraries', directory, '--shards', '3', '--workers', '1', '--format', 'jsonl']
+            )
+            self.assertIn("Exported 33 row(s) in 3 shard(s)", result.output)
+            records = []
+            for name in sorted(os.listdir(directory)):
+                with open(os.path.join(directory, name)) as f:
+                    records.extend(json.loads(line) for line in f)
+        self.assertEqual(sum(1 for r in records if r['username'] == "libraryuser"), 30)
+        self.assertEqual(len({r['username'] for r in records}), 4)
+        for option in ('--shards', '--workers'):
+            result = self.app.test_cli_runner().invoke(args=['export-libraries', directory, option, '0'])
+            self.assertEqual(result.exit_code, 2, option)
+
+    def test_shard_ranges_are_contiguous_and_balanced(self):
+        UserBook.query.delete()
+        db.session.commit()
+        user_ids = []
+        for i in range(4):
+            user = User(username=f"rangereader{i}", email=f"r{i}@example.com", password="x")
+            db.session.add(user)
+            db.session.commit()
+            user_ids.append(user.id)
+            for j in range(10):
+                add_book_to_library(user.id, make_book_data(200 + 10 * i + j))
+        ranges = export.shard_ranges(4)
+        self.assertEqual(ranges, [(None, user_ids[1]), (user_ids[1], user_ids[2]), (user_ids[2], user_ids[3]), (user_ids[3], None)])
+        with QueryCounter(db.engine) as counter:
+            with tempfile.NamedTemporaryFile(suffix='.jsonl') as f:
+                self.assertEqual(export.export_shard(ranges[2], f.name, 'jsonl'), 10)
+        self.assertNotIn('%', counter.statements[0])
+
+class PasswordHashingTestCase(AppTestCase):
+    def login_form(self, password):
+        return DummyForm("libraryuser", None, password, None)
+
+    def test_login_upgrades_outdated_hashes(self):
+        self.user.password = generate_password_hash("Password1", "pbkdf2:sha256:1000")
+        db.session.commit()
+        self.assertEqual(validate_login_form(self.login_form("Wrong1")), (False, None))
+        self.assertTrue(self.user.password.startswith("pbkdf2:sha256:1000$"))
+        valid, user = validate_login_form(self.login_form("Password1"))
+        self.assertTrue(valid)
+        self.assertTrue(db.session.get(User, self.user_id).password.startswith("scrypt:"))
+        validate_login_form(self.login_form("Password1"))
+        self.assertEqual(password_hasher.pool.metrics, {'hashes': 0, 'checks': 3, 'rehashes': 1, 'rejected': 0})
+
+    def test_pool_hashes_in_worker_process_and_rejects_when_full(self):
+        pool = HashingPool("pbkdf2:sha256:1000", workers=1, queue_size=0)
+        try:
+            stored = pool.hash("Password1")
+            self.assertTrue(stored.startswith("pbkdf2:sha256:1000$"))
+            self.assertEqual(pool.check(stored, "Password1"), (True, None))
+            self.assertEqual(pool.check(stored, "Password2"), (False, None))
+
+            self.app.extensions['password_hasher'] = pool
+            self.app.config['WTF_CSRF_ENABLED'] = False
+            pool.slots.acquire()
+            response = self.app.test_client().post('/login', data={'username': "libraryuser", 'password': "Password1"})
+            pool.slots.release()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assertEqual(pool.metrics['rejected'], 1)
+        finally:
+            pool.close()
+
+class IdentityCacheTestCase(AppTestCase):
+    def test_loader_caches_principal_without_password(self):
+        with QueryCounter(db.engine) as counter:
+            principal = identity_cache.load(self.user_id)
+        self.assertEqual(counter.count, 1)
+        self.assertNotIn("password", counter.statements[0])
+        self.assertEqual((principal.id, principal.username), (self.user_id, "libraryuser"))
+        self.assertFalse(hasattr(principal, '__dict__'))
+        self.assertEqual(self.count_queries(lambda: identity_cache.load(self.user_id)), 0)
+        self.assertIsNone(identity_cache.load(self.user_id + 100))
+
+    def test_cached_json_request_runs_no_queries(self):
+        client = self.logged_in_client()
+        client.get('/my_books')
+        g.pop('_login_user', None)  # the test's app context would otherwise keep the user loaded
+        self.assertEqual(self.count_queries(lambda: client.get('/my_books')), 0)
+        self.assertEqual(g._login_user.username, "libraryuser")
+
+    def test_account_changes_invalidate_on_commit(self):
+        identity_cache.load(self.user_id)
+        self.user.username = "renameduser"
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(identity_cache.load(self.user_id).username, "libraryuser")
+        self.user.username = "renameduser"
+        db.session.commit()
+        self.assertEqual(identity_cache.load(self.user_id).username, "renameduser")
+        db.session.delete(self.user)
+        db.session.commit()
+        self.assertIsNone(identity_cache.load(self.user_id))
+        metrics = self.scrape_metrics().get_data(as_text=True)
+        self.assertIn('booktracker_identity_cache_total{result="invalidations"} 2', metrics)
+
+class DashboardSummaryTestCase(AppTestCase):
+    def test_flags_come_from_one_exists_probe(self):
+        self.assertEqual(self.count_queries(lambda: get_dashboard_summary(self.user_id)), 1)
+        summary = get_dashboard_summary(self.user_id)
+        self.assertEqual((summary['has_feed'], summary['has_currently_reading']), (False, False))
+        add_book_to_library(self.user_id, make_book_data(0, "currently_reading"))
+        with QueryCounter(db.engine) as counter:
+            summary = get_dashboard_summary(self.user_id)
+        self.assertIn("EXISTS", counter.statements[0])
+        self.assertEqual((summary['has_feed'], summary['has_currently_reading']), (False, True))
+        self.assertEqual(summary['currently_reading'], [])
+
+    def test_dashboard_renders_first_pages_inline(self):
+        friend = User(username="dashfriend", email="dash@example.com", password="x")
+        db.session.add(friend)
+        db.session.commit()
+        for i in range(8):
+            add_book_to_library(self.user_id, make_book_data(i, "currently_reading"))
+        share_book_with_user(self.user_id, get_user_library_books(self.user_id)[0].id, "dashfriend", "wishlist")
+        client = self.logged_in_client()
+        client.get('/dashboard')
+        small = self.count_queries(lambda: client.get('/dashboard'))
+        self.add_books(8, 30)
+        client.get('/dashboard')
+        large = self.count_queries(lambda: client.get('/dashboard'))
+        self.assertEqual(small, large)
+
+        html = client.get('/dashboard').get_data(as_text=True)
+        self.assertIn("You shared <b>Book", html)
+        self.assertEqual(html.count('class="book-card'), 5)
+        self.assertIn("See your library", html)
+        self.assertNotIn("community.js", html)
+
+class CSRFTokenTestCase(AppTestCase):
+    def page_token(self, client):
+        html = client.get('/library').get_data(as_text=True)
+        match = re.search(r'<meta name="csrf-token" content="([^"]+)" data-max-age="(\d*)"', html)
+        self.assertIsNotNone(match)
+        self.assertEqual(match.group(2), "3600")
+        return match.group(1)
+
+    def test_page_token_authorises_writes(self):
+        self.add_books(0, 2)
+        client = self.logged_in_client()
+        token = self.page_token(client)
+        user_book_id = UserBook.query.filter_by(user_id=self.user_id).first().id
+        response = client.delete(f'/delete_book/{user_book_id}', headers={'X-CSRFToken': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(UserBook.query.filter_by(user_id=self.user_id).count(), 1)
+
+    def test_missing_token_is_flagged_for_retry(self):
+        self.add_books(0, 1)
+        client = self.logged_in_client()
+        self.page_token(client)
+        user_book_id = UserBook.query.filter_by(user_id=self.user_id).first().id
+        response = client.delete(f'/delete_book/{user_book_id}')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.get_json()['csrf'])
+        self.assertEqual(client.get('/my_books').status_code, 200)
+
+class SQLProfilingTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+
+        def repeated_lookups():
+            for _ in range(3):
+                db.session.execute(db.select(User.id).where(User.id == self.user_id)).all()
+            return 'ok'
+        self.app.add_url_rule('/repeated-lookups', 'repeated_lookups', repeated_lookups)
+
+    def test_server_timing_counts_request_queries(self):
+        client = self.logged_in_client()
+        with QueryCounter(db.engine) as counter:
+            response = client.get('/my_books')
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        self.assertIn(f'desc="{counter.count} queries"', timing)
+
+    def test_repeated_statements_are_reported(self):
+        self.app.config['SQL_REPEATED_QUERY_THRESHOLD'] = 3
+        with self.assertLogs('app.profiling', 'WARNING') as logs:
+            self.app.test_client().get('/repeated-lookups')
+        self.assertTrue(any("possible N+1 in repeated_lookups: statement ran 3 times" in line for line in logs.output))
+        metrics = self.scrape_metrics().get_data(as_text=True)
+        self.assertIn('booktracker_request_repeated_queries_total{endpoint="repeated_lookups"} 1', metrics)
+
+    def test_slow_queries_are_logged(self):
+        self.app.config['SQL_SLOW_QUERY_MS'] = 0
+        with self.assertLogs('app.profiling', 'WARNING') as logs:
+            get_user_books(self.user_id)
+        self.assertTrue(all(line.startswith("WARNING:app.profiling:slow query") for line in logs.output))
+        metrics = self.scrape_metrics().get_data(as_text=True)
+        self.assertRegex(metrics, r'booktracker_sql_slow_queries_total [1-9]')
+
+    def test_metrics_endpoint(self):
+        client = self.logged_in_client()
+        client.get('/my_books')
+        client.get('/my_books')
+        response = self.scrape_metrics()
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        metrics = response.get_data(as_text=True)
+        self.assertIn('# TYPE booktracker_request_duration_seconds histogram', metrics)
+        self.assertIn('booktracker_request_duration_seconds_count{endpoint="main.my_books"} 2', metrics)
+        self.assertIn('booktracker_request_duration_seconds_bucket{endpoint="main.my_books",le="+Inf"} 2', metrics)
+        self.assertIn('booktracker_response_cache_total{result="hits"} 1', metrics)
+        self.assertIn('# TYPE booktracker_sql_query_duration_seconds histogram', metrics)
+
+    def test_metrics_token(self):
+        client = self.logged_in_client()
+        self.assertEqual(client.get('/metrics').status_code, 404)
+        self.app.config['METRICS_TOKEN'] = 'scrape'
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code, 200)
+
+    def test_failed_statements_do_not_leak_start_times(self):
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    conn.exec_driver_sql("SELECT * FROM no_such_table")
+            self.assertEqual(conn.info.get('query_started'), [])
+
+class AsyncAPITestCase(unittest.IsolatedAsyncioTestCase):
+    # The async engine opens its own connections, so the database is a file.
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+        class FileConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.db_path
+            SECRET_KEY = 'test'
+            RESPONSE_CACHE_BACKEND = 'none'
+
+        self.app = create_app(FileConfig)
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+        db.create_all()
+        user = User(username="asyncreader", email="async@example.com", password="x")
+        friend = User(username="asyncfriend", email="friend@example.com", password="x")
+        db.session.add_all([user, friend])
+        db.session.commit()
+        self.user_id = user.id
+        for i in range(3):
+            add_book_to_library(self.user_id, make_book_data(i, "completed" if i else "wishlist"))
+        share_book_with_user(self.user_id, get_user_library_books(self.user_id)[0].id, "asyncfriend", "wishlist")
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user_id)
+        self.cookie = f"session={self.client.get_cookie('session').value}"
+        self.flask_calls = []
+        for endpoint, view in list(self.app.view_functions.items()):
+            self.app.view_functions[endpoint] = self.counted(endpoint, view)
+        self.api = AsyncAPI(self.app)
+
+    def counted(self, endpoint, view):
+        def wrapper(*args, **kwargs):
+            self.flask_calls.append(endpoint)
+            return view(*args, **kwargs)
+        return wrapper
+
+    async def asyncTearDown(self):
+        await self.api.close()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app_ctx.pop()
+        os.remove(self.db_path)
+
+    async def request(self, url, headers=None, cookie=True):
+        path, _, query = url.partition('?')
+        headers = dict(headers or {}, **({'Cookie': self.cookie} if cookie else {}))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await self.api(scope, receive, send)
+        start = messages[0]
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+    async def test_json_reads_match_flask_without_calling_it(self):
+        urls = [
+            '/my_books', '/community_feed', '/stats/summary', '/stats/genres', '/stats/statuses',
+            '/stats/authors', '/stats/books_over_time?range=weeks', '/stats/pages_over_time?range=years',
+            '/stats/all?range=months',
+        ]
+        for url in urls:
+            status, headers, body = await self.request(url)
+            self.assertEqual(status, 200, url)
+            self.assertEqual(headers['content-type'], 'application/json')
+            self.assertEqual(self.flask_calls, [], url)
+            self.assertEqual(json.loads(body), self.client.get(url).get_json(), url)
+            self.flask_calls.clear()
+
+    async def test_other_requests_fall_back_to_flask(self):
+        status, headers, body = await self.request('/library')
+        self.assertEqual((status, self.flask_calls), (200, ['main.library']))
+        self.assertIn(b'<html', body)
+        status, _, body = await self.request('/community_feed?page=1')
+        self.assertEqual(json.loads(body)['page'], 1)
+        # Without a session cookie Flask-Login decides (redirect or remember-me).
+        await self.request('/my_books', cookie=False)
+        self.assertEqual(self.flask_calls, ['main.library', 'main.community_feed', 'main.my_books'])
+
+    async def test_cookie_of_deleted_user_is_not_honoured(self):
+        ghost = User(username="asyncghost", email="ghost@example.com", password="x")
+        db.session.add(ghost)
+        db.session.commit()
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(ghost.id)
+        cookie = f"session={client.get_cookie('session').value}"
+        self.assertEqual((await self.request('/my_books', {'Cookie': cookie}, cookie=False))[0], 200)
+        self.assertEqual(self.flask_calls, [])
+        db.session.delete(ghost)
+        db.session.commit()
+        status, headers, _ = await self.request('/my_books', {'Cookie': cookie}, cookie=False)
+        self.assertEqual((status, self.flask_calls), (302, ['main.my_books']))
+        self.assertIn('/login', headers['location'])
+
+    async def test_missing_rollup_is_rebuilt_by_flask(self):
+        expected = self.client.get('/stats/summary').get_json()
+        UserStats.query.delete()
+        db.session.commit()
+        self.flask_calls.clear()
+        status, _, body = await self.request('/stats/summary')
+        self.assertEqual((status, json.loads(body)), (200, expected))
+        self.assertEqual(self.flask_calls, ['main.stats_summary'])
+        await self.request('/stats/summary')
+        self.assertEqual(self.flask_calls, ['main.stats_summary'])
+
+    async def test_stats_all_etag(self):
+        status, headers, _ = await self.request('/stats/all')
+        status, again, body = await self.request('/stats/all', {'If-None-Match': headers['etag']})
+        self.assertEqual((status, body), (304, b''))
+        self.assertEqual(again['etag'], headers['etag'])
+        self.assertEqual(headers['etag'], self.client.get('/stats/all').headers['ETag'])
+
+    async def test_shares_the_response_cache_with_flask(self):
+        response_cache.use(LRUCache())
+        first = await self.request('/my_books')
+        self.assertEqual(self.client.get('/my_books').data, first[2])
+        self.assertEqual(response_cache.metrics()['hits'], 1)
+        add_book_to_library(self.user_id, make_book_data(9))
+        self.assertEqual(len(json.loads((await self.request('/my_books'))[2])), 4)
+
+    async def test_books_proxy(self):
+        google_books.use_client(FakeBooksClient())
+        first = await self.request('/api/books/search?q=dune', cookie=False)
+        second = await self.request('/api/books/search?q=dune', cookie=False)
+        self.assertEqual((first[1]['x-cache'], second[1]['x-cache']), ('MISS', 'HIT'))
+        self.assertEqual((await self.request('/api/books/search?q=', cookie=False))[0], 400)
+        google_books.use_client(FakeBooksClient(status=None))
+        self.assertEqual((await self.request('/api/books/zzz', cookie=False))[0], 502)
+        self.assertEqual(self.flask_calls, [])
+
+    async def test_concurrent_requests(self):
+        results = await asyncio.gather(*(self.request(url) for url in ['/my_books', '/stats/all', '/community_feed'] * 10))
+        self.assertEqual({status for status, _, _ in results}, {200})
+        self.assertEqual(self.flask_calls, [])
+
+class MigrationTestCase(unittest.TestCase):
+    MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+        class FileConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.db_path
+
+        self.app = create_app(FileConfig)
+        self.app_ctx = self.app.app_context()
+        self.app_ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app_ctx.pop()
+        os.remove(self.db_path)
+
+    def upgrade(self, revision):
+        from flask_migrate import upgrade
+        upgrade(self.MIGRATIONS, revision)
+
+    def test_unique_user_book_merges_duplicates(self):
+        self.upgrade('54c1367dc6a6')
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("INSERT INTO user (id, username, email, password) VALUES (1, 'dupe', 'd@example.com', 'x')")
+            connection.exec_driver_sql("INSERT INTO book (id, google_id, title, author) VALUES (1, 'g1', 'Dune', 'Frank Herbert')")
+            connection.exec_driver_sql("INSERT INTO book (id, google_id, title, author) VALUES (2, 'g2', 'Emma', 'Jane Austen')")
+            for user_book_id, book_id, status, date_added, date_completed in (
+                (1, 1, 'completed', '2023-01-01 00:00:00', '2023-02-01 00:00:00'),
+                (2, 1, 'currently_reading', '2023-03-01 00:00:00', None),
+                (3, 1, 'completed', '2023-04-01 00:00:00', None),
+                (4, 2, 'wishlist', '2023-01-05 00:00:00', None),
+            ):
+                connection.exec_driver_sql(
+                    "INSERT INTO user_book (id, user_id, book_id, status, date_added, date_completed) VALUES (?, 1, ?, ?, ?, ?)",
+                    (user_book_id, book_id, status, date_added, date_completed)
+                )
+        self.upgrade('8d41c2a7e5b9')
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(
+                "SELECT id, book_id, status, date_added, date_completed FROM user_book ORDER BY id"
+            ).all()
+        self.assertEqual([tuple(row) for row in rows], [
+            (3, 1, 'completed', '2023-01-01 00:00:00.000000', '2023-02-01 00:00:00.000000'),
+            (4, 2, 'wishlist', '2023-01-05 00:00:00', None),
+        ])
+
 if __name__ == '__main__':
     unittest.main()